@@ -1,5 +1,4 @@
 import streamlit as st
-from src.microspotreader import *
 from src.streamlit.DataStorage import DataStorage
 from src.streamlit.general import *
 
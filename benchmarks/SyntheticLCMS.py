@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from src.microspotreader.Settings import Settings
+
+
+class SyntheticLCMS:
+    """Deterministic generator of LC-MS features of arbitrary number, as feature tables with chromatograms or as
+    .mzML files.
+
+    A configurable number of features elutes close to each activity peak of a SyntheticPlate, the remaining features
+    are distributed randomly over the entire run.
+    """
+
+    settings: Settings = Settings(
+        {
+            "features": {
+                "number": 1000,
+                "features_per_peak": 5,
+                "peak_rt_deviation_s": 1.5,
+                "minimum_fwhm_s": 3.0,
+                "maximum_fwhm_s": 12.0,
+                "minimum_mz": 100.0,
+                "maximum_mz": 1000.0,
+                "minimum_intensity": 1e5,
+                "maximum_intensity": 1e8,
+            },
+            "run": {
+                "start_time_s": 0.0,
+                "end_time_s": 660.0,
+                "scan_interval_s": 0.5,
+            },
+            "spectra": {
+                "isotopes": 3,
+                "noise_peaks": 50,
+                "noise_intensity": 1e3,
+            },
+        }
+    )
+
+    def __init__(self, peak_retention_times: list[float] = None, seed: int = 0):
+        """
+        Args:
+            peak_retention_times (list[float], optional): retention times of activity peaks, e.g. from SyntheticPlate.peak_retention_times. Defaults to None.
+            seed (int, optional): seed of the random number generator, the same seed and settings always create the same features. Defaults to 0.
+        """
+        self.peak_retention_times = (
+            [] if peak_retention_times is None else list(peak_retention_times)
+        )
+        self.seed = seed
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    def feature_table(self) -> pd.DataFrame:
+        """Ground truth of all features.
+
+        Returns:
+            pd.DataFrame: feature table indexed by feature id as strings, with the columns used by the ActivityAnnotator.
+        """
+        features = self.settings["features"]
+        run = self.settings["run"]
+        rng = np.random.default_rng([self.seed, 0])
+
+        correlated_rts = [
+            rt + offset
+            for rt in self.peak_retention_times
+            for offset in rng.normal(
+                0, features["peak_rt_deviation_s"], features["features_per_peak"]
+            )
+        ][: features["number"]]
+        number = features["number"]
+        retention_times = np.concatenate(
+            [
+                correlated_rts,
+                rng.uniform(
+                    run["start_time_s"] + 30,
+                    run["end_time_s"] - 30,
+                    number - len(correlated_rts),
+                ),
+            ]
+        )
+
+        fwhm = rng.uniform(
+            features["minimum_fwhm_s"], features["maximum_fwhm_s"], number
+        )
+        width = 1.5 * fwhm
+        return pd.DataFrame(
+            {
+                "RT": retention_times,
+                "mz": rng.uniform(
+                    features["minimum_mz"], features["maximum_mz"], number
+                ),
+                "intensity": np.exp(
+                    rng.uniform(
+                        np.log(features["minimum_intensity"]),
+                        np.log(features["maximum_intensity"]),
+                        number,
+                    )
+                ),
+                "charge": 1,
+                "fwhm": fwhm,
+                "RTstart": retention_times - width,
+                "RTend": retention_times + width,
+                "correlated": np.arange(number) < len(correlated_rts),
+            },
+            index=pd.Index([str(1000 + i) for i in range(number)], name="id"),
+        )
+
+    def feature_chromatograms(
+        self, feature_table: pd.DataFrame = None
+    ) -> dict[str, pd.DataFrame]:
+        """Chromatograms of all features sampled at the scan interval between their start and end.
+
+        Args:
+            feature_table (pd.DataFrame, optional): ground truth of the features, if None self.feature_table() is used. Defaults to None.
+
+        Returns:
+            dict[str, pd.DataFrame]: chromatogram of each feature with the columns "rt" and "int", keys are the feature ids.
+        """
+        if feature_table is None:
+            feature_table = self.feature_table()
+
+        interval = self.settings["run"]["scan_interval_s"]
+        chromatograms = {}
+        for feature in feature_table.itertuples():
+            rts = np.arange(
+                np.ceil(feature.RTstart / interval) * interval, feature.RTend, interval
+            )
+            sigma = feature.fwhm / 2.355
+            chromatograms[feature.Index] = pd.DataFrame(
+                {
+                    "rt": rts,
+                    "int": feature.intensity
+                    * np.exp(-0.5 * ((rts - feature.RT) / sigma) ** 2),
+                }
+            )
+        return chromatograms
+
+    def write_mzml(self, path: str, feature_table: pd.DataFrame = None):
+        """Writes MS1 spectra of all features with isotope patterns and random noise peaks to an .mzML file.
+
+        Args:
+            path (str): path of the .mzML file
+            feature_table (pd.DataFrame, optional): ground truth of the features, if None self.feature_table() is used. Defaults to None.
+        """
+        import pyopenms as oms
+
+        if feature_table is None:
+            feature_table = self.feature_table()
+
+        run = self.settings["run"]
+        spectra = self.settings["spectra"]
+        rng = np.random.default_rng([self.seed, 1])
+
+        isotopes = np.arange(spectra["isotopes"])
+        isotope_mz = feature_table.mz.to_numpy()[:, None] + isotopes * 1.00336
+        isotope_abundance = 0.4**isotopes
+        sigma = feature_table.fwhm.to_numpy() / 2.355
+
+        # Features sorted by start time, so that each scan only looks at features eluting at its retention time.
+        order = np.argsort(feature_table.RTstart.to_numpy())
+        starts = feature_table.RTstart.to_numpy()[order]
+        max_width = (feature_table.RTend - feature_table.RTstart).max()
+
+        exp = oms.MSExperiment()
+        for rt in np.arange(
+            run["start_time_s"], run["end_time_s"], run["scan_interval_s"]
+        ):
+            candidates = order[
+                np.searchsorted(starts, rt - max_width) : np.searchsorted(starts, rt)
+            ]
+            candidates = candidates[feature_table.RTend.to_numpy()[candidates] >= rt]
+
+            elution = feature_table.intensity.to_numpy()[candidates] * np.exp(
+                -0.5
+                * ((rt - feature_table.RT.to_numpy()[candidates]) / sigma[candidates])
+                ** 2
+            )
+            mz = np.concatenate(
+                [
+                    isotope_mz[candidates].ravel(),
+                    rng.uniform(
+                        self.settings["features"]["minimum_mz"],
+                        self.settings["features"]["maximum_mz"] + 5,
+                        spectra["noise_peaks"],
+                    ),
+                ]
+            )
+            intensity = np.concatenate(
+                [
+                    (elution[:, None] * isotope_abundance).ravel(),
+                    rng.exponential(spectra["noise_intensity"], spectra["noise_peaks"]),
+                ]
+            )
+            sort = np.argsort(mz)
+
+            spectrum = oms.MSSpectrum()
+            spectrum.setRT(float(rt))
+            spectrum.setMSLevel(1)
+            spectrum.set_peaks((mz[sort], intensity[sort].astype(np.float32)))
+            exp.addSpectrum(spectrum)
+
+        oms.MzMLFile().store(str(path), exp)
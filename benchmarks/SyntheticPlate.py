@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from src.microspotreader.Settings import Settings
+
+
+class SyntheticPlate:
+    """Deterministic generator of microspot plate images and matching activity tables of arbitrary size.
+
+    Images look like prepared images of the ImageLoader: each spot is a dark ring around a disk whose brightness is
+    given by its activity, active spots can be surrounded by a bright halo. The activity along the spotting order
+    consists of gaussian peaks on a noisy baseline.
+    """
+
+    settings: Settings = Settings(
+        {
+            "layout": {
+                "rows": 8,
+                "columns": 12,
+                "pitch_px": 100,
+                "spot_radius_px": 24,
+                "radius_jitter": 0.04,
+                "position_jitter_px": 1.0,
+                "tilt_deg": 0.0,
+                "margin_px": 60,
+            },
+            "appearance": {
+                "background": 0.43,
+                "ring_width_px": 8,
+                "ring_contrast": 0.06,
+                "spot_intensity": 0.44,
+                "activity_contrast": 0.3,
+                "noise": 0.01,
+                "missing_fraction": 0.0,
+            },
+            "halos": {
+                "halo_fraction": 0.0,
+                "minimum_radius_px": 50,
+                "maximum_radius_px": 90,
+                "contrast": 0.08,
+            },
+            "activity": {
+                "spots_per_peak": 32,
+                "peak_width_spots": 1.0,
+                "baseline_noise": 0.01,
+                "start_time_s": 60.0,
+                "end_time_s": 600.0,
+            },
+        }
+    )
+
+    def __init__(self, seed: int = 0) -> None:
+        """
+        Args:
+            seed (int, optional): seed of the random number generator, the same seed and settings always create the same plate. Defaults to 0.
+        """
+        self.seed = seed
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    @property
+    def spot_nr(self) -> int:
+        return self.settings["layout"]["rows"] * self.settings["layout"]["columns"]
+
+    @property
+    def image_shape(self) -> tuple[int, int]:
+        layout = self.settings["layout"]
+        # Extra space for the corners of tilted grids.
+        tilt = np.abs(np.deg2rad(layout["tilt_deg"]))
+        height = (layout["rows"] - 1) * layout["pitch_px"]
+        width = (layout["columns"] - 1) * layout["pitch_px"]
+        return (
+            int(height * np.cos(tilt) + width * np.sin(tilt) + 2 * layout["margin_px"]),
+            int(width * np.cos(tilt) + height * np.sin(tilt) + 2 * layout["margin_px"]),
+        )
+
+    def activity(self) -> np.array:
+        """Activity of each spot in spotting order (row by row), normalized to a maximum of 1.
+
+        Returns:
+            np.array: activity of each spot.
+        """
+        settings = self.settings["activity"]
+        rng = np.random.default_rng([self.seed, 1])
+
+        position = np.arange(self.spot_nr)
+        activity = np.abs(rng.normal(0, settings["baseline_noise"], self.spot_nr))
+        for center in self.peak_positions():
+            height = rng.uniform(0.3, 1.0)
+            activity += height * np.exp(
+                -0.5 * ((position - center) / settings["peak_width_spots"]) ** 2
+            )
+
+        return activity / activity.max()
+
+    def peak_positions(self) -> np.array:
+        """Positions of the activity peaks in spotting order, evenly distributed over the plate with random offsets.
+        The number of peaks grows with the number of spots."""
+        settings = self.settings["activity"]
+        rng = np.random.default_rng([self.seed, 2])
+        peak_nr = max(1, round(self.spot_nr / settings["spots_per_peak"]))
+        edges = np.linspace(0, self.spot_nr, peak_nr + 1)
+        return np.array(
+            [
+                rng.uniform(start + 0.25 * (end - start), end - 0.25 * (end - start))
+                for start, end in zip(edges[:-1], edges[1:])
+            ]
+        )
+
+    def retention_times(self) -> np.array:
+        settings = self.settings["activity"]
+        return np.linspace(
+            settings["start_time_s"], settings["end_time_s"], num=self.spot_nr
+        )
+
+    def peak_retention_times(self) -> np.array:
+        """Retention times of the activity peaks, used to place correlated features in synthetic LC-MS data."""
+        return np.interp(
+            self.peak_positions(), np.arange(self.spot_nr), self.retention_times()
+        )
+
+    def spot_table(self) -> pd.DataFrame:
+        """Ground truth of all spots of the plate.
+
+        Returns:
+            pd.DataFrame: row, column, position, radius, halo radius, activity and retention time of each spot, including missing spots.
+        """
+        layout = self.settings["layout"]
+        halos = self.settings["halos"]
+        assert layout["rows"] <= 26, "Spots only have row names for up to 26 rows."
+        rng = np.random.default_rng([self.seed, 0])
+
+        rows, columns = np.meshgrid(
+            np.arange(1, layout["rows"] + 1),
+            np.arange(1, layout["columns"] + 1),
+            indexing="ij",
+        )
+        rows, columns = rows.ravel(), columns.ravel()
+
+        # Grid positions rotated around the center of the image.
+        x = (columns - 1 - (layout["columns"] - 1) / 2) * layout["pitch_px"]
+        y = (rows - 1 - (layout["rows"] - 1) / 2) * layout["pitch_px"]
+        angle = np.deg2rad(layout["tilt_deg"])
+        height, width = self.image_shape
+        x_rot = x * np.cos(angle) - y * np.sin(angle) + width / 2
+        y_rot = x * np.sin(angle) + y * np.cos(angle) + height / 2
+
+        activity = self.activity()
+        has_halo = activity >= np.quantile(activity, 1 - halos["halo_fraction"])
+        has_halo &= halos["halo_fraction"] > 0
+        halo_radius = halos["minimum_radius_px"] + activity * (
+            halos["maximum_radius_px"] - halos["minimum_radius_px"]
+        )
+
+        return pd.DataFrame(
+            {
+                "row": rows,
+                "row_name": [chr(ord("A") + row - 1) for row in rows],
+                "column": columns,
+                "x_coord": x_rot
+                + rng.normal(0, layout["position_jitter_px"], self.spot_nr),
+                "y_coord": y_rot
+                + rng.normal(0, layout["position_jitter_px"], self.spot_nr),
+                "radius": layout["spot_radius_px"]
+                * (1 + rng.normal(0, layout["radius_jitter"], self.spot_nr)),
+                "halo_radius": np.where(has_halo, halo_radius, np.nan),
+                "present": rng.uniform(size=self.spot_nr)
+                >= self.settings["appearance"]["missing_fraction"],
+                "activity": activity,
+                "RT": self.retention_times(),
+            }
+        )
+
+    def render_image(self, spot_table: pd.DataFrame = None) -> np.array:
+        """Renders the image of the plate.
+
+        Args:
+            spot_table (pd.DataFrame, optional): ground truth of the spots, if None self.spot_table() is used. Defaults to None.
+
+        Returns:
+            np.array: grayscale image with values between 0 and 1.
+        """
+        appearance = self.settings["appearance"]
+        halos = self.settings["halos"]
+        if spot_table is None:
+            spot_table = self.spot_table()
+
+        image = np.full(self.image_shape, appearance["background"])
+
+        # Each spot is only drawn into a window around its center, rendering therefore scales with the spot number.
+        for spot in spot_table.loc[spot_table.present].itertuples():
+            outer_radius = max(
+                spot.radius + appearance["ring_width_px"],
+                0 if np.isnan(spot.halo_radius) else spot.halo_radius,
+            )
+            window = (
+                slice(
+                    max(0, int(spot.y_coord - outer_radius - 2)),
+                    min(image.shape[0], int(spot.y_coord + outer_radius + 3)),
+                ),
+                slice(
+                    max(0, int(spot.x_coord - outer_radius - 2)),
+                    min(image.shape[1], int(spot.x_coord + outer_radius + 3)),
+                ),
+            )
+            yy, xx = np.mgrid[window]
+            distance = np.hypot(xx - spot.x_coord, yy - spot.y_coord)
+
+            if not np.isnan(spot.halo_radius):
+                image[window] += halos["contrast"] * np.clip(
+                    spot.halo_radius - distance, 0, 1
+                )
+
+            inside = distance <= spot.radius
+            ring = (distance > spot.radius) & (
+                distance <= spot.radius + appearance["ring_width_px"]
+            )
+            image[window][inside] = (
+                appearance["spot_intensity"]
+                + appearance["activity_contrast"] * spot.activity
+            )
+            image[window][ring] = appearance["background"] - appearance["ring_contrast"]
+
+        rng = np.random.default_rng([self.seed, 3])
+        image += rng.normal(0, appearance["noise"], image.shape)
+        return np.clip(image, 0, 1)
+
+    def activity_table(self, spot_table: pd.DataFrame = None) -> pd.DataFrame:
+        """Activity table of the plate in the format of the data preparation page.
+
+        Args:
+            spot_table (pd.DataFrame, optional): ground truth of the spots, if None self.spot_table() is used. Defaults to None.
+
+        Returns:
+            pd.DataFrame: row, column, spot intensity and retention time of each spot.
+        """
+        if spot_table is None:
+            spot_table = self.spot_table()
+
+        return pd.DataFrame(
+            {
+                "row": spot_table.row,
+                "row_name": spot_table.row_name,
+                "column": spot_table.column,
+                "spot_intensity": spot_table.activity,
+                "RT": spot_table.RT,
+            }
+        )
+
+    def detector_settings(self) -> dict:
+        """Settings of the ImageAnalyzer matching the layout of the plate. Length scales of the default settings fit a
+        pitch of 100 px and are scaled to the pitch of the plate.
+
+        Returns:
+            dict: settings for ImageAnalyzer.change_settings_dict.
+        """
+        layout = self.settings["layout"]
+        halos = self.settings["halos"]
+        radius = layout["spot_radius_px"]
+        pitch = layout["pitch_px"]
+        scale = pitch / 100
+        return {
+            "spot_detector": {
+                "edge_detection": {"sigma": max(2, round(10 * scale))},
+                "circle_detection": {
+                    "min_distance_px_x": int(0.7 * pitch),
+                    "min_distance_px_y": int(0.7 * pitch),
+                    "smallest_radius_px": int(0.8 * radius),
+                    "largest_radius_px": int(np.ceil(1.2 * radius)),
+                },
+            },
+            "grid_detector": {
+                "line_detection": {"minimum_distance_px": int(0.8 * pitch)}
+            },
+            "spot_corrector": {
+                "from_grid": {"distance_threshold_px": max(3, round(10 * scale))}
+            },
+            "halo_detector": {
+                "preprocessing": {
+                    "disk_radius_opening": max(1, round(5 * scale)),
+                    "minimum_object_size_px": round(800 * scale**2),
+                    "disk_radius_dilation": max(1, round(10 * scale)),
+                },
+                "circle_detection": {
+                    "min_distance_px_x": int(0.7 * pitch),
+                    "min_distance_px_y": int(0.7 * pitch),
+                    "smallest_radius_px": int(0.8 * halos["minimum_radius_px"]),
+                    "largest_radius_px": int(np.ceil(1.1 * halos["maximum_radius_px"])),
+                },
+                "halo_assignment": {"distance_threshold_px": max(3, round(15 * scale))},
+            },
+        }
@@ -0,0 +1,358 @@
+"""Benchmark suite of the microspotreader pipeline stages.
+
+Run from the main folder of the repository:
+
+    python -m benchmarks.benchmark                   # compare against benchmarks/baseline.json
+    python -m benchmarks.benchmark --save-baseline   # store the current results as the new baseline
+
+The comparison exits with status 1 if a stage got slower or allocates more memory than the tolerances allow, or if a
+stage of the baseline is missing in the current run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyopenms as oms
+from scipy.ndimage import gaussian_filter1d
+
+from benchmarks.SyntheticLCMS import SyntheticLCMS
+from src.microspotreader import (
+    ActivityAnnotator,
+    ActivityPeakDetector,
+    FeatureFinder,
+    ImageAnalyzer,
+    ImageLoader,
+    SpotList,
+    add_retention_time,
+    baseline_correction,
+    profiler,
+)
+
+ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE_FILES = ROOT / "example_files"
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# Spot indices of the example images as given in their filenames.
+EXAMPLE_IMAGES = {
+    "part1": ("part1_a1-l11.tif", 132, 1, 1),
+    "part2": ("part2_a12-l22.tif", 132, 1, 12),
+}
+
+
+def analyze_image(image_name: str, halo_detection: bool = True) -> SpotList:
+    filename, spot_nr, row_idx_start, col_idx_start = EXAMPLE_IMAGES[image_name]
+
+    img_loader = ImageLoader()
+    img_loader.set(invert_image=True)
+    image = img_loader.prepare_image(EXAMPLE_FILES / filename)
+
+    analyzer = ImageAnalyzer(image)
+    analyzer.change_settings_dict({"halo_detection_toggle": halo_detection})
+    return analyzer.run(
+        spot_nr=spot_nr, row_idx_start=row_idx_start, col_idx_start=col_idx_start
+    )
+
+
+def load_activity_table() -> pd.DataFrame:
+    return pd.read_csv(EXAMPLE_FILES / "activity_table.csv", encoding="utf-8-sig")
+
+
+def benchmark_image_analysis_part1():
+    analyze_image("part1")
+
+
+def benchmark_image_analysis_part2():
+    analyze_image("part2")
+
+
+def benchmark_data_preparation(spot_lists: list[SpotList]):
+    spot_list = SpotList().from_list([spot_list.copy() for spot_list in spot_lists])
+    with profiler.span("SpotList.sort"):
+        spot_list.sort(serpentine=True)
+
+    df = spot_list.to_df()
+    add_retention_time(df, 0, 520)
+    _, df.spot_intensity = baseline_correction(
+        df.spot_intensity, conv_lvl=0.001, window_lvl=100, poly_lvl=1
+    )
+    with profiler.span("gaussian_filter1d"):
+        gaussian_filter1d(df.spot_intensity.to_numpy(), sigma=1)
+
+
+def benchmark_activity_peak_detection(activity_table: pd.DataFrame):
+    ActivityPeakDetector(activity_table).run()
+
+
+def benchmark_activity_annotation(
+    activity_table: pd.DataFrame, features: tuple, mode: str = "pairwise"
+):
+    peak_list = ActivityPeakDetector(activity_table).run()
+    feature_table, feature_chroms = features
+    annotator = ActivityAnnotator(
+        feature_table, feature_chroms, peak_list, activity_table
+    )
+    annotator.change_settings_dict(
+        {
+            "rt_correlation": {"window_s": 5, "bias_s": 0},
+            "shape_correlation": {"mode": mode},
+        }
+    )
+    annotator.run()
+
+
+def benchmark_feature_finding(mzml_path: Path):
+    feature_finder = FeatureFinder(oms.MSExperiment(), str(mzml_path))
+    # Cached results of the warm-up run would otherwise be measured instead of feature finding.
+    feature_finder.change_settings_dict({"result_cache": {"size": 0}})
+    feature_finder.run()
+
+
+def get_benchmarks() -> dict:
+    """Prepares the inputs of all benchmarks.
+
+    Returns:
+        dict: name of each benchmark and a function without arguments running it.
+    """
+    spot_lists = [analyze_image("part1", False), analyze_image("part2", False)]
+    activity_table = load_activity_table()
+
+    # Synthetic features with 5 features close to each activity peak of the example activity table.
+    lcms = SyntheticLCMS(
+        [peak.retention_time for peak in ActivityPeakDetector(activity_table).run()]
+    )
+    feature_table = lcms.feature_table()
+    features = feature_table, lcms.feature_chromatograms(feature_table)
+
+    mzml_path = Path(tempfile.mkdtemp()) / "synthetic.mzML"
+    lcms.write_mzml(mzml_path, feature_table)
+
+    return {
+        "image_analysis_part1": benchmark_image_analysis_part1,
+        "image_analysis_part2": benchmark_image_analysis_part2,
+        "data_preparation": lambda: benchmark_data_preparation(spot_lists),
+        "activity_peak_detection": lambda: benchmark_activity_peak_detection(
+            activity_table
+        ),
+        "activity_annotation": lambda: benchmark_activity_annotation(
+            activity_table, features
+        ),
+        "activity_annotation_resampled": lambda: benchmark_activity_annotation(
+            activity_table, features, "resampled"
+        ),
+        "feature_finding": lambda: benchmark_feature_finding(mzml_path),
+    }
+
+
+def measure(function, repeats: int) -> dict:
+    """Measures all stages of a benchmark. Timings are the minimum of all repeats after a warm-up run, measured without
+    memory tracing. Peak allocations are measured in an additional run with memory tracing.
+
+    Args:
+        function (callable): benchmark to run
+        repeats (int): number of timed runs
+
+    Returns:
+        dict: wall time, cpu time, peak allocation and number of calls of each stage and of the entire benchmark.
+    """
+    # Untimed warm-up run, excludes one-time costs like imports and compilation of numba functions.
+    function()
+
+    timings = []
+    for _ in range(repeats):
+        with profiler.record(trace_memory=False) as spans, profiler.span("total"):
+            function()
+        timings.append(profiler.summarize(spans))
+
+    with profiler.record(trace_memory=True) as spans, profiler.span("total"):
+        function()
+    memory = profiler.summarize(spans)
+
+    timings = pd.concat(timings).groupby(level=0)
+    results = pd.DataFrame(
+        {
+            "wall_time_s": timings["wall_time_s"].min(),
+            "cpu_time_s": timings["cpu_time_s"].min(),
+            "calls": timings["calls"].max(),
+            "peak_alloc_bytes": memory["peak_alloc_bytes"],
+        }
+    )
+    return results.sort_values("wall_time_s", ascending=False).to_dict(orient="index")
+
+
+def run_benchmarks(repeats: int = 3, selection: list[str] = None) -> dict:
+    benchmarks = get_benchmarks()
+    if selection:
+        benchmarks = {name: benchmarks[name] for name in selection}
+
+    results = {}
+    for name, function in benchmarks.items():
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = measure(function, repeats)
+
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%d"),
+        },
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.1,
+    minimum_time_s: float = 0.02,
+) -> tuple[pd.DataFrame, bool]:
+    """Compares benchmark results to a baseline.
+
+    Args:
+        baseline (dict): stored baseline results
+        current (dict): current results
+        time_tolerance (float, optional): allowed relative increase of the wall time. Defaults to 0.25.
+        memory_tolerance (float, optional): allowed relative increase of the peak allocation. Defaults to 0.1.
+        minimum_time_s (float, optional): minimum absolute change of the wall time reported as a regression or improvement, smaller differences are dominated by noise. Defaults to 0.02.
+
+    Returns:
+        tuple[pd.DataFrame, bool]: comparison of all stages and True if any stage regressed or a stage of the baseline
+        is missing in the current results.
+    """
+    rows = []
+    for benchmark, stages in current["results"].items():
+        baseline_stages = baseline["results"].get(benchmark, {})
+        for stage, result in stages.items():
+            reference = baseline_stages.get(stage)
+            row = {
+                "benchmark": benchmark,
+                "stage": stage,
+                "wall_time_s": result["wall_time_s"],
+                "baseline_wall_time_s": np.nan,
+                "time_ratio": np.nan,
+                "peak_alloc_MB": result["peak_alloc_bytes"] / 1e6,
+                "baseline_peak_alloc_MB": np.nan,
+                "memory_ratio": np.nan,
+                "status": "new",
+            }
+            if reference is not None:
+                row["baseline_wall_time_s"] = reference["wall_time_s"]
+                row["baseline_peak_alloc_MB"] = reference["peak_alloc_bytes"] / 1e6
+                row["time_ratio"] = result["wall_time_s"] / max(
+                    reference["wall_time_s"], 1e-9
+                )
+                row["memory_ratio"] = result["peak_alloc_bytes"] / max(
+                    reference["peak_alloc_bytes"], 1
+                )
+
+                slower = (
+                    row["time_ratio"] > 1 + time_tolerance
+                    and result["wall_time_s"] - reference["wall_time_s"]
+                    > minimum_time_s
+                )
+                larger = row["memory_ratio"] > 1 + memory_tolerance and (
+                    result["peak_alloc_bytes"] - reference["peak_alloc_bytes"] > 1e6
+                )
+                faster = (
+                    row["time_ratio"] < 1 - time_tolerance
+                    and reference["wall_time_s"] - result["wall_time_s"]
+                    > minimum_time_s
+                )
+                row["status"] = (
+                    "REGRESSION" if slower or larger else "faster" if faster else "ok"
+                )
+            rows.append(row)
+
+    # Stages that are no longer measured, e.g. because a stage was renamed or its span is not recorded anymore.
+    for benchmark, stages in baseline["results"].items():
+        current_stages = current["results"].get(benchmark, {})
+        for stage, reference in stages.items():
+            if stage not in current_stages:
+                rows.append(
+                    {
+                        "benchmark": benchmark,
+                        "stage": stage,
+                        "wall_time_s": np.nan,
+                        "baseline_wall_time_s": reference["wall_time_s"],
+                        "time_ratio": np.nan,
+                        "peak_alloc_MB": np.nan,
+                        "baseline_peak_alloc_MB": reference["peak_alloc_bytes"] / 1e6,
+                        "memory_ratio": np.nan,
+                        "status": "missing",
+                    }
+                )
+
+    report = pd.DataFrame(rows)
+    return report, bool(report["status"].isin(["REGRESSION", "missing"]).any())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages.")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing.",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file.")
+    parser.add_argument("--output", help="File to store the results in.")
+    parser.add_argument("--report", help="File to store the comparison report in.")
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Timed runs per benchmark."
+    )
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.1)
+    parser.add_argument("--only", nargs="*", help="Names of the benchmarks to run.")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.repeats, args.only)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(current, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    if args.only:
+        # Benchmarks that were not selected are not missing.
+        baseline["results"] = {
+            name: stages
+            for name, stages in baseline["results"].items()
+            if name in args.only
+        }
+
+    report, regressed = compare(
+        baseline, current, args.time_tolerance, args.memory_tolerance
+    )
+    report_text = report.to_string(index=False, float_format="{:.3f}".format)
+    print(report_text)
+
+    if args.report is not None:
+        with open(args.report, "w") as file:
+            file.write(report_text)
+
+    if regressed:
+        print("\nPerformance regressions or missing stages detected!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
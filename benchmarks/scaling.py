@@ -0,0 +1,254 @@
+"""Scaling benchmarks of the pipeline stages on synthetic plates and LC-MS data of growing size.
+
+Run from the main folder of the repository:
+
+    python -m benchmarks.scaling            # all stages
+    python -m benchmarks.scaling --quick    # smaller sizes, e.g. for continuous integration
+
+The wall time of each stage is measured for each size and a power law time ~ size^exponent is fitted. The command
+exits with status 1 if the exponent of any stage exceeds its target in SCALING_TARGETS.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.SyntheticLCMS import SyntheticLCMS
+from benchmarks.SyntheticPlate import SyntheticPlate
+from src.microspotreader import (
+    ActivityAnnotator,
+    ActivityPeakDetector,
+    ImageAnalyzer,
+    profiler,
+)
+
+# Maximum exponent of the power law fitted to the wall times of each stage. Stages of the image analysis and the
+# ActivityPeakDetector are measured against the number of spots, the ActivityAnnotator against the number of features.
+SCALING_TARGETS = {
+    "SpotDetector": {"size": "spots", "max_exponent": 1.2},
+    "GridDetector": {"size": "spots", "max_exponent": 1.2},
+    # Compares every spot to every grid intersection.
+    "SpotCorrector": {"size": "spots", "max_exponent": 2.2},
+    # Compares every spot to each row, rows grow with the square root of the spots.
+    "SpotIndexer": {"size": "spots", "max_exponent": 1.7},
+    # Morphological reconstruction of the entire image is slightly superlinear in its area.
+    "HaloDetector": {"size": "spots", "max_exponent": 1.4},
+    "ActivityPeakDetector": {"size": "spots", "max_exponent": 1.2},
+    "ActivityAnnotator": {"size": "features", "max_exponent": 1.2},
+}
+
+# Profiler spans making up each stage.
+STAGE_SPANS = {
+    "SpotDetector": [
+        "SpotDetector.get_image_edges",
+        "SpotDetector.get_hough_transform",
+        "SpotDetector.detect_spots",
+    ],
+    "GridDetector": ["GridDetector.detect_grid"],
+    "SpotCorrector": ["SpotCorrector.gridbased_spotcorrection"],
+    "SpotIndexer": ["SpotIndexer.assign_indexes"],
+    "HaloDetector": ["HaloDetector.perform_halo_detection"],
+    "ActivityPeakDetector": ["ActivityPeakDetector.run"],
+    "ActivityAnnotator": ["ActivityAnnotator.run"],
+}
+
+# Plate layouts (rows, columns) of the image analysis, spots only have row names for up to 26 rows.
+PLATE_SIZES = [(8, 12), (8, 24), (16, 24), (16, 48)]
+QUICK_PLATE_SIZES = [(8, 12), (8, 24), (16, 24)]
+ACTIVITY_SIZES = [(24, 16), (24, 64), (24, 256)]
+FEATURE_NUMBERS = [1000, 4000, 16000]
+QUICK_FEATURE_NUMBERS = [1000, 2000, 4000]
+
+
+def synthetic_plate(rows: int, columns: int, seed: int = 0) -> SyntheticPlate:
+    """Creates a plate with a pitch of 50 px, about half of the example images, to keep large plates fast."""
+    plate = SyntheticPlate(seed)
+    plate.change_settings_dict(
+        {
+            "layout": {
+                "rows": rows,
+                "columns": columns,
+                "pitch_px": 50,
+                "spot_radius_px": 12,
+                "margin_px": 30,
+            },
+            "appearance": {"ring_width_px": 4, "missing_fraction": 0.02},
+            "halos": {
+                "halo_fraction": 0.05,
+                "minimum_radius_px": 25,
+                "maximum_radius_px": 45,
+            },
+        }
+    )
+    return plate
+
+
+def stage_times(spans: list) -> dict:
+    """Sums the wall times of the spans of each stage."""
+    summary = profiler.summarize(spans)
+    return {
+        stage: summary.loc[summary.index.intersection(names), "wall_time_s"].sum()
+        for stage, names in STAGE_SPANS.items()
+        if summary.index.intersection(names).size > 0
+    }
+
+
+def measure(function, repeats: int) -> dict:
+    """Minimum wall time of each stage over all repeats, measured without memory tracing."""
+    timings = []
+    for _ in range(repeats):
+        with profiler.record(trace_memory=False) as spans:
+            function()
+        timings.append(stage_times(spans))
+    return pd.DataFrame(timings).min().to_dict()
+
+
+def measure_image_analysis(sizes: list[tuple[int, int]], repeats: int) -> list[dict]:
+    results = []
+    for rows, columns in sizes:
+        plate = synthetic_plate(rows, columns)
+        image = plate.render_image()
+
+        def analyze():
+            analyzer = ImageAnalyzer(image)
+            analyzer.change_settings_dict(plate.detector_settings())
+            analyzer.change_settings_dict({"halo_detection_toggle": True})
+            analyzer.run(spot_nr=plate.spot_nr)
+
+        print(f"Image analysis of {plate.spot_nr} spots...", file=sys.stderr)
+        for stage, wall_time in measure(analyze, repeats).items():
+            results.append(
+                {"stage": stage, "spots": plate.spot_nr, "wall_time_s": wall_time}
+            )
+    return results
+
+
+def measure_activity_peak_detection(
+    sizes: list[tuple[int, int]], repeats: int
+) -> list[dict]:
+    results = []
+    for rows, columns in sizes:
+        plate = synthetic_plate(rows, columns)
+        activity_table = plate.activity_table()
+
+        print(f"Peak detection of {plate.spot_nr} spots...", file=sys.stderr)
+        for stage, wall_time in measure(
+            ActivityPeakDetector(activity_table).run, repeats
+        ).items():
+            results.append(
+                {"stage": stage, "spots": plate.spot_nr, "wall_time_s": wall_time}
+            )
+    return results
+
+
+def measure_activity_annotation(feature_numbers: list[int], repeats: int) -> list[dict]:
+    plate = synthetic_plate(16, 24)
+    activity_table = plate.activity_table()
+    peak_list = ActivityPeakDetector(activity_table).run()
+    lcms = SyntheticLCMS([peak.retention_time for peak in peak_list])
+
+    results = []
+    for number in feature_numbers:
+        lcms.change_settings_dict({"features": {"number": number}})
+        feature_table = lcms.feature_table()
+        feature_chroms = lcms.feature_chromatograms(feature_table)
+
+        def annotate():
+            annotator = ActivityAnnotator(
+                feature_table,
+                feature_chroms,
+                ActivityPeakDetector(activity_table).run(),
+                activity_table,
+            )
+            annotator.change_settings_dict({"rt_correlation": {"window_s": 5}})
+            annotator.run()
+
+        print(f"Annotation of {number} features...", file=sys.stderr)
+        results.append(
+            {
+                "stage": "ActivityAnnotator",
+                "features": number,
+                "wall_time_s": measure(annotate, repeats)["ActivityAnnotator"],
+            }
+        )
+    return results
+
+
+def fit_exponents(measurements: pd.DataFrame) -> pd.DataFrame:
+    """Fits a power law to the wall times of each stage and compares the exponent to its target.
+
+    Args:
+        measurements (pd.DataFrame): wall time of each stage and size.
+
+    Returns:
+        pd.DataFrame: fitted exponent, target and status of each stage.
+    """
+    rows = []
+    for stage, target in SCALING_TARGETS.items():
+        stage_measurements = measurements.loc[measurements.stage == stage]
+        if len(stage_measurements) < 2:
+            continue
+        sizes = stage_measurements[target["size"]].to_numpy(dtype=float)
+        times = np.maximum(stage_measurements.wall_time_s.to_numpy(), 1e-6)
+        exponent = np.polyfit(np.log(sizes), np.log(times), 1)[0]
+        rows.append(
+            {
+                "stage": stage,
+                "size": target["size"],
+                "smallest": sizes.min(),
+                "largest": sizes.max(),
+                "time_smallest_s": times[sizes.argmin()],
+                "time_largest_s": times[sizes.argmax()],
+                "exponent": exponent,
+                "max_exponent": target["max_exponent"],
+                "status": "ok" if exponent <= target["max_exponent"] else "FAIL",
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how the pipeline stages scale with the size of the data."
+    )
+    parser.add_argument("--quick", action="store_true", help="Use smaller sizes.")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per size.")
+    parser.add_argument("--output", help="File to store the measurements in.")
+    parser.add_argument(
+        "--skip-images", action="store_true", help="Skip the image analysis stages."
+    )
+    args = parser.parse_args()
+
+    # Untimed warm-up run, excludes one-time costs like imports and compilation of numba functions.
+    measure_activity_annotation([100], 1)
+
+    measurements = []
+    if not args.skip_images:
+        measurements += measure_image_analysis(
+            QUICK_PLATE_SIZES if args.quick else PLATE_SIZES, args.repeats
+        )
+    measurements += measure_activity_peak_detection(ACTIVITY_SIZES, args.repeats)
+    measurements += measure_activity_annotation(
+        QUICK_FEATURE_NUMBERS if args.quick else FEATURE_NUMBERS, args.repeats
+    )
+    measurements = pd.DataFrame(measurements)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(measurements.to_dict(orient="records"), file, indent=2)
+
+    report = fit_exponents(measurements)
+    print(report.to_string(index=False, float_format="{:.3f}".format))
+
+    if (report.status == "FAIL").any():
+        print("\nScaling targets missed!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
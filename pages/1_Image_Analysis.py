@@ -5,7 +5,6 @@ import pandas as pd
 
 import src.streamlit.image_analysis as stim
 import streamlit as st
-from src.microspotreader import *
 from src.streamlit.DataStorage import DataStorage
 from src.streamlit.general import *
 
@@ -66,7 +65,7 @@ if image_path:
         # Toggle the inversion of the grayscale image.
         invert_image_colors = st.toggle(
             "Invert grayscale Image",
-            value=True,
+            value=False,
             on_change=stim.set_analysis_false,
         )
 
@@ -101,7 +100,8 @@ if image_path:
             disabled=st.session_state["image_analysis"]["disable_start"],
             use_container_width=True,
         ):
-            stim.run_analysis(first_spot, last_spot)
+            with profile_run("image_analysis"):
+                stim.run_analysis(first_spot, last_spot)
             st.session_state["image_analysis"]["analysis"] = True
 
 if st.session_state["image_analysis"]["analysis"]:
@@ -143,3 +143,5 @@ if st.session_state["image_analysis"]["analysis"]:
     with c1:
         # Creates a Zipfile containing all plots as .png files on this page and makes it ready for download.
         stim.download_figures(figuredict, "png")
+
+performance_panel("image_analysis")
@@ -4,7 +4,13 @@ from scipy.ndimage import gaussian_filter1d
 
 import src.streamlit.image_analysis as stim
 import streamlit as st
-from src.microspotreader import *
+from src.microspotreader import (
+    SpotList,
+    add_retention_time,
+    baseline_correction,
+    plot_chromatogram,
+    profiler,
+)
 from src.streamlit.DataStorage import DataStorage
 from src.streamlit.general import *
 
@@ -99,28 +105,31 @@ with st.form("Data Preparation Settings"):
         sigma_smooth = st.number_input("Sigma-Value for gaussian smoothing:", value=1)
 
 if dataprep:
-    if len(remove_rows) > 0:
-        spot_list.remove_rows(remove_rows)
+    with profile_run("data_preparation"):
+        if len(remove_rows) > 0:
+            spot_list.remove_rows(remove_rows)
 
-    if len(remove_columns) > 0:
-        spot_list.remove_columns(remove_columns)
+        if len(remove_columns) > 0:
+            spot_list.remove_columns(remove_columns)
 
-    spot_list.sort(serpentine=sort_serpentine)
+        spot_list.sort(serpentine=sort_serpentine)
 
-    df = spot_list.to_df()
-    add_retention_time(df, start_time, end_time)
+        df = spot_list.to_df()
+        add_retention_time(df, start_time, end_time)
+        profiler.add_metadata(spots=len(df))
 
-    if chromatogram_smoothing:
-        _, df.spot_intensity = baseline_correction(
-            df.spot_intensity,
-            conv_lvl=0.001,
-            window_lvl=100,
-            poly_lvl=1,
-        )
+        if chromatogram_smoothing:
+            _, df.spot_intensity = baseline_correction(
+                df.spot_intensity,
+                conv_lvl=0.001,
+                window_lvl=100,
+                poly_lvl=1,
+            )
 
-        df.spot_intensity = gaussian_filter1d(
-            input=df.spot_intensity.to_numpy(), sigma=sigma_smooth
-        )
+            with profiler.span("gaussian_filter1d"):
+                df.spot_intensity = gaussian_filter1d(
+                    input=df.spot_intensity.to_numpy(), sigma=sigma_smooth
+                )
 
     st.session_state["data_preparation"]["df"] = df
 
@@ -153,3 +162,5 @@ if st.session_state["data_preparation"]["df"] is not None:
     with c1:
         # Creates a Zipfile containing all plots as .png files on this page and makes it ready for download.
         stim.download_figures(figure_dict, "png")
+
+performance_panel("data_preparation")
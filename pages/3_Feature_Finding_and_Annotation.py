@@ -1,4 +1,6 @@
-import io
+import os
+import shutil
+import tempfile
 
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -6,11 +8,16 @@ import pyopenms as oms
 
 import src.streamlit.image_analysis as stim
 import streamlit as st
-from src.microspotreader import *
+from src.microspotreader import (
+    ActivityAnnotator,
+    ActivityPeakDetector,
+    FeatureFinder,
+)
 from src.streamlit.general import *
 
 # Sets up basic page layout
 page_setup()
+warm_up_annotation()
 with st.sidebar:
     st.session_state["sidebar"]["data_storage"].display_data()
 
@@ -100,6 +107,27 @@ with st.form("Settings", border=False):
             "Automatic peak threshold determination for activity Data.", value=True
         )
 
+        # Detects features in partitions of the retention time range on parallel worker processes, one per partition.
+        partitioning = st.session_state["feature_finding"]["settings"][
+            "feature_finder"
+        ]["partitioning"]
+        partitioning["partitions"] = partitioning["workers"] = st.number_input(
+            "Parallel processes for feature detection:", value=1, min_value=1
+        )
+
+        # Known m/z values are extracted as ion chromatograms instead of untargeted feature detection.
+        mz_list = []
+        for mz in st.text_input("Target m/z values (comma separated):").split(","):
+            if mz.strip() == "":
+                continue
+            try:
+                mz_list.append(float(mz))
+            except ValueError:
+                st.error(f"Invalid m/z value '{mz.strip()}' is ignored.")
+        st.session_state["feature_finding"]["settings"]["feature_finder"][
+            "targeted_extraction"
+        ]["mz_list"] = mz_list
+
         st.markdown("####")
 
         # Initiaize analysis:
@@ -133,41 +161,132 @@ with st.form("Settings", border=False):
             "Manual Threshold activity data peak detection", value=0.02, format="%f"
         )
 
-if analysis:
+        # Resampled correlation of all features at once, faster for large feature tables.
+        st.session_state["feature_finding"]["settings"]["activity_annotator"][
+            "shape_correlation"
+        ]["mode"] = (
+            "resampled"
+            if st.toggle("Fast shape correlation for large feature tables.")
+            else "pairwise"
+        )
 
-    exp = oms.MSExperiment()
-    feature_finder = FeatureFinder(exp, mzml_filename)
+        # Restricts feature detection to the retention time windows of the activity peaks plus a margin.
+        activity_guided = st.toggle("Only detect features close to activity peaks.")
 
-    if choose_mzml == "Upload .mzML File":
-        feature_finder.load_mzml_fromBuffer(
-            io.StringIO(mzml_upload.getvalue().decode("utf-8")).read()
+        # Peaks of spectra outside of the retention time windows are not read from indexed files.
+        st.session_state["feature_finding"]["settings"]["feature_finder"][
+            "mzml_loading"
+        ]["on_disk"] = st.toggle("Skip peaks outside of the activity peak windows.")
+
+        # MS2 mapping and adduct detection of correlated features only, after the annotation.
+        st.session_state["feature_finding"]["settings"]["feature_finder"][
+            "post_processing"
+        ]["deferred"] = st.toggle(
+            "Only detect adducts of features correlated to activity peaks."
         )
 
-    feature_finder.change_settings_dict(
-        st.session_state["feature_finding"]["settings"]["feature_finder"]
-    )
-    feature_table = feature_finder.run()
-    feature_chroms = feature_finder.get_feature_traces()
 
-    peak_detector = ActivityPeakDetector(dataset)
-    peak_detector.change_settings_dict(
-        st.session_state["feature_finding"]["settings"]["activity_detector"]
+def only_annotation_changed(results: dict, settings: dict, mzml_source: str) -> bool:
+    """True if the stored results were computed from the same .mzML file, activity data and feature finding and peak
+    detection settings, the stored ActivityAnnotator then only correlates pairs that are not in its cache yet.
+    """
+    if results is None or results.get("mzml_source") != mzml_source:
+        return False
+    feature_finder = results["feature_finder"]
+    peak_detector = results["peak_detector"]
+    return (
+        feature_finder.settings
+        == feature_finder.settings.updated(settings["feature_finder"])
+        and peak_detector.settings
+        == peak_detector.settings.updated(settings["activity_detector"])
+        and results["activity_annotator"].activity_table.equals(dataset)
     )
-    peak_list = peak_detector.run()
 
-    activity_annot = ActivityAnnotator(
-        feature_table, feature_chroms, peak_list, dataset
-    )
-    activity_annot.change_settings_dict(
-        st.session_state["feature_finding"]["settings"]["activity_annotator"]
+
+if analysis:
+    settings = st.session_state["feature_finding"]["settings"]
+    results = st.session_state["feature_finding"]["results"]
+    mzml_source = (
+        mzml_upload.file_id if choose_mzml == "Upload .mzML File" else mzml_filename
     )
-    peak_list = activity_annot.run()
 
-    st.session_state["feature_finding"]["results"] = {
-        "feature_finder": feature_finder,
-        "peak_detector": peak_detector,
-        "activity_annotator": activity_annot,
-    }
+    with profile_run("feature_finding"):
+        peak_detector = ActivityPeakDetector(dataset)
+        peak_detector.change_settings_dict(settings["activity_detector"])
+        peak_list = peak_detector.run()
+
+        # Activity guided feature finding only processes the retention time windows of the activity peaks.
+        settings["feature_finder"]["retention_time_filter"]["windows_s"] = (
+            FeatureFinder.get_peak_windows(
+                peak_list,
+                settings["activity_annotator"]["rt_correlation"]["window_s"],
+                settings["activity_annotator"]["rt_correlation"]["bias_s"],
+            )
+            if activity_guided
+            else []
+        )
+
+        if activity_guided and len(peak_list) == 0:
+            # Without windows, the entire run would be processed.
+            st.warning(
+                "No activity peaks detected, feature detection close to activity peaks was skipped."
+            )
+            st.session_state["feature_finding"]["results"] = None
+
+        elif only_annotation_changed(results, settings, mzml_source):
+            results["activity_annotator"].change_settings_dict(
+                settings["activity_annotator"]
+            )
+            results["activity_annotator"].run()
+
+        else:
+            mzml_path = mzml_filename
+            if choose_mzml == "Upload .mzML File":
+                # Uploads are streamed to a file, decoding them to a string would keep several copies in memory. The
+                # file is kept for the session, results loaded from the cache read it only when it is needed.
+                upload_folder = st.session_state["feature_finding"].setdefault(
+                    "upload_folder", tempfile.TemporaryDirectory()
+                )
+                mzml_path = os.path.join(
+                    upload_folder.name, mzml_upload.file_id, mzml_filename
+                )
+                if not os.path.exists(mzml_path):
+                    os.makedirs(os.path.dirname(mzml_path), exist_ok=True)
+                    mzml_upload.seek(0)
+                    with open(mzml_path, "wb") as file:
+                        shutil.copyfileobj(mzml_upload, file)
+
+            exp = oms.MSExperiment()
+            feature_finder = FeatureFinder(exp, mzml_path, get_checkpoint_store())
+            feature_finder.change_settings_dict(settings["feature_finder"])
+            feature_table = feature_finder.run()
+            feature_chroms = feature_finder.get_feature_traces()
+
+            activity_annot = ActivityAnnotator(
+                feature_table, feature_chroms, peak_list, dataset
+            )
+            activity_annot.change_settings_dict(settings["activity_annotator"])
+            peak_list = activity_annot.run()
+
+            st.session_state["feature_finding"]["results"] = {
+                "feature_finder": feature_finder,
+                "peak_detector": peak_detector,
+                "activity_annotator": activity_annot,
+                "mzml_source": mzml_source,
+            }
+
+        results = st.session_state["feature_finding"]["results"]
+        if (
+            results is not None
+            and settings["feature_finder"]["post_processing"]["deferred"]
+        ):
+            results["feature_finder"].annotate_features(
+                [
+                    feature_id
+                    for peak in results["activity_annotator"].peak_list
+                    for feature_id in peak.correlated_feature_ids
+                ]
+            )
 
 if st.session_state["feature_finding"]["results"] is not None:
     peak_list = st.session_state["feature_finding"]["results"][
@@ -185,10 +304,7 @@ if st.session_state["feature_finding"]["results"] is not None:
     consensus_map = st.session_state["feature_finding"]["results"][
         "feature_finder"
     ].consensus_map
-    mzml_file = st.session_state["feature_finding"]["results"][
-        "feature_finder"
-    ].filename
-    oms_exp = st.session_state["feature_finding"]["results"]["feature_finder"].exp
+    feature_finder = st.session_state["feature_finding"]["results"]["feature_finder"]
 
     figure_dict = {}
 
@@ -246,4 +362,10 @@ if st.session_state["feature_finding"]["results"] is not None:
         stim.download_figures(figure_dict, "png")
 
     with container:
-        stim.download_gnpsmgf(consensus_map, mzml_file, oms_exp)
+        # The export needs the spectra of the .mzML file, which are not loaded for cached results until requested.
+        if st.button("Prepare Files for FBMN", use_container_width=True):
+            stim.download_gnpsmgf(
+                consensus_map, feature_finder.filename, feature_finder.get_experiment()
+            )
+
+performance_panel("feature_finding")
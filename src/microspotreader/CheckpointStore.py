@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.microspotreader.Profiler import profiler
+
+
+class CheckpointStore:
+    """Content-addressed on-disk cache for intermediate results of the analysis pipelines.
+
+    Results are stored under a key derived from the name of the stage, a hash of the stage inputs, the settings of the
+    stage and the version of the code that produced them, i.e. of all modules of this package. If the total size of the
+    store exceeds its maximum size, the least recently used results are deleted.
+    """
+
+    def __init__(
+        self, directory: str = None, max_size_bytes: int = 2 * 1024**3
+    ) -> None:
+        """
+        Args:
+            directory (str, optional): directory of the store. If None, ".cache/microspotreader" in the home directory of the user is used. Defaults to None.
+            max_size_bytes (int, optional): maximum total size of all stored results. Defaults to 2 GiB.
+        """
+        if directory is None:
+            directory = Path.home() / ".cache" / "microspotreader"
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._code_versions: dict[str, str] = {}
+
+    def __getstate__(self):
+        # Locks cannot be pickled, the store is recreated with a new lock in worker processes.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hash_file(file) -> str:
+        """Hashes the content of a file.
+
+        Args:
+            file (str | Path | file-like): path of the file or an opened binary file.
+
+        Returns:
+            str: hex digest of the file content.
+        """
+        digest = hashlib.sha256()
+
+        if hasattr(file, "read"):
+            position = file.tell()
+            file.seek(0)
+            for chunk in iter(lambda: file.read(2**20), b""):
+                digest.update(chunk)
+            file.seek(position)
+        else:
+            with open(file, "rb") as opened_file:
+                for chunk in iter(lambda: opened_file.read(2**20), b""):
+                    digest.update(chunk)
+
+        return digest.hexdigest()
+
+    @classmethod
+    def hash_value(cls, value) -> str:
+        """Hashes a value in a way that is stable between processes and sessions.
+
+        Args:
+            value: Settings, dict, list, tuple, str, bytes, number, None, numpy array, DataFrame, Path to a file or opened binary file.
+
+        Returns:
+            str: hex digest of the value.
+        """
+        digest = hashlib.sha256()
+
+        if isinstance(value, np.ndarray):
+            digest.update(f"ndarray{value.dtype}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, pd.DataFrame):
+            digest.update(b"DataFrame")
+            digest.update(str(list(value.columns)).encode())
+            digest.update(
+                pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes()
+            )
+        elif isinstance(value, Path) or hasattr(value, "read"):
+            digest.update(b"file" + cls.hash_file(value).encode())
+        elif isinstance(value, Mapping):
+            digest.update(b"mapping")
+            for key in sorted(value):
+                digest.update(cls.hash_value(key).encode())
+                digest.update(cls.hash_value(value[key]).encode())
+        elif isinstance(value, (list, tuple)):
+            digest.update(b"sequence")
+            for item in value:
+                digest.update(cls.hash_value(item).encode())
+        elif isinstance(value, bytes):
+            digest.update(b"bytes" + value)
+        else:
+            digest.update(f"{type(value).__name__}{value!r}".encode())
+
+        return digest.hexdigest()
+
+    def code_version(self, code) -> str:
+        """Hash of the source files of this package and of the file that defines a class or function, changes to the
+        code invalidate stored results. The whole package is included, as stages depend on other classes, e.g. the
+        SpotIndexer or the pickled SpotList and Grid classes.
+
+        Args:
+            code (type | function): class or function that produces the stored result.
+
+        Returns:
+            str: hex digest of the source files.
+        """
+        source_file = inspect.getsourcefile(code)
+        if source_file not in self._code_versions:
+            package = Path(__file__).resolve().parent
+            source_files = {
+                path.relative_to(package).as_posix(): path
+                for path in package.rglob("*.py")
+            }
+            if package not in Path(source_file).resolve().parents:
+                source_files[Path(source_file).name] = Path(source_file)
+            self._code_versions[source_file] = self.hash_value(source_files)
+        return self._code_versions[source_file]
+
+    def make_key(self, stage: str, code, *inputs) -> str:
+        """Creates the key of a result.
+
+        Args:
+            stage (str): name of the pipeline stage.
+            code (type | function): class or function that produces the result.
+            inputs: inputs and settings of the stage, or keys of upstream stages.
+
+        Returns:
+            str: key of the result.
+        """
+        return self.hash_value([stage, self.code_version(code), *inputs])
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pkl"
+
+    def load(self, key: str):
+        """Loads a result from the store.
+
+        Args:
+            key (str): key of the result
+
+        Returns:
+            tuple[bool, object]: True and the result if it was found, False and None otherwise.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self.misses += 1
+            return False, None
+
+        # The modification time marks when a result was last used for the eviction of old results. The result may have
+        # been evicted by another process in the meantime, it was read already.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return True, value
+
+    def save(self, key: str, value):
+        """Saves a result to the store and evicts old results if the store exceeds its maximum size.
+
+        Args:
+            key (str): key of the result
+            value: picklable result
+        """
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Writing to a temporary file first ensures that a crash never leaves a partially written result behind.
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, path)
+
+        self.evict()
+
+    def cached(self, key: str, compute, stage: str = "checkpoint"):
+        """Returns the result stored under the key, or computes and stores it if it does not exist.
+
+        Args:
+            key (str): key of the result
+            compute (callable): function without arguments computing the result.
+            stage (str, optional): name of the stage, used to report cache hits to the profiler. Defaults to "checkpoint".
+
+        Returns:
+            object: stored or computed result.
+        """
+        with profiler.span(f"CheckpointStore.{stage}"):
+            found, value = self.load(key)
+            profiler.add_metadata(cache_hit=found)
+            if not found:
+                value = compute()
+                self.save(key, value)
+        return value
+
+    def evict(self):
+        """Deletes the least recently used results until the store is smaller than its maximum size."""
+        with self._lock:
+            files = []
+            for path in self.directory.glob("*/*.pkl"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+            total_size = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files, key=lambda file: file[0]):
+                if total_size <= self.max_size_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total_size -= size
+
+    def clear(self):
+        """Deletes all results in the store."""
+        with self._lock:
+            for path in self.directory.glob("*/*.pkl"):
+                path.unlink(missing_ok=True)
+
+    def get_statistics(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,13 +1,16 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from scipy.signal import savgol_filter
 
+from src.microspotreader.Profiler import profiled
 
+
+@profiled()
 def add_retention_time(df: pd.DataFrame, start_time: float, end_time: float):
     df["RT"] = np.linspace(start_time, end_time, num=len(df))
 
 
+@profiled()
 def baseline_correction(array, conv_lvl=0.001, window_lvl=100, poly_lvl=2):
     """
     ## Description
@@ -42,6 +45,8 @@ def baseline_correction(array, conv_lvl=0.001, window_lvl=100, poly_lvl=2):
 
 
 def plot_chromatogram(df: pd.DataFrame, ax=None):
+    import matplotlib.pyplot as plt
+
     if ax is None:
         fig, ax = plt.subplots()
 
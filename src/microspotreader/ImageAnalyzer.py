@@ -0,0 +1,260 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+import src.microspotreader.grid_classes.GridDetector as GridDetector
+import src.microspotreader.grid_classes.GridRegistrator as GridRegistrator
+import src.microspotreader.grid_classes.GridTemplate as GridTemplate
+import src.microspotreader.halo_classes.HaloDetector as HaloDetector
+import src.microspotreader.spot_classes.SpotCorrector as SpotCorrector
+import src.microspotreader.spot_classes.SpotDetector as SpotDetector
+import src.microspotreader.spot_classes.SpotIndexer as SpotIndexer
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
+
+
+class ImageAnalyzer:
+    """Runs the complete image analysis workflow (spot detection, grid detection, spot correction, indexing, intensity
+    determination and halo detection) on a single prepared image."""
+
+    settings: Settings = Settings(
+        {
+            "spot_detector": SpotDetector.SpotDetector.settings,
+            "grid_detector": GridDetector.GridDetector.settings,
+            "spot_corrector": SpotCorrector.SpotCorrector.settings,
+            "halo_detector": HaloDetector.HaloDetector.settings,
+            "grid_registrator": GridRegistrator.GridRegistrator.settings,
+            "halo_detection_toggle": False,
+            "halo_scaling_toggle": False,
+            "halo_scaling_factor": 0.04,
+            "get_intensity_spotradius": 0,
+            "toggle_normalization": True,
+        }
+    )
+
+    def __init__(
+        self,
+        image: np.array,
+        grid_template: GridTemplate.GridTemplate = None,
+        checkpoint_store: CheckpointStore = None,
+    ) -> None:
+        """
+        Args:
+            image (np.array): prepared image to analyze.
+            grid_template (GridTemplate, optional): template of the plate layout. If given, the template is registered to the image and full spot- and grid-detection is skipped if the registration is confident. Defaults to None.
+            checkpoint_store (CheckpointStore, optional): store for the results of each stage, stages with unchanged inputs are loaded instead of recomputed. Defaults to None.
+        """
+        self.image = image
+        self.grid_template = grid_template
+        self.checkpoint_store = checkpoint_store
+        self._image_hash = None
+
+        self.spot_list = None
+        self.grid = None
+        self.halo_list = None
+        self.registration_confidence = None
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    @property
+    def image_hash(self) -> str:
+        if self._image_hash is None:
+            self._image_hash = CheckpointStore.hash_value(self.image)
+        return self._image_hash
+
+    def checkpoint(self, stage: str, code, compute, *inputs):
+        """Loads the result of a stage from the checkpoint store or computes and stores it.
+
+        Args:
+            stage (str): name of the stage
+            code (type): class performing the stage, changes to its code invalidate stored results.
+            compute (callable): function without arguments computing the result of the stage.
+            inputs: inputs and settings of the stage, or keys of upstream stages.
+
+        Returns:
+            tuple[object, str]: result of the stage and its key, the key is None if no checkpoint store is used.
+        """
+        if self.checkpoint_store is None:
+            return compute(), None
+
+        key = self.checkpoint_store.make_key(stage, code, *inputs)
+        return self.checkpoint_store.cached(key, compute, stage), key
+
+    def register_template(self, spot_nr: int):
+        """Registers the grid template to the image.
+
+        Args:
+            spot_nr (int): Number of spots expected in the image.
+
+        Returns:
+            tuple[SpotList, Grid, str]: coarsely detected spots, the registered grid and the checkpoint key of the result, (None, None, None) if the registration was not confident.
+        """
+        registrator = GridRegistrator.GridRegistrator(
+            self.image, self.grid_template, self.settings["spot_detector"]
+        )
+        registrator.change_settings_dict(self.settings["grid_registrator"])
+
+        def register():
+            grid, confidence = registrator.register(spot_nr)
+            return registrator.spot_list, grid, confidence
+
+        (spot_list, grid, self.registration_confidence), key = self.checkpoint(
+            "grid_registration",
+            GridRegistrator.GridRegistrator,
+            register,
+            self.image_hash,
+            self.grid_template.to_dict(),
+            self.settings["spot_detector"],
+            self.settings["grid_registrator"],
+            spot_nr,
+        )
+
+        if (
+            self.registration_confidence
+            < self.settings["grid_registrator"]["registration"]["minimum_confidence"]
+        ):
+            return None, None, None
+
+        return spot_list, grid, key
+
+    def detect_spots_and_grid(self, spot_nr: int):
+        """Performs initial spot detection and grid detection on the full resolution image.
+
+        Args:
+            spot_nr (int): Number of spots expected in the image.
+
+        Returns:
+            tuple[SpotList, Grid, str]: initially detected spots, the detected grid and the checkpoint key of the grid.
+        """
+        spot_detector = SpotDetector.SpotDetector(self.image)
+        spot_detector.change_settings_dict(self.settings["spot_detector"])
+
+        edge_img, edge_key = self.checkpoint(
+            "edge_detection",
+            SpotDetector.SpotDetector,
+            spot_detector.get_image_edges,
+            self.image_hash,
+            self.settings["spot_detector"]["edge_detection"],
+        )
+        spot_detector.edge_img = edge_img
+
+        def detect_spots():
+            spot_detector.get_hough_transform()
+            return spot_detector.detect_spots(spot_nr)
+
+        spot_list, spot_key = self.checkpoint(
+            "hough_peaks",
+            SpotDetector.SpotDetector,
+            detect_spots,
+            edge_key,
+            self.settings["spot_detector"]["circle_detection"],
+            spot_nr,
+        )
+
+        grid_detector = GridDetector.GridDetector(self.image, spot_list)
+        grid_detector.change_settings_dict(self.settings["grid_detector"])
+        grid, grid_key = self.checkpoint(
+            "grid_detection",
+            GridDetector.GridDetector,
+            grid_detector.detect_grid,
+            self.image_hash,
+            spot_key,
+            self.settings["grid_detector"],
+        )
+
+        return spot_list, grid, grid_key
+
+    def get_grid_template(self) -> GridTemplate.GridTemplate:
+        """Creates a template of the plate layout from the results of the last analysis.
+
+        Returns:
+            GridTemplate: template that can be used to analyze further images of the same layout.
+        """
+        assert self.grid is not None, "Run the analysis first!"
+        return GridTemplate.GridTemplate(
+            self.grid, self.spot_list.median_radius, self.image.shape
+        )
+
+    @profiled()
+    def run(self, spot_nr: int, row_idx_start: int = 1, col_idx_start: int = 1):
+        """Performs the entire image analysis workflow using the settings in self.settings.
+
+        Args:
+            spot_nr (int): Number of spots expected in the image.
+            row_idx_start (int, optional): numerical row index of the first spot. Defaults to 1.
+            col_idx_start (int, optional): numerical column index of the first spot. Defaults to 1.
+
+        Returns:
+            SpotList: corrected and indexed list of spots sorted by their index.
+        """
+        profiler.add_metadata(image_shape=self.image.shape, spot_nr=spot_nr)
+        spot_list = None
+
+        # Registration of a known plate layout, skips full detection if it is confident.
+        if self.grid_template is not None:
+            spot_list, self.grid, grid_key = self.register_template(spot_nr)
+
+        # Spot Detection and grid detection for spot correction
+        if spot_list is None:
+            spot_list, self.grid, grid_key = self.detect_spots_and_grid(spot_nr)
+
+        def correct_and_index():
+            # Spot correction
+            spot_corrector = SpotCorrector.SpotCorrector(spot_list)
+            spot_corrector.change_settings_dict(self.settings["spot_corrector"])
+            corrected_spots = spot_corrector.gridbased_spotcorrection(self.grid)
+
+            # Indexing of spots
+            SpotIndexer.SpotIndexer(corrected_spots).assign_indexes(
+                row_idx_start=row_idx_start,
+                col_idx_start=col_idx_start,
+            )
+            corrected_spots.sort(serpentine=False)
+            return corrected_spots
+
+        spot_list, _ = self.checkpoint(
+            "spot_correction",
+            SpotCorrector.SpotCorrector,
+            correct_and_index,
+            grid_key,
+            self.settings["spot_corrector"],
+            row_idx_start,
+            col_idx_start,
+        )
+
+        # Intensity determination of spots.
+        spot_list.get_spot_intensities(
+            image=self.image, radius=self.settings["get_intensity_spotradius"]
+        )
+
+        # Normalize by median if chosen
+        if self.settings["toggle_normalization"]:
+            spot_list.normalize_by_median()
+
+        # Halo detection
+        if self.settings["halo_detection_toggle"]:
+            halo_detector = HaloDetector.HaloDetector(self.image)
+            halo_detector.change_settings_dict(self.settings["halo_detector"])
+            self.halo_list, _ = self.checkpoint(
+                "halo_detection",
+                HaloDetector.HaloDetector,
+                halo_detector.perform_halo_detection,
+                self.image_hash,
+                self.settings["halo_detector"],
+            )
+            halo_detector.halo_list = self.halo_list
+            halo_detector.assign_halos_to_spots(spot_list)
+
+        # scaling halos to spot intensities.
+        if self.settings["halo_scaling_toggle"]:
+            spot_list.scale_halos_to_intensity(self.settings["halo_scaling_factor"])
+
+        self.spot_list = spot_list
+        return self.spot_list
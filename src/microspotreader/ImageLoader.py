@@ -1,11 +1,16 @@
+from pathlib import Path
+
 import imageio.v3 as iio
 import numpy as np
 from skimage.color import rgb2gray
 from skimage.util import invert
 
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
+
 
 class ImageLoader:
-    settings: dict = {"invert_image": False}
+    settings: Settings = Settings({"invert_image": False})
 
     def __init__(self) -> None:
         self.image = None
@@ -14,7 +19,7 @@ class ImageLoader:
         """Change the settings of the image loader by key word arguments"""
         for key, value in kwarg.items():
             if key in self.settings:
-                self.settings[key] = value
+                self.settings = self.settings.updated({key: value})
 
             else:
                 print(f"invalid setting: {key}")
@@ -57,15 +62,27 @@ class ImageLoader:
         self.image = invert(self.image)
         return self.image
 
-    def prepare_image(self, filepath: str):
+    @profiled()
+    def prepare_image(self, filepath: str, checkpoint_store=None):
         """Image preparation workflow for the microspot reader
 
         Args:
             filepath (str): Filepath to the image that should be prepared
+            checkpoint_store (CheckpointStore, optional): store to load the prepared image from if the file and settings are unchanged. Defaults to None.
 
         Returns:
             array: prepared image.
         """
+        if checkpoint_store is not None:
+            file = filepath if hasattr(filepath, "read") else Path(filepath)
+            key = checkpoint_store.make_key(
+                "prepared_image", ImageLoader, file, self.settings
+            )
+            self.image = checkpoint_store.cached(
+                key, lambda: self.prepare_image(filepath), "prepared_image"
+            )
+            return self.image
+
         self.load(filepath=filepath)
 
         if len(self.image.shape) != 2:
@@ -74,4 +91,6 @@ class ImageLoader:
         if self.settings["invert_image"]:
             self.invert_image()
 
+        profiler.add_metadata(image_shape=self.image.shape)
+
         return self.image
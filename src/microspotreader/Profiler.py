@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+import pandas as pd
+
+
+@dataclass
+class Span:
+    """Measurements of a single execution of a pipeline stage."""
+
+    name: str
+    start_s: float
+    wall_time_s: float = 0.0
+    cpu_time_s: float = 0.0
+    peak_alloc_bytes: int = None
+    thread_id: int = 0
+    depth: int = 0
+    metadata: dict = field(default_factory=dict)
+
+
+class Profiler:
+    """Opt-in instrumentation of the pipeline stages, records wall time, cpu time and peak memory allocation of each
+    stage. When disabled, instrumented stages only check a single flag before running.
+
+    Peak allocations are measured with tracemalloc and include numpy arrays, but not memory allocated by C++ libraries
+    like pyopenms. CPU time is the cpu time of the entire process, if stages run in parallel threads their cpu times
+    overlap. The peak of tracemalloc is shared by all threads as well, a span of one thread would be charged for the
+    allocations of other threads and would reset the peak of their spans. Spans during which another thread had an
+    open span therefore have no peak allocation (None) and the metadata "concurrent_threads" set to True.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.keep_spans = True
+        self.spans: list[Span] = []
+
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+        # Number of threads with open spans, the generation increases whenever a second thread opens a span.
+        self._span_threads = 0
+        self._concurrency_generation = 0
+        self._active_recordings = 0
+        # True if the profiler was enabled by record, it is then disabled when the last running recording ends.
+        self._enabled_by_recording = False
+
+    def enable(self, trace_memory: bool = True, keep_spans: bool = True):
+        """Starts recording spans.
+
+        Args:
+            trace_memory (bool, optional): record the peak memory allocation of each span, slows down allocation heavy code. Defaults to True.
+            keep_spans (bool, optional): keep all spans in self.spans, if False spans are only passed to running recordings. Defaults to True.
+        """
+        self.trace_memory = trace_memory
+        self.keep_spans = keep_spans
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self):
+        """Stops recording spans, recorded spans are kept until reset is called."""
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.trace_memory = False
+
+    def reset(self):
+        """Deletes all recorded spans."""
+        with self._lock:
+            self.spans = []
+            self._origin = time.perf_counter()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _recordings(self) -> list:
+        if not hasattr(self._local, "recordings"):
+            self._local.recordings = []
+        return self._local.recordings
+
+    @contextmanager
+    def record(self, trace_memory: bool = True):
+        """Enables the profiler while the enclosed code runs and collects the spans recorded in the current thread,
+        spans of other threads, e.g. other sessions of the web-app, are not collected. If the profiler was disabled,
+        it stays enabled until the last recording of all threads ends.
+
+        Args:
+            trace_memory (bool, optional): record the peak memory allocation of each span. Defaults to True.
+
+        Yields:
+            list[dict]: list that is filled with the spans recorded in the enclosed code.
+        """
+        with self._lock:
+            if self._active_recordings == 0 and not self.enabled:
+                self.enable(trace_memory, keep_spans=False)
+                self._enabled_by_recording = True
+            self._active_recordings += 1
+
+        recording = []
+        self._recordings().append(recording)
+        try:
+            yield recording
+        finally:
+            self._recordings().remove(recording)
+            with self._lock:
+                self._active_recordings -= 1
+                if self._active_recordings == 0 and self._enabled_by_recording:
+                    self._enabled_by_recording = False
+                    self.disable()
+
+    @contextmanager
+    def span(self, name: str, **metadata):
+        """Context manager measuring the enclosed code as a span.
+
+        Args:
+            name (str): name of the span, usually "Class.method".
+            metadata: additional information to store with the span, e.g. image sizes.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        stack = self._stack()
+        span = Span(
+            name=name,
+            start_s=time.perf_counter() - self._origin,
+            thread_id=threading.get_ident(),
+            depth=len(stack),
+            metadata=dict(metadata),
+        )
+
+        with self._lock:
+            if not stack:
+                self._span_threads += 1
+                if self._span_threads > 1:
+                    self._concurrency_generation += 1
+            concurrent = self._span_threads > 1
+            generation = self._concurrency_generation
+
+        trace_memory = self.trace_memory and tracemalloc.is_tracing()
+        if trace_memory:
+            # The peak of tracemalloc is reset for each span, the peak of the enclosing span is kept on the stack.
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current, span]
+        else:
+            frame = [0, 0, span]
+
+        stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield span
+        finally:
+            span.wall_time_s = time.perf_counter() - wall_start
+            span.cpu_time_s = time.process_time() - cpu_start
+            stack.pop()
+
+            with self._lock:
+                concurrent = concurrent or generation != self._concurrency_generation
+                if not stack:
+                    self._span_threads -= 1
+
+            if concurrent:
+                span.metadata["concurrent_threads"] = True
+            elif trace_memory and tracemalloc.is_tracing():
+                _, peak = tracemalloc.get_traced_memory()
+                frame[1] = max(frame[1], peak)
+                span.peak_alloc_bytes = frame[1] - frame[0]
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], frame[1])
+
+            if self.keep_spans:
+                with self._lock:
+                    self.spans.append(span)
+            for recording in self._recordings():
+                recording.append(asdict(span))
+
+    def add_metadata(self, **metadata):
+        """Adds information to the innermost running span of the current thread, does nothing if disabled."""
+        if not self.enabled:
+            return
+
+        stack = self._stack()
+        if stack:
+            stack[-1][2].metadata.update(metadata)
+
+    def profiled(self, name: str = None):
+        """Decorator recording each call of the decorated function as a span.
+
+        Args:
+            name (str, optional): name of the span, if None the qualified name of the function is used. Defaults to None.
+        """
+
+        def decorator(function):
+            span_name = function.__qualname__ if name is None else name
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+
+                with self.span(span_name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def get_spans(self) -> list[dict]:
+        with self._lock:
+            return [asdict(span) for span in self.spans]
+
+    @staticmethod
+    def summarize(spans: list[dict]) -> pd.DataFrame:
+        """Summarizes spans by name.
+
+        Args:
+            spans (list[dict]): spans as returned by get_spans or collected by record.
+
+        Returns:
+            pd.DataFrame: number of calls, total wall time, total cpu time, maximum peak allocation and checkpoint hits of each stage, sorted by total wall time.
+        """
+        spans = pd.DataFrame(
+            [
+                {
+                    "name": span["name"],
+                    "wall_time_s": span["wall_time_s"],
+                    "cpu_time_s": span["cpu_time_s"],
+                    "peak_alloc_bytes": span["peak_alloc_bytes"],
+                    "cache_hit": span["metadata"].get("cache_hit"),
+                }
+                for span in spans
+            ],
+            columns=[
+                "name",
+                "wall_time_s",
+                "cpu_time_s",
+                "peak_alloc_bytes",
+                "cache_hit",
+            ],
+        )
+        summary = spans.groupby("name").agg(
+            calls=("wall_time_s", "size"),
+            wall_time_s=("wall_time_s", "sum"),
+            cpu_time_s=("cpu_time_s", "sum"),
+            peak_alloc_bytes=("peak_alloc_bytes", "max"),
+            cache_hits=("cache_hit", lambda hits: int((hits == True).sum())),
+        )
+        return summary.sort_values("wall_time_s", ascending=False)
+
+    def summary(self) -> pd.DataFrame:
+        """Summarizes all recorded spans by name, see summarize."""
+        return self.summarize(self.get_spans())
+
+    def to_json(self, path: str = None, spans: list[dict] = None) -> str:
+        """Exports spans as JSON.
+
+        Args:
+            path (str, optional): file to write the JSON to. Defaults to None.
+            spans (list[dict], optional): spans to export, if None all spans in self.spans are exported. Defaults to None.
+
+        Returns:
+            str: JSON string of the list of spans.
+        """
+        spans = self.get_spans() if spans is None else spans
+        content = json.dumps(spans, indent=2, default=str)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(content)
+        return content
+
+    def to_chrome_trace(self, path: str = None, spans: list[dict] = None) -> dict:
+        """Exports spans in the Chrome trace event format, which can be opened in chrome://tracing or
+        https://ui.perfetto.dev.
+
+        Args:
+            path (str, optional): file to write the trace to. Defaults to None.
+            spans (list[dict], optional): spans to export, if None all spans in self.spans are exported. Defaults to None.
+
+        Returns:
+            dict: trace in the Chrome trace event format.
+        """
+        spans = self.get_spans() if spans is None else spans
+        trace = {
+            "traceEvents": [
+                {
+                    "name": span["name"],
+                    "cat": span["name"].split(".")[0],
+                    "ph": "X",
+                    "ts": span["start_s"] * 1e6,
+                    "dur": span["wall_time_s"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": span["thread_id"],
+                    "args": {
+                        "cpu_time_s": span["cpu_time_s"],
+                        "peak_alloc_bytes": span["peak_alloc_bytes"],
+                        **span["metadata"],
+                    },
+                }
+                for span in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+        if path is not None:
+            with open(path, "w") as file:
+                json.dump(trace, file, default=str)
+        return trace
+
+
+# Profiler shared by all instrumented stages of the package.
+profiler = Profiler()
+
+
+def profiled(name: str = None):
+    """Decorator recording each call of the decorated function as a span of the shared profiler."""
+    return profiler.profiled(name)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from numbers import Real
+
+
+class Settings(Mapping):
+    """Immutable, hashable and validated (nested) mapping of settings.
+
+    Every detector owns its own Settings instance. Changing settings never mutates an existing instance but creates a
+    new one, so that detectors running concurrently cannot overwrite each others parameters and settings can be used as
+    cache keys.
+    """
+
+    def __init__(self, data: Mapping) -> None:
+        self._data = {key: self._freeze(value) for key, value in data.items()}
+        self._hash = None
+
+    @staticmethod
+    def _freeze(value):
+        """Converts mutable values into immutable ones: dicts to Settings, lists to tuples."""
+        if isinstance(value, Settings):
+            return value
+        if isinstance(value, Mapping):
+            return Settings(value)
+        if isinstance(value, (list, tuple)):
+            return tuple(Settings._freeze(item) for item in value)
+        return value
+
+    @staticmethod
+    def _thaw(value):
+        if isinstance(value, Settings):
+            return value.to_dict()
+        if isinstance(value, tuple):
+            return [Settings._thaw(item) for item in value]
+        return value
+
+    @staticmethod
+    def _validate(key: str, default, value):
+        """Checks that a new value has a type compatible with the value it replaces.
+
+        Raises:
+            TypeError: if the type of the new value does not match the type of the default value.
+        """
+        expected = type(default).__name__
+        if isinstance(default, bool):
+            valid = isinstance(value, bool)
+        elif isinstance(default, Real):
+            valid = isinstance(value, Real) and not isinstance(value, bool)
+            expected = "number"
+        elif isinstance(default, tuple):
+            valid = isinstance(value, (list, tuple))
+            expected = "list"
+        elif default is None:
+            valid = True
+        else:
+            valid = isinstance(value, type(default))
+
+        if not valid:
+            raise TypeError(
+                f"Invalid value for setting '{key}': expected {expected}, got {type(value).__name__}."
+            )
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(tuple(sorted(self._data.items())))
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, Settings):
+            return self._data == other._data
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Settings({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (Settings, (self.to_dict(),))
+
+    def to_dict(self) -> dict:
+        """Returns a mutable deep copy of the settings as a nested dictionary."""
+        return {key: self._thaw(value) for key, value in self._data.items()}
+
+    def updated(self, changes: Mapping) -> Settings:
+        """Returns a new Settings object with the given changes applied. Nested dictionaries only update the keys they contain.
+
+        The class attribute holding the default settings is never modified: instances changing their settings assign
+        the returned object to their own attribute, which then only they own.
+
+        Args:
+            changes (Mapping): (nested) dictionary of the settings to change.
+
+        Raises:
+            KeyError: if a key does not exist in the current settings.
+            TypeError: if the type of a new value does not match the type of the current value.
+
+        Returns:
+            Settings: new Settings object containing the changes.
+        """
+        data = dict(self._data)
+        for key, value in changes.items():
+            if key not in data:
+                raise KeyError(f"Invalid setting: '{key}'")
+
+            if isinstance(data[key], Settings):
+                if not isinstance(value, Mapping):
+                    raise TypeError(
+                        f"Setting '{key}' has to be changed with a dictionary."
+                    )
+                data[key] = data[key].updated(value)
+            else:
+                self._validate(key, data[key], value)
+                data[key] = self._freeze(value)
+
+        return Settings(data)
@@ -1,16 +1,74 @@
-from .DataPrep import *
-from .feature_annotation.ActivityAnnotator import ActivityAnnotator
-from .feature_annotation.ActivityPeakDetector import ActivityPeakDetector
-from .feature_annotation.FeatureFinder import FeatureFinder
-from .grid_classes.Grid import Grid
-from .grid_classes.GridDetector import GridDetector
-from .grid_classes.GridLine import GridLine
-from .grid_classes.GridPoint import GridPoint
-from .halo_classes.Halo import Halo
-from .halo_classes.HaloDetector import HaloDetector
-from .ImageLoader import ImageLoader
-from .spot_classes.Spot import Spot
-from .spot_classes.SpotCorrector import SpotCorrector
-from .spot_classes.SpotDetector import SpotDetector
-from .spot_classes.SpotIndexer import SpotIndexer
-from .spot_classes.SpotList import SpotList
+"""Public classes and functions of microspotreader.
+
+All names are loaded lazily on first access, so that heavy dependencies (e.g. pyopenms, numba, scipy.stats, seaborn)
+are only imported by the classes that need them: `from src.microspotreader import ImageLoader` does not import
+pyopenms.
+"""
+
+import importlib
+import sys
+import types
+
+# Name of each public attribute and the module defining it, relative to this package.
+_lazy_attributes = {
+    "CheckpointStore": ".CheckpointStore",
+    "add_retention_time": ".DataPrep",
+    "baseline_correction": ".DataPrep",
+    "plot_chromatogram": ".DataPrep",
+    "ActivityAnnotator": ".feature_annotation.ActivityAnnotator",
+    "ActivityPeakDetector": ".feature_annotation.ActivityPeakDetector",
+    "BatchAnnotator": ".feature_annotation.BatchAnnotator",
+    "FeatureChromatograms": ".feature_annotation.FeatureChromatograms",
+    "FeatureFinder": ".feature_annotation.FeatureFinder",
+    "Grid": ".grid_classes.Grid",
+    "GridDetector": ".grid_classes.GridDetector",
+    "GridLine": ".grid_classes.GridLine",
+    "GridPoint": ".grid_classes.GridPoint",
+    "GridRegistrator": ".grid_classes.GridRegistrator",
+    "GridTemplate": ".grid_classes.GridTemplate",
+    "Halo": ".halo_classes.Halo",
+    "HaloDetector": ".halo_classes.HaloDetector",
+    "ImageAnalyzer": ".ImageAnalyzer",
+    "ImageLoader": ".ImageLoader",
+    "MS1Correlator": ".feature_annotation.MS1Correlator",
+    "FolderWatcher": ".plate_classes.FolderWatcher",
+    "PlateAnalyzer": ".plate_classes.PlateAnalyzer",
+    "PlatePart": ".plate_classes.PlatePart",
+    "PlateResultStore": ".plate_classes.PlateResultStore",
+    "Profiler": ".Profiler",
+    "profiler": ".Profiler",
+    "Settings": ".Settings",
+    "Spot": ".spot_classes.Spot",
+    "SpotCorrector": ".spot_classes.SpotCorrector",
+    "SpotDetector": ".spot_classes.SpotDetector",
+    "SpotIndexer": ".spot_classes.SpotIndexer",
+    "SpotList": ".spot_classes.SpotList",
+}
+
+__all__ = list(_lazy_attributes)
+
+
+def __getattr__(name: str):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    # Cache the attribute, later accesses do not call __getattr__ anymore.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _LazyModule(types.ModuleType):
+    def __setattr__(self, name: str, value):
+        # Importing a submodule binds it to its package. Modules named like the class they define (e.g. ImageAnalyzer)
+        # would then shadow the class, which is loaded by __getattr__ instead.
+        if name in _lazy_attributes and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _LazyModule
@@ -1,26 +1,68 @@
+from collections.abc import Mapping
+
 import numpy as np
 import pandas as pd
-from numba import njit
+from numba import float64, int64, njit, types
 from scipy.stats import pearsonr
 
+import src.microspotreader.feature_annotation.FeatureChromatograms as FeatureChromatograms
 import src.microspotreader.feature_annotation.Peak as Peak
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
+
+# Read-only arrays also accept writable arrays, pandas returns read-only arrays with copy-on-write.
+float64_array = types.Array(float64, 1, "A", readonly=True)
+
+
+# Kernels are compiled when the module is imported, for the explicit signatures only. The compiled machine code is
+# cached on disk (next to this file or in NUMBA_CACHE_DIR), so only the first import after a change compiles them.
+@njit(float64(float64_array), cache=True)
+def _sampling_frequency(retention_time_array: np.array):
+    return len(retention_time_array) / (
+        np.max(retention_time_array) - np.min(retention_time_array)
+    )
+
+
+@njit(
+    types.Tuple((float64[:], float64[:]))(
+        types.UniTuple(float64, 2), int64, float64_array, float64_array
+    ),
+    cache=True,
+)
+def _interp_chromatogram(
+    bounds: tuple[float, float],
+    number_datapoints: int,
+    retention_times: np.array,
+    intensities: np.array,
+):
+    x_interp = np.linspace(*bounds, number_datapoints).astype(np.float64)
+    y_interp = np.interp(
+        x_interp,
+        retention_times,
+        intensities,
+    )
+    y_interp *= 1 / y_interp.max()
+    return x_interp, y_interp
 
 
 class ActivityAnnotator:
-    settings: dict = {"rt_correlation": {"window_s": 2, "bias_s": 0}}
+    settings: Settings = Settings(
+        {
+            "rt_correlation": {"window_s": 2, "bias_s": 0},
+            # Mode "pairwise" interpolates both chromatograms of each peak-feature pair, mode "resampled" resamples all
+            # chromatograms once and correlates each peak with all of its features at once. A grid step of 0
+            # uses the smallest median sampling interval of the activity and feature chromatograms.
+            "shape_correlation": {"mode": "pairwise", "grid_step_s": 0.0},
+        }
+    )
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
 
     def __init__(
         self,
@@ -33,6 +75,34 @@ class ActivityAnnotator:
         self.feature_chroms = feature_chroms
         self.peak_list = peak_list
         self.activity_table = activity_table
+        self._rt_index = None
+        self._correlation_cache = None
+
+    @property
+    def rt_index(self) -> tuple[np.array, np.array]:
+        """Retention times of the feature table in ascending order and the positions of the sorted features in the
+        table. Built once per feature table.
+        """
+        if self._rt_index is None or self._rt_index[0] is not self.feature_table:
+            retention_times = self.feature_table["RT"].to_numpy(dtype=np.float64)
+            order = np.argsort(retention_times, kind="stable")
+            self._rt_index = (self.feature_table, retention_times[order], order)
+        return self._rt_index[1:]
+
+    @property
+    def correlation_cache(self) -> dict:
+        """Correlation coefficients of all peak-feature pairs computed so far, grouped by shape correlation mode and
+        grid step. Pairs are keyed by peak number, feature id and the overlapping bounds of both peaks, see
+        get_pair_keys. Changes of the retention time window or bias therefore only correlate newly admitted pairs.
+        The cache is reset when the feature table, feature chromatograms or activity table are replaced.
+        """
+        data = (self.feature_table, self.feature_chroms, self.activity_table)
+        if self._correlation_cache is None or any(
+            cached is not current
+            for cached, current in zip(self._correlation_cache[0], data)
+        ):
+            self._correlation_cache = (data, {})
+        return self._correlation_cache[1]
 
     def correlate_by_retentiontime(self, window: float, bias: float):
         """Adds indices of features correlated to all peaks in the peaklist by retention time.
@@ -41,11 +111,22 @@ class ActivityAnnotator:
             window (float): window size in seconds that is correlated to activity peaks
             bias (float): bias in seconds that is applied to the retention time of the activity peak before correlation
         """
-        for peak in self.peak_list:
-            peak.correlated_feature_ids = self.feature_table.loc[
-                window
-                >= np.abs(self.feature_table["RT"] - (peak.retention_time + bias))
-            ].index.values
+        sorted_rts, order = self.rt_index
+        centers = np.array(
+            [peak.retention_time + bias for peak in self.peak_list], dtype=np.float64
+        )
+
+        # Binary search of the windows of all peaks at once, widened by one feature on each side so that the exact
+        # comparison below decides about features at the borders.
+        starts = np.maximum(np.searchsorted(sorted_rts, centers - window) - 1, 0)
+        ends = np.searchsorted(sorted_rts, centers + window, side="right") + 1
+
+        feature_ids = self.feature_table.index.values
+        for peak, center, start, end in zip(self.peak_list, centers, starts, ends):
+            candidates = order[start:end]
+            candidates = candidates[window >= np.abs(sorted_rts[start:end] - center)]
+            # Features keep the order of the feature table.
+            peak.correlated_feature_ids = feature_ids[np.sort(candidates)]
 
     def get_overlapping_bounds(self, peak: Peak.Peak, feature: pd.Series):
         """Get bounds for the activity and feature peak of the same timewindow.
@@ -71,13 +152,40 @@ class ActivityAnnotator:
         feature_bounds = (feature.RT - time_premax, feature.RT + time_postmax)
         return activity_bounds, feature_bounds
 
-    @staticmethod
-    @njit
-    def sampling_frequency(retention_time_array: np.array):
-        return len(retention_time_array) / (
-            np.max(retention_time_array) - np.min(retention_time_array)
+    def get_pair_keys(self, peak: Peak.Peak, feature_times: np.array) -> list[tuple]:
+        """Keys of the correlation cache for all features correlated to a peak by retention time, with the bounds of
+        get_overlapping_bounds computed for all features at once.
+
+        Args:
+            peak (Peak.Peak): peak object from the peaklist
+            feature_times (np.array): columns RT, RTstart and RTend of the feature table
+
+        Returns:
+            list[tuple]: peak number, feature id, activity bounds and feature bounds of each correlated feature.
+        """
+        rt, rt_start, rt_end = feature_times[
+            self.feature_table.index.get_indexer(peak.correlated_feature_ids)
+        ].T
+        time_premax = np.maximum(peak.start_RT - peak.retention_time, rt_start - rt)
+        time_postmax = np.minimum(peak.retention_time - peak.end_RT, rt - rt_end)
+
+        return list(
+            zip(
+                [peak.number] * len(rt),
+                peak.correlated_feature_ids,
+                zip(
+                    (peak.retention_time - time_premax).tolist(),
+                    (peak.retention_time + time_postmax).tolist(),
+                ),
+                zip((rt - time_premax).tolist(), (rt + time_postmax).tolist()),
+            )
         )
 
+    @staticmethod
+    def sampling_frequency(retention_time_array: np.array) -> float:
+        # The compiled kernel only accepts float64 arrays.
+        return _sampling_frequency(np.asarray(retention_time_array, dtype=np.float64))
+
     def get_number_of_datapoints(
         self, sequence_1, sequence_2, bounds: tuple[float, float]
     ):
@@ -87,64 +195,301 @@ class ActivityAnnotator:
         return int(np.abs(bounds[1] - bounds[0]) * sampling_freq)
 
     @staticmethod
-    @njit
     def get_interp_chromatogram(
         bounds: tuple[float, float],
         number_datapoints: int,
         retention_times: np.array,
         intensities: np.array,
-    ):
-        x_interp = np.linspace(*bounds, number_datapoints).astype(np.float64)
-        y_interp = np.interp(
-            x_interp,
-            retention_times,
-            intensities,
+    ) -> tuple[np.array, np.array]:
+        # The compiled kernel only accepts float64 arrays and bounds.
+        return _interp_chromatogram(
+            (float(bounds[0]), float(bounds[1])),
+            int(number_datapoints),
+            np.asarray(retention_times, dtype=np.float64),
+            np.asarray(intensities, dtype=np.float64),
         )
-        y_interp *= 1 / y_interp.max()
-        return x_interp, y_interp
+
+    def get_feature_chrom(self, feature_id: str) -> tuple[np.array, np.array]:
+        """Retention times and intensities of the chromatogram of a feature as float64 arrays, views into the
+        chromatograms for FeatureChromatograms."""
+        if isinstance(self.feature_chroms, FeatureChromatograms.FeatureChromatograms):
+            return self.feature_chroms.get_arrays(feature_id)
+
+        chrom = self.feature_chroms[feature_id]
+        return chrom.rt.to_numpy(dtype=np.float64), chrom.int.to_numpy(dtype=np.float64)
 
     def get_matching_chromatograms(self, peak: Peak.Peak, feature_id: str):
         activity_bounds, feature_bounds = self.get_overlapping_bounds(
             peak, self.feature_table.loc[feature_id]
         )
 
+        activity_rt = self.activity_table.RT.to_numpy(dtype=np.float64)
+        feature_rt, feature_int = self.get_feature_chrom(feature_id)
+
         number_datapoints = self.get_number_of_datapoints(
-            self.activity_table.RT.to_numpy(),
-            self.feature_chroms[feature_id].rt.to_numpy(),
-            activity_bounds,
+            activity_rt, feature_rt, activity_bounds
         )
         activity_chrom = self.get_interp_chromatogram(
             activity_bounds,
             number_datapoints,
-            self.activity_table.RT.to_numpy(),
-            self.activity_table.spot_intensity.to_numpy(),
+            activity_rt,
+            self.activity_table.spot_intensity.to_numpy(dtype=np.float64),
         )
         feature_chrom = self.get_interp_chromatogram(
             feature_bounds,
             number_datapoints,
-            self.feature_chroms[feature_id].rt.to_numpy(),
-            self.feature_chroms[feature_id].int.to_numpy(),
+            feature_rt,
+            feature_int,
         )
 
         return activity_chrom, feature_chrom
 
+    @classmethod
+    def warm_up(cls):
+        """Runs the numba kernels once on minimal input. Compilation or loading of the cached kernels and the first
+        call overhead are then paid up front, e.g. in the initializer of worker processes or at server start.
+        """
+        retention_times = np.array([0.0, 1.0, 2.0])
+        cls.sampling_frequency(retention_times)
+        cls.get_interp_chromatogram((0.0, 2.0), 3, retention_times, retention_times)
+
     def pearson_correlation(self, sequence_1, sequence_2):
         return pearsonr(sequence_1, sequence_2).statistic
 
-    def correlate_by_shape(self):
-        for peak in self.peak_list:
-            for feature_id in peak.correlated_feature_ids:
+    def get_grid_step(self, feature_ids: list[str]) -> float:
+        """Step of the retention time grid used for resampled shape correlation.
+
+        Args:
+            feature_ids (list[str]): ids of the features that are resampled
+
+        Returns:
+            float: grid step in seconds.
+        """
+        if self.settings["shape_correlation"]["grid_step_s"] > 0:
+            return self.settings["shape_correlation"]["grid_step_s"]
+
+        feature_intervals = [
+            1 / self.sampling_frequency(self.get_feature_chrom(feature_id)[0])
+            for feature_id in feature_ids
+        ]
+        activity_interval = 1 / self.sampling_frequency(
+            self.activity_table.RT.to_numpy(dtype=np.float64)
+        )
+        return min(activity_interval, np.median(feature_intervals))
+
+    def resample_feature_chroms(self, feature_ids: list[str], step: float):
+        """Resamples the chromatograms of the given features onto grids of the given step, aligned to the retention
+        time of each feature. Each grid covers the chromatogram with one additional point past both ends, the
+        chromatograms are stored one after another in a single array.
+
+        Args:
+            feature_ids (list[str]): ids of the features to resample
+            step (float): grid step in seconds
+
+        Returns:
+            tuple[np.array, np.array, np.array, np.array]: resampled intensities of all features, index of the first
+            value of each feature in the intensities, grid position of the first value relative to the retention time
+            of the feature, number of values of each feature.
+        """
+        retention_times = self.feature_table.loc[feature_ids, "RT"].to_numpy(
+            dtype=np.float64
+        )
+
+        intensities, offsets, lengths = [], [], []
+        for feature_id, retention_time in zip(feature_ids, retention_times):
+            chrom_rt, chrom_int = self.get_feature_chrom(feature_id)
+            first = np.floor((chrom_rt[0] - retention_time) / step)
+            last = np.ceil((chrom_rt[-1] - retention_time) / step)
+            grid = retention_time + np.arange(first, last + 1) * step
+
+            intensities.append(np.interp(grid, chrom_rt, chrom_int))
+            offsets.append(first)
+            lengths.append(len(grid))
+
+        lengths = np.array(lengths, dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        return (
+            np.concatenate(intensities),
+            starts,
+            np.array(offsets, dtype=np.int64),
+            lengths,
+        )
+
+    @staticmethod
+    def masked_pearson_correlation(
+        sequence: np.array, sequences: np.array, mask: np.array
+    ) -> np.array:
+        """Pearson correlation of a sequence with each row of a matrix, only using the values selected by each row of
+        the mask.
+
+        Args:
+            sequence (np.array): 1D array of length n
+            sequences (np.array): 2D array with n columns
+            mask (np.array): boolean array with the shape of sequences
+
+        Returns:
+            np.array: correlation coefficient for each row, NaN for rows with less than 2 selected values or without
+            variance.
+        """
+        count = mask.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Centering before multiplying avoids cancellation for intensities of very different magnitudes.
+            x = np.where(mask, sequence, 0.0)
+            y = np.where(mask, sequences, 0.0)
+            x = np.where(mask, x - (x.sum(axis=1) / count)[:, None], 0.0)
+            y = np.where(mask, y - (y.sum(axis=1) / count)[:, None], 0.0)
+            correlation = (x * y).sum(axis=1) / np.sqrt(
+                (x * x).sum(axis=1) * (y * y).sum(axis=1)
+            )
+
+        correlation[count < 2] = np.nan
+        return np.clip(correlation, -1, 1)
+
+    def correlate_by_shape_resampled(
+        self, peak_features: list[tuple[Peak.Peak, list[str]]], step: float
+    ) -> list[np.array]:
+        """Correlates the shape of each activity peak with all of the given features at once. The feature
+        chromatograms are resampled once onto grids with a common step, each peak is compared to its features on the
+        same windows as get_overlapping_bounds, in a single vectorised operation.
+
+        Args:
+            peak_features (list[tuple[Peak.Peak, list[str]]]): peaks and the ids of the features to correlate them with
+            step (float): grid step in seconds
+
+        Returns:
+            list[np.array]: correlation coefficients of each peak with its features.
+        """
+        feature_ids = list(
+            dict.fromkeys(
+                feature_id
+                for _, peak_feature_ids in peak_features
+                for feature_id in peak_feature_ids
+            )
+        )
+        intensities, starts, offsets, lengths = self.resample_feature_chroms(
+            feature_ids, step
+        )
+
+        features = self.feature_table.loc[feature_ids]
+        left_widths = (features.RT - features.RTstart).to_numpy(dtype=np.float64)
+        right_widths = (features.RTend - features.RT).to_numpy(dtype=np.float64)
+        positions = pd.Index(feature_ids)
+        activity_rt = self.activity_table.RT.to_numpy(dtype=np.float64)
+        activity_int = self.activity_table.spot_intensity.to_numpy(dtype=np.float64)
+
+        coefficients = []
+        for peak, peak_feature_ids in peak_features:
+            idx = positions.get_indexer(peak_feature_ids)
+
+            # Windows of get_overlapping_bounds in grid positions relative to the retention times of peak and feature.
+            window_start = np.ceil(
+                -np.maximum(peak.end_RT - peak.retention_time, right_widths[idx]) / step
+            )
+            window_end = np.floor(
+                np.minimum(peak.retention_time - peak.start_RT, left_widths[idx]) / step
+            )
+            grid = np.arange(window_start.min(), window_end.max() + 1)
+
+            activity = np.interp(
+                peak.retention_time + grid * step, activity_rt, activity_int
+            )
+            # Positions past the end of a resampled chromatogram take its first or last value, like np.interp.
+            samples = starts[idx, None] + np.clip(
+                grid - offsets[idx, None], 0, lengths[idx, None] - 1
+            ).astype(np.int64)
+            mask = (grid >= window_start[:, None]) & (grid <= window_end[:, None])
+
+            coefficients.append(
+                self.masked_pearson_correlation(activity, intensities[samples], mask)
+            )
+        return coefficients
+
+    def correlate_by_shape_pairwise(
+        self, peak_features: list[tuple[Peak.Peak, list[str]]]
+    ) -> list[list[float]]:
+        """Correlates the shape of each activity peak with each of the given features, one pair at a time.
+
+        Args:
+            peak_features (list[tuple[Peak.Peak, list[str]]]): peaks and the ids of the features to correlate them with
+
+        Returns:
+            list[list[float]]: correlation coefficients of each peak with its features.
+        """
+        coefficients = []
+        for peak, peak_feature_ids in peak_features:
+            peak_coefficients = []
+            for feature_id in peak_feature_ids:
                 activity_chrom, feature_chrom = self.get_matching_chromatograms(
                     peak, feature_id
                 )
-                peak.correlation_coeff_features.append(
+                peak_coefficients.append(
                     self.pearson_correlation(activity_chrom[1], feature_chrom[1])
                 )
+            coefficients.append(peak_coefficients)
+        return coefficients
+
+    def correlate_by_shape(self):
+        """Adds the shape correlation coefficients of all features correlated to each peak by retention time. Only
+        pairs missing from the correlation cache are correlated, coefficients of pairs that are no longer correlated
+        by retention time are dropped from the peaks.
+        """
+        mode = self.settings["shape_correlation"]["mode"]
+        assert mode in (
+            "pairwise",
+            "resampled",
+        ), "Shape correlation mode has to be 'pairwise' or 'resampled'."
+
+        step = None
+        if mode == "resampled":
+            # The grid step is estimated from a fixed subset of all features instead of the correlated features, so
+            # that cached coefficients stay valid when the retention time window changes.
+            stride = max(1, len(self.feature_table) // 1000)
+            step = self.get_grid_step(self.feature_table.index[::stride])
+        cache = self.correlation_cache.setdefault((mode, step), {})
+
+        feature_times = self.feature_table[["RT", "RTstart", "RTend"]].to_numpy(
+            dtype=np.float64
+        )
+        pair_keys = [self.get_pair_keys(peak, feature_times) for peak in self.peak_list]
+
+        missing = []
+        for peak, keys in zip(self.peak_list, pair_keys):
+            new = [i for i, key in enumerate(keys) if key not in cache]
+            if len(new) > 0:
+                missing.append(
+                    (
+                        peak,
+                        [peak.correlated_feature_ids[i] for i in new],
+                        [keys[i] for i in new],
+                    )
+                )
 
+        if len(missing) > 0:
+            peak_features = [(peak, feature_ids) for peak, feature_ids, _ in missing]
+            if mode == "resampled":
+                coefficients = self.correlate_by_shape_resampled(peak_features, step)
+            else:
+                coefficients = self.correlate_by_shape_pairwise(peak_features)
+            for (_, _, keys), peak_coefficients in zip(missing, coefficients):
+                cache.update(zip(keys, peak_coefficients))
+
+        for peak, keys in zip(self.peak_list, pair_keys):
+            peak.correlation_coeff_features = [cache[key] for key in keys]
+
+        profiler.add_metadata(
+            correlated_pairs=sum(len(keys) for _, _, keys in missing),
+            cached_pairs=sum(map(len, pair_keys))
+            - sum(len(keys) for _, _, keys in missing),
+        )
+
+    @profiled()
     def run(self):
         self.correlate_by_retentiontime(
             window=self.settings["rt_correlation"]["window_s"],
             bias=self.settings["rt_correlation"]["bias_s"],
         )
         self.correlate_by_shape()
+        profiler.add_metadata(
+            peaks=len(self.peak_list), features=len(self.feature_table)
+        )
         return self.peak_list
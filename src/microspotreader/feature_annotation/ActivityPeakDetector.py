@@ -1,37 +1,35 @@
-import matplotlib.patheffects as pe
-import matplotlib.pyplot as plt
+from collections.abc import Mapping
+
 import numpy as np
 import pandas as pd
-import seaborn as sns
 from scipy.signal import find_peaks
 from skimage.feature import peak_local_max
 
 import src.microspotreader.DataPrep as DataPrep
 import src.microspotreader.feature_annotation.Peak as Peak
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
 
 
 class ActivityPeakDetector:
-    settings: dict = {
-        "peak_detection": {
-            "automatic_threshold": True,
-            "noise_convergence": 0.02,
-            "manual_threshold": 0.0,
-            "minimum_SNR": 3,
+    settings: Settings = Settings(
+        {
+            "peak_detection": {
+                "automatic_threshold": True,
+                "noise_convergence": 0.02,
+                "manual_threshold": 0.0,
+                "minimum_SNR": 3,
+            }
         }
-    }
+    )
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
 
     def __init__(self, activity_table: pd.DataFrame) -> None:
         """
@@ -199,6 +197,7 @@ class ActivityPeakDetector:
         ]
         return self.peak_list
 
+    @profiled()
     def run(self):
         if self.settings["peak_detection"]["automatic_threshold"] is False:
             self.threshold = self.settings["peak_detection"]["manual_threshold"]
@@ -219,6 +218,7 @@ class ActivityPeakDetector:
         peak_bounds = self.get_peak_bounds(peaks_long, minima_long)
 
         peak_list = self.create_peak_list(peaks_long, peak_bounds)
+        profiler.add_metadata(peaks=len(peak_list))
 
         return peak_list
 
@@ -235,6 +235,8 @@ class ActivityPeakDetector:
         )
 
     def plot_chromatogram(self, ax=None):
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, ax = plt.subplots()
 
@@ -273,6 +275,9 @@ class ActivityPeakDetector:
         ax.legend(["Chromatogram", "Detected Peaks", "Peak Threshold"])
 
     def plot_heatmap(self, ax=None):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         if ax is None:
             fig, ax = plt.subplots()
         df = self.wide_df
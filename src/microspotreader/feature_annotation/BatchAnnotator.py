@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyopenms as oms
+
+import src.microspotreader.feature_annotation.FeatureChromatograms as FeatureChromatograms
+import src.microspotreader.feature_annotation.Peak as Peak
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.feature_annotation.ActivityAnnotator import ActivityAnnotator
+from src.microspotreader.feature_annotation.ActivityPeakDetector import (
+    ActivityPeakDetector,
+)
+from src.microspotreader.feature_annotation.FeatureFinder import FeatureFinder
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
+
+
+def find_run_features(
+    mzml_path: str, settings: Settings, checkpoint_store: CheckpointStore = None
+) -> tuple[bytes, bytes, FeatureChromatograms.FeatureChromatograms]:
+    """Detects the features of a single .mzML file. Defined on module level so it can be sent to worker processes.
+
+    Args:
+        mzml_path (str): path of the .mzML file
+        settings (Settings): settings of the FeatureFinder
+        checkpoint_store (CheckpointStore, optional): store for the feature maps, shared by all workers. Defaults to None.
+
+    Returns:
+        tuple[bytes, bytes, FeatureChromatograms]: content of the .featureXML and .consensusXML files and the feature chromatograms.
+    """
+    feature_finder = FeatureFinder(oms.MSExperiment(), mzml_path, checkpoint_store)
+    feature_finder.change_settings_dict(settings)
+    feature_finder.run()
+
+    return (
+        FeatureFinder.map_to_bytes(feature_finder.feature_map, oms.FeatureXMLFile),
+        FeatureFinder.map_to_bytes(feature_finder.consensus_map, oms.ConsensusXMLFile),
+        feature_finder.feature_chromatograms,
+    )
+
+
+class BatchAnnotator:
+    """Annotates multiple LC-MS runs with their activity data, e.g. replicate injections or fractions of a sample.
+
+    The features of all .mzML files are detected concurrently on a pool of worker processes, each file only once even if
+    it belongs to multiple runs. Activity peaks are then detected and correlated for each run, and the features of all
+    runs are linked by m/z and retention time into a combined table with columns for each run.
+    """
+
+    settings: Settings = Settings(
+        {
+            "feature_finder": FeatureFinder.settings,
+            "activity_detector": ActivityPeakDetector.settings,
+            "activity_annotator": ActivityAnnotator.settings,
+            # Maximum differences of features of different runs that are linked into the same row of the combined table.
+            "feature_linking": {"rt_tolerance_s": 30.0, "mz_tolerance_ppm": 10.0},
+        }
+    )
+
+    def __init__(
+        self,
+        runs: dict[str, tuple[str, pd.DataFrame]],
+        max_workers: int = None,
+        checkpoint_store: CheckpointStore = None,
+    ) -> None:
+        """
+        Args:
+            runs (dict[str, tuple[str, pd.DataFrame]]): name of each run, the path of its .mzML file and its activity table.
+            max_workers (int, optional): maximum number of .mzML files processed at the same time, if None one worker per file is used up to the number of CPUs. Defaults to None.
+            checkpoint_store (CheckpointStore, optional): store for the feature maps, feature finding is skipped for unchanged files and settings. Defaults to None.
+        """
+        self.runs = runs
+        self.max_workers = max_workers
+        self.checkpoint_store = checkpoint_store
+
+        self.feature_maps: dict[str, oms.FeatureMap] = {}
+        self.consensus_maps: dict[str, oms.ConsensusMap] = {}
+        self.feature_tables: dict[str, pd.DataFrame] = {}
+        self.feature_chromatograms: dict[
+            str, FeatureChromatograms.FeatureChromatograms
+        ] = {}
+        self.peak_detectors: dict[str, ActivityPeakDetector] = {}
+        self.peak_lists: dict[str, list[Peak.Peak]] = {}
+        self.linked_map: oms.ConsensusMap = None
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    @profiled()
+    def find_features(self):
+        """Detects the features of all .mzML files on a pool of worker processes. Runs sharing an .mzML file share its
+        feature map.
+        """
+        assert len(self.runs) > 0, "No runs were given."
+        assert not self.settings["feature_finder"]["post_processing"][
+            "deferred"
+        ], "Deferred adduct detection is not supported for batches."
+
+        mzml_paths = list(
+            dict.fromkeys(mzml_path for mzml_path, _ in self.runs.values())
+        )
+        max_workers = self.max_workers or min(len(mzml_paths), os.cpu_count())
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                mzml_path: executor.submit(
+                    find_run_features,
+                    mzml_path,
+                    self.settings["feature_finder"],
+                    self.checkpoint_store,
+                )
+                for mzml_path in mzml_paths
+            }
+            results = {
+                mzml_path: future.result() for mzml_path, future in futures.items()
+            }
+
+        for name, (mzml_path, _) in self.runs.items():
+            feature_xml, consensus_xml, feature_chromatograms = results[mzml_path]
+            self.feature_maps[name] = FeatureFinder.map_from_bytes(
+                feature_xml, oms.FeatureMap, oms.FeatureXMLFile
+            )
+            self.consensus_maps[name] = FeatureFinder.map_from_bytes(
+                consensus_xml, oms.ConsensusMap, oms.ConsensusXMLFile
+            )
+            self.feature_tables[name] = self.feature_maps[name].get_df(
+                export_peptide_identifications=False
+            )
+            self.feature_chromatograms[name] = feature_chromatograms
+
+        profiler.add_metadata(runs=len(self.runs), mzml_files=len(mzml_paths))
+
+    @profiled()
+    def annotate_runs(self):
+        """Detects the activity peaks of each run and correlates them with the features of the run."""
+        for name, (_, activity_table) in self.runs.items():
+            peak_detector = ActivityPeakDetector(activity_table)
+            peak_detector.change_settings_dict(self.settings["activity_detector"])
+            peak_list = peak_detector.run()
+
+            activity_annotator = ActivityAnnotator(
+                self.feature_tables[name],
+                self.feature_chromatograms[name],
+                peak_list,
+                activity_table,
+            )
+            activity_annotator.change_settings_dict(self.settings["activity_annotator"])
+
+            self.peak_detectors[name] = peak_detector
+            self.peak_lists[name] = activity_annotator.run()
+
+    @profiled()
+    def link_features(self) -> oms.ConsensusMap:
+        """Links the features of all runs by m/z and retention time.
+
+        Returns:
+            oms.ConsensusMap: consensus map with one consensus feature per group of linked features, the map index of
+            each feature is the position of its run in self.runs.
+        """
+        grouping = oms.FeatureGroupingAlgorithmKD()
+        parameters = grouping.getDefaults()
+        parameters.setValue(
+            "link:rt_tol", self.settings["feature_linking"]["rt_tolerance_s"]
+        )
+        parameters.setValue(
+            "link:mz_tol", self.settings["feature_linking"]["mz_tolerance_ppm"]
+        )
+        parameters.setValue("mz_unit", "ppm")
+        grouping.setParameters(parameters)
+
+        linked_map = oms.ConsensusMap()
+        column_headers = linked_map.getColumnHeaders()
+        for map_index, (name, (mzml_path, _)) in enumerate(self.runs.items()):
+            column_header = oms.ColumnHeader()
+            column_header.filename = mzml_path
+            column_header.label = name
+            column_header.size = self.feature_maps[name].size()
+            column_headers[map_index] = column_header
+        linked_map.setColumnHeaders(column_headers)
+
+        grouping.group(list(self.feature_maps.values()), linked_map)
+        self.linked_map = linked_map
+        return linked_map
+
+    def get_run_annotations(self, name: str) -> pd.DataFrame:
+        """
+        Args:
+            name (str): name of the run
+
+        Returns:
+            pd.DataFrame: number of the activity peak with the highest correlation and the correlation coefficient of
+            each correlated feature of the run, indexed by feature id.
+        """
+        annotations = pd.DataFrame(
+            [
+                (feature_id, peak.number, coefficient)
+                for peak in self.peak_lists[name]
+                for feature_id, coefficient in zip(
+                    peak.correlated_feature_ids, peak.correlation_coeff_features
+                )
+            ],
+            columns=["feature_id", "peak", "correlation"],
+        )
+        return (
+            annotations.sort_values("correlation", ascending=False)
+            .drop_duplicates("feature_id")
+            .set_index("feature_id")
+        )
+
+    def get_combined_table(self, annotated_only: bool = True) -> pd.DataFrame:
+        """Combined feature table of all runs with one row per group of linked features. For each run, the columns
+        "<run>_feature_id", "<run>_intensity", "<run>_peak" and "<run>_correlation" contain the id and intensity of its
+        feature and the activity peak it correlates best with.
+
+        Args:
+            annotated_only (bool, optional): only keep rows with a feature correlated to an activity peak in any run. Defaults to True.
+
+        Returns:
+            pd.DataFrame: combined feature table with the average m/z, retention time and the number of runs of each row.
+        """
+        assert self.linked_map is not None, "Link the features first!"
+
+        names = list(self.runs)
+        feature_ids = np.full((self.linked_map.size(), len(names)), None, dtype=object)
+        for row, consensus_feature in enumerate(self.linked_map):
+            for handle in consensus_feature.getFeatureList():
+                feature_ids[row, handle.getMapIndex()] = str(handle.getUniqueId())
+
+        table = pd.DataFrame(
+            {
+                "mz": [feature.getMZ() for feature in self.linked_map],
+                "RT": [feature.getRT() for feature in self.linked_map],
+                "runs": pd.notna(feature_ids).sum(axis=1),
+            }
+        )
+        for column, name in enumerate(names):
+            run_ids = pd.Series(feature_ids[:, column])
+            annotations = self.get_run_annotations(name)
+            table[f"{name}_feature_id"] = run_ids
+            table[f"{name}_intensity"] = run_ids.map(
+                self.feature_tables[name]["intensity"]
+            )
+            table[f"{name}_peak"] = run_ids.map(annotations["peak"]).astype("Int64")
+            table[f"{name}_correlation"] = run_ids.map(annotations["correlation"])
+
+        if annotated_only:
+            correlations = table[[f"{name}_correlation" for name in names]]
+            table = table.loc[correlations.notna().any(axis=1)]
+
+        return table.sort_values(["runs", "RT"], ascending=[False, True])
+
+    @profiled()
+    def run(self) -> pd.DataFrame:
+        """Performs feature finding, activity peak detection, annotation and feature linking of all runs.
+
+        Returns:
+            pd.DataFrame: combined table of the features correlated to activity peaks, see get_combined_table.
+        """
+        self.find_features()
+        self.annotate_runs()
+        self.link_features()
+        return self.get_combined_table()
+
+
+def read_runs(filename: str) -> dict[str, tuple[str, pd.DataFrame]]:
+    """Reads the runs of a batch from a .csv file with the columns "name", "mzml" and "activity_table", containing the
+    name of each run and the paths of its .mzML file and activity table. Relative paths are relative to the .csv file.
+
+    Args:
+        filename (str): path of the .csv file
+
+    Returns:
+        dict[str, tuple[str, pd.DataFrame]]: name of each run, the path of its .mzML file and its activity table.
+    """
+    folder = os.path.dirname(os.path.abspath(filename))
+    batch = pd.read_csv(filename)
+    assert batch.name.is_unique, "The names of the runs have to be unique."
+
+    return {
+        row.name: (
+            os.path.join(folder, row.mzml),
+            pd.read_csv(os.path.join(folder, row.activity_table), encoding="utf-8-sig"),
+        )
+        for row in batch.itertuples(index=False)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Annotate the features of multiple LC-MS runs with their activity data."
+    )
+    parser.add_argument(
+        "runs",
+        help='.csv file with the columns "name", "mzml" and "activity_table" of each run.',
+    )
+    parser.add_argument("output", help=".csv file to store the combined table in.")
+    parser.add_argument(
+        "--settings", help=".json file with settings of the BatchAnnotator."
+    )
+    parser.add_argument(
+        "--max-workers", type=int, help="Number of .mzML files processed at once."
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        help="Folder to store feature maps in, unchanged files are not processed again.",
+    )
+    parser.add_argument(
+        "--all-features",
+        action="store_true",
+        help="Also include features not correlated to any activity peak.",
+    )
+    args = parser.parse_args()
+
+    checkpoint_store = None
+    if args.checkpoint_dir is not None:
+        checkpoint_store = CheckpointStore(args.checkpoint_dir)
+
+    batch_annotator = BatchAnnotator(
+        read_runs(args.runs), args.max_workers, checkpoint_store
+    )
+    if args.settings is not None:
+        with open(args.settings, "r") as file:
+            batch_annotator.change_settings_dict(json.load(file))
+
+    batch_annotator.run()
+    batch_annotator.get_combined_table(not args.all_features).to_csv(
+        args.output, index=False
+    )
+
+
+if __name__ == "__main__":
+    main()
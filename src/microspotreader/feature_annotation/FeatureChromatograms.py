@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    import pyopenms as oms
+
+
+class FeatureChromatograms(Mapping):
+    """Chromatograms of all features of a feature map, stored one after another in two contiguous arrays of retention
+    times and intensities. Behaves like a dictionary of dataframes with the columns "rt" and "int" keyed by feature id,
+    the dataframes and the arrays of get_arrays are views into the shared arrays.
+    """
+
+    def __init__(
+        self,
+        feature_ids: list[str],
+        retention_times: np.array,
+        intensities: np.array,
+        offsets: np.array,
+    ) -> None:
+        """
+        Args:
+            feature_ids (list[str]): id of each feature
+            retention_times (np.array): retention times of all chromatograms
+            intensities (np.array): intensities of all chromatograms
+            offsets (np.array): index of the first value of each chromatogram, followed by the total number of values.
+        """
+        assert (
+            len(offsets) == len(feature_ids) + 1
+        ), "Offsets need one entry per feature and the total number of values."
+        assert len(retention_times) == len(intensities) == offsets[-1]
+
+        self.feature_ids = pd.Index(feature_ids, dtype=object)
+        self.retention_times = np.asarray(retention_times, dtype=np.float64)
+        self.intensities = np.asarray(intensities, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_arrays(
+        cls, feature_ids: list[str], chromatograms: list[tuple[np.array, np.array]]
+    ) -> FeatureChromatograms:
+        """
+        Args:
+            feature_ids (list[str]): id of each feature
+            chromatograms (list[tuple[np.array, np.array]]): retention times and intensities of each feature
+
+        Returns:
+            FeatureChromatograms: chromatograms of all features.
+        """
+        lengths = [len(retention_times) for retention_times, _ in chromatograms]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        if len(chromatograms) == 0:
+            return cls(feature_ids, np.empty(0), np.empty(0), offsets)
+
+        return cls(
+            feature_ids,
+            np.concatenate([retention_times for retention_times, _ in chromatograms]),
+            np.concatenate([intensities for _, intensities in chromatograms]),
+            offsets,
+        )
+
+    @classmethod
+    def from_feature_map(cls, feature_map: oms.FeatureMap) -> FeatureChromatograms:
+        """Reads the chromatograms from the metavalues "chrom_rts" and "chrom_intensities" of a feature map, e.g. of a
+        .featureXML file written after to_feature_map.
+
+        Args:
+            feature_map (oms.FeatureMap): feature map with chromatograms as metavalues
+
+        Returns:
+            FeatureChromatograms: chromatograms of all features.
+        """
+        assert feature_map.size() > 0 and feature_map[0].metaValueExists(
+            "chrom_rts"
+        ), "Please assign chromatograms to the featuremap first!"
+
+        return cls.from_arrays(
+            [str(feature.getUniqueId()) for feature in feature_map],
+            [
+                (
+                    np.array(feature.getMetaValue("chrom_rts").split(","), dtype=float),
+                    np.array(
+                        feature.getMetaValue("chrom_intensities").split(","),
+                        dtype=float,
+                    ),
+                )
+                for feature in feature_map
+            ],
+        )
+
+    def to_feature_map(self, feature_map: oms.FeatureMap) -> oms.FeatureMap:
+        """Copy of a feature map with the chromatogram of each feature as comma separated strings in the metavalues
+        "chrom_rts" and "chrom_intensities", for export to .featureXML files.
+
+        Args:
+            feature_map (oms.FeatureMap): feature map with features of this instance
+
+        Returns:
+            oms.FeatureMap: feature map containing the chromatograms as meta values.
+        """
+        import pyopenms as oms
+
+        feature_map_chroms = oms.FeatureMap(feature_map)
+        feature_map_chroms.clear(False)
+
+        for feature in feature_map:
+            retention_times, intensities = self.get_arrays(str(feature.getUniqueId()))
+            feature.setMetaValue("chrom_rts", ",".join(retention_times.astype(str)))
+            feature.setMetaValue("chrom_intensities", ",".join(intensities.astype(str)))
+            feature_map_chroms.push_back(feature)
+
+        return feature_map_chroms
+
+    def get_arrays(self, feature_id: str) -> tuple[np.array, np.array]:
+        """
+        Args:
+            feature_id (str): id of the feature
+
+        Returns:
+            tuple[np.array, np.array]: views of the retention times and intensities of the feature.
+        """
+        position = self.feature_ids.get_loc(feature_id)
+        values = slice(self.offsets[position], self.offsets[position + 1])
+        return self.retention_times[values], self.intensities[values]
+
+    def __getitem__(self, feature_id: str) -> pd.DataFrame:
+        retention_times, intensities = self.get_arrays(feature_id)
+        return pd.DataFrame({"rt": retention_times, "int": intensities}, copy=False)
+
+    def __iter__(self):
+        return iter(self.feature_ids)
+
+    def __len__(self) -> int:
+        return len(self.feature_ids)
+
+    def __contains__(self, feature_id) -> bool:
+        return feature_id in self.feature_ids
@@ -1,64 +1,316 @@
 import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pyopenms as oms
 
+import src.microspotreader.feature_annotation.FeatureChromatograms as FeatureChromatograms
+import src.microspotreader.feature_annotation.Peak as Peak
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
+
+
+def detect_features_in_partition(
+    filename: str,
+    settings: Settings,
+    load_range: tuple[float, float],
+    feature_range: tuple[float, float],
+) -> tuple[bytes, FeatureChromatograms.FeatureChromatograms]:
+    """Detects the features of a partition of the retention time range of an .mzML file. Defined on module level so
+    it can be sent to worker processes.
+
+    Args:
+        filename (str): path of the .mzML file
+        settings (Settings): settings of the FeatureFinder
+        load_range (tuple[float, float]): retention time range of the spectra to load, including the overlap with the neighbouring partitions
+        feature_range (tuple[float, float]): retention time range of the features to keep, start inclusive and end exclusive.
+
+    Returns:
+        tuple[bytes, FeatureChromatograms]: content of the .featureXML file of the kept features and their chromatograms.
+    """
+    feature_finder = FeatureFinder(oms.MSExperiment(), filename)
+    feature_finder.change_settings_dict(settings)
+    feature_finder.load_mzml(load_range)
+    feature_map = feature_finder.detect_features()
+
+    kept_map = oms.FeatureMap(feature_map)
+    kept_map.clear(False)
+    feature_ids = []
+    for feature in feature_map:
+        if feature_range[0] <= feature.getRT() < feature_range[1]:
+            kept_map.push_back(feature)
+            feature_ids.append(str(feature.getUniqueId()))
+
+    return (
+        FeatureFinder.map_to_bytes(kept_map, oms.FeatureXMLFile),
+        FeatureChromatograms.FeatureChromatograms.from_arrays(
+            feature_ids,
+            [
+                feature_finder.feature_chromatograms.get_arrays(feature_id)
+                for feature_id in feature_ids
+            ],
+        ),
+    )
+
 
 class FeatureFinder:
-    settings: dict = {
-        "mass_trace_detection": {
-            "mass_error_ppm": 10,
-            "noise_threshold": 1e5,
-        },
-        "elution_peak_detection": {
-            "min_fwhm_s": 1,
-            "max_fwhm_s": 60,
-        },
-        "adduct_detection": {
-            "adduct_list": [
-                b"H:+:0.4",
-                b"Na:+:0.2",
-                b"NH4:+:0.2",
-                b"H3O1:+:0.1",
-                b"CH2O2:+:0.1",
-                b"H-2O-1:0:0.2",
-            ]
-        },
+    settings: Settings = Settings(
+        {
+            "mass_trace_detection": {
+                "mass_error_ppm": 10,
+                "noise_threshold": 1e5,
+            },
+            "elution_peak_detection": {
+                "min_fwhm_s": 1,
+                "max_fwhm_s": 60,
+            },
+            "adduct_detection": {
+                "adduct_list": [
+                    b"H:+:0.4",
+                    b"Na:+:0.2",
+                    b"NH4:+:0.2",
+                    b"H3O1:+:0.1",
+                    b"CH2O2:+:0.1",
+                    b"H-2O-1:0:0.2",
+                ]
+            },
+            # Retention time windows [start, end] in seconds feature finding is restricted to, e.g. the windows of
+            # activity peaks from get_peak_windows. An empty list uses the entire run.
+            "retention_time_filter": {"windows_s": []},
+            # Deferred MS2 mapping and adduct detection only run for the features passed to annotate_features.
+            "post_processing": {"deferred": False},
+            # Spectra of other MS levels are skipped while reading. With "on_disk", the peaks of spectra outside of the
+            # retention time windows are not read from indexed .mzML files, see load_mzml_on_disk.
+            "mzml_loading": {"ms_levels": [1, 2], "on_disk": False},
+            # The run is split into partitions of equal retention time, features are detected in each partition on a
+            # pool of at most "workers" processes. Each partition is extended by the overlap on both sides, which should
+            # exceed the width of the widest features.
+            "partitioning": {"partitions": 1, "overlap_s": 60.0, "workers": 4},
+            # Extracts the ion chromatograms of the listed m/z values instead of untargeted feature finding. Each
+            # target with signal becomes a feature spanning the retention times around its apex above the boundary
+            # fraction of the apex intensity.
+            "targeted_extraction": {
+                "mz_list": [],
+                "mass_error_ppm": 10.0,
+                "boundary_fraction": 0.05,
+            },
+            # Number of results of the most recent runs kept in memory, see result_cache. 0 disables the cache.
+            "result_cache": {"size": 4},
+        }
+    )
+
+    # Maximum retention time difference in seconds of features grouped by adduct detection.
+    adduct_retention_max_diff_s = 3.0
+
+    # Results of the most recent runs of all instances in this process, keyed by the hash of the .mzML file and the
+    # settings. The least recently used results are dropped once the cache exceeds the "result_cache" size setting.
+    result_cache: OrderedDict = OrderedDict()
+    _result_cache_lock = threading.Lock()
+
+    # OpenMS checks the file extension when storing maps.
+    map_filenames = {
+        oms.FeatureXMLFile: "map.featureXML",
+        oms.ConsensusXMLFile: "map.consensusXML",
     }
 
-    def __init__(self, exp: oms.MSExperiment, filename_mzml: str) -> None:
+    def __init__(
+        self,
+        exp: oms.MSExperiment,
+        filename_mzml: str,
+        checkpoint_store: CheckpointStore = None,
+    ) -> None:
+        """
+        Args:
+            exp (oms.MSExperiment): experiment to load the .mzML file into.
+            filename_mzml (str): path to the .mzML file.
+            checkpoint_store (CheckpointStore, optional): store for the feature map, feature finding is skipped if the .mzML file and settings are unchanged. Defaults to None.
+        """
         self.exp: oms.MSExperiment = exp
         self.filename = filename_mzml
         self.exp_loaded = False
+        self.checkpoint_store = checkpoint_store
+        self.mzml_hash = None
 
         self.feature_map = oms.FeatureMap()
         self.consensus_map = None
+        self.feature_chromatograms = None
+        self.unannotated_feature_map = None
+        # Incremented by changes of self.feature_map in place, invalidates the feature table of get_feature_table.
+        self.feature_map_version = 0
+        self._feature_table = None
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
+
+    def get_mzml_file(self, rt_range: tuple[float, float] = None) -> oms.MzMLFile:
+        """MzMLFile that only reads spectra of the MS levels to load. Spectra outside of the retention time windows are
+        read as well, their peaks are removed by filter_retention_times, missing spectra would change the detected
+        features.
+
+        Args:
+            rt_range (tuple[float, float], optional): only read spectra in this retention time range. Defaults to None.
+
+        Returns:
+            oms.MzMLFile: file handler with the filters as options.
+        """
+        mzml_file = oms.MzMLFile()
+        options = mzml_file.getOptions()
+        options.setMSLevels(list(self.settings["mzml_loading"]["ms_levels"]))
+        if rt_range is not None:
+            options.setRTRange(
+                oms.DRange1(oms.DPosition1(rt_range[0]), oms.DPosition1(rt_range[1]))
+            )
+        mzml_file.setOptions(options)
+        return mzml_file
+
+    @profiled()
+    def load_mzml_on_disk(self, rt_range: tuple[float, float] = None) -> bool:
+        """Loads an indexed .mzML file into the experiment without the peaks of the spectra outside of the retention time
+        windows, which are added with their metadata only. This is not an on-disk access mode: the spectra inside of the
+        windows are copied into memory one by one through the index, which is slower than load_mzml. Only the peaks
+        outside of the windows are saved, without windows nothing is loaded and load_mzml has to be used.
+
+        Args:
+            rt_range (tuple[float, float], optional): only read spectra in this retention time range. Defaults to None.
 
-    def load_mzml(self):
-        oms.MzMLFile().load(self.filename, self.exp)
+        Returns:
+            bool: False if no retention time windows are set or the file has no index, the file was then not loaded.
+        """
+        windows = np.array(
+            self.settings["retention_time_filter"]["windows_s"], dtype=float
+        ).reshape(-1, 2)
+        if len(windows) == 0:
+            return False
+
+        on_disk_exp = oms.OnDiscMSExperiment()
+        if not on_disk_exp.openFile(self.filename, False):
+            return False
+
+        ms_levels = self.settings["mzml_loading"]["ms_levels"]
+
+        for index, spectrum in enumerate(on_disk_exp.getMetaData().getSpectra()):
+            retention_time = spectrum.getRT()
+            if spectrum.getMSLevel() not in ms_levels or (
+                rt_range is not None
+                and not rt_range[0] <= retention_time <= rt_range[1]
+            ):
+                continue
+            if (
+                (windows[:, 0] <= retention_time) & (retention_time <= windows[:, 1])
+            ).any():
+                spectrum = on_disk_exp.getSpectrum(index)
+            self.exp.addSpectrum(spectrum)
+        return True
+
+    @profiled()
+    def load_mzml(self, rt_range: tuple[float, float] = None):
+        """Loads the .mzML file into the experiment, using the filters of the "mzml_loading" settings.
+
+        Args:
+            rt_range (tuple[float, float], optional): only load spectra in this retention time range, e.g. of a partition. Defaults to None.
+
+        Returns:
+            oms.MSExperiment: experiment containing the loaded spectra.
+        """
+        if not (
+            self.settings["mzml_loading"]["on_disk"]
+            and self.load_mzml_on_disk(rt_range)
+        ):
+            self.get_mzml_file(rt_range).load(self.filename, self.exp)
         self.exp.sortSpectra(True)
         self.exp_loaded = True
         return self.exp
 
+    def get_experiment(self) -> oms.MSExperiment:
+        """Experiment of the .mzML file, loaded on first use. Runs with cached results do not load the file, it is
+        only loaded if e.g. MS2 mapping or the export of MS2 spectra need it.
+
+        Returns:
+            oms.MSExperiment: experiment containing the loaded spectra.
+        """
+        if not self.exp_loaded:
+            self.load_mzml()
+        return self.exp
+
+    @profiled()
     def load_mzml_fromBuffer(self, mzml_string: str):
-        oms.MzMLFile().loadBuffer(mzml_string, self.exp)
+        if (
+            self.checkpoint_store is not None
+            or self.settings["result_cache"]["size"] > 0
+        ):
+            self.mzml_hash = CheckpointStore.hash_value(mzml_string)
+        self.get_mzml_file().loadBuffer(mzml_string, self.exp)
         self.exp.sortSpectra(True)
         self.exp_loaded = True
         return self.exp
 
+    @staticmethod
+    def get_peak_windows(
+        peak_list: list[Peak.Peak], window_s: float, bias_s: float, margin_s: float = 30
+    ) -> list[list[float]]:
+        """Retention time windows in which the ActivityAnnotator looks for features of the activity peaks, widened by a
+        margin so that features at the borders of a window are found with their entire chromatogram. Overlapping
+        windows are merged.
+
+        Args:
+            peak_list (list[Peak.Peak]): activity peaks from the ActivityPeakDetector
+            window_s (float): retention time window of the ActivityAnnotator in seconds
+            bias_s (float): retention time bias of the ActivityAnnotator in seconds
+            margin_s (float, optional): margin added to both sides of each window in seconds. Defaults to 30.
+
+        Returns:
+            list[list[float]]: start and end of each window in seconds, sorted by start.
+        """
+        windows = []
+        for start, end in sorted(
+            (
+                peak.retention_time + bias_s - window_s - margin_s,
+                peak.retention_time + bias_s + window_s + margin_s,
+            )
+            for peak in peak_list
+        ):
+            if len(windows) > 0 and start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], end)
+            else:
+                windows.append([start, end])
+        return windows
+
+    @profiled()
+    def filter_retention_times(self, windows: list[list[float]]):
+        """Removes the peaks of all spectra outside of the given retention time windows. Empty spectra are kept, so that
+        mass traces are not connected across the removed retention times.
+
+        Args:
+            windows (list[list[float]]): start and end of each window in seconds
+        """
+        windows = np.array(windows, dtype=float).reshape(-1, 2)
+        spectra = self.exp.getSpectra()
+        retention_times = np.array([spectrum.getRT() for spectrum in spectra])
+        inside = (
+            (retention_times[:, None] >= windows[:, 0])
+            & (retention_times[:, None] <= windows[:, 1])
+        ).any(axis=1)
+
+        for spectrum, keep in zip(spectra, inside):
+            if not keep:
+                spectrum.clear(False)
+        self.exp.setSpectra(spectra)
+        profiler.add_metadata(spectra=len(spectra), kept_spectra=int(inside.sum()))
+
+    @profiled()
     def mass_trace_detection(self, mass_error_ppm: float, noise_threshold: float):
         """Mass trace detection using pyopenms, implemented from "https://pyopenms.readthedocs.io/en/latest/user_guide/feature_detection.html"
 
@@ -82,6 +334,7 @@ class FeatureFinder:
         mtd.run(self.exp, mass_traces, 0)
         return mass_traces
 
+    @profiled()
     def elution_peak_detection(
         self, mass_traces: list, min_fwhm: float, max_fwhm: float
     ):
@@ -106,6 +359,7 @@ class FeatureFinder:
 
         return mass_traces_final
 
+    @profiled()
     def feature_finding(self, mass_traces: list):
         """Feature finding using the featurefindermetabo from pyopenms, implemented from https://pyopenms.readthedocs.io/en/latest/user_guide/feature_detection.html
 
@@ -128,78 +382,95 @@ class FeatureFinder:
         ffm_params.setValue("report_chromatograms", "true")
         ffm.setParameters(ffm_params)
         ffm.run(mass_traces, feature_map, feature_chromatograms)
+        profiler.add_metadata(mass_traces=len(mass_traces), features=feature_map.size())
 
         feature_map.setPrimaryMSRunPath([self.filename.encode()])
 
         return feature_map, feature_chromatograms
 
+    @profiled()
     def assign_chromatograms(
         self, feature_map: oms.FeatureMap, feature_chromatograms: list
     ):
-        """Assigns the chromatpgram of each feature to the metavalues "chrom_rts" and "chrom_intensities" of the feature map
+        """Assigns the monoisotopic chromatogram of each feature to its feature id in self.feature_chromatograms. The
+        chromatograms are stored as arrays, use export_chromatograms to add them to a feature map as metavalues.
 
         Args:
             feature_map (oms.FeatureMap): feature map containing features
             feature_chromatograms (list): list of chromatograms of feature. feature ids have to match the ones in the feature map
 
         Returns:
-            oms.FeatureMap: feature map containing the chromatograms as meta values.
+            oms.FeatureMap: feature map with new unique ids, matching the keys of self.feature_chromatograms.
         """
         assert feature_map.size() == len(
             feature_chromatograms
         ), "Size of feature map does not match list of chromatograms"
 
-        feature_map_chroms = oms.FeatureMap(feature_map)
-        feature_map_chroms.clear(False)
-
-        for feature in feature_map:
-            # get the matching monoisotopic chromatogram
-            match = [
-                c[0]
-                for c in feature_chromatograms
-                if int(c[0].getName().split("_")[0]) == feature.getUniqueId()
-            ][0]
-            rts, ints = match.get_peaks()
-            feature.setMetaValue("chrom_rts", ",".join(rts.astype(str)))
-            feature.setMetaValue("chrom_intensities", ",".join(ints.astype(str)))
-            feature_map_chroms.push_back(feature)
+        # Monoisotopic chromatogram of each feature, indexed once by the unique id in its name "<unique id>_<trace>".
+        monoisotopic_chroms = {
+            int(chroms[0].getName().split("_")[0]): chroms[0]
+            for chroms in feature_chromatograms
+        }
 
+        # The copy gets new unique ids, its features are in the same order as the original ones.
+        feature_map_chroms = oms.FeatureMap(feature_map)
         feature_map_chroms.setUniqueIds()
 
+        feature_ids, chromatograms = [], []
+        for feature, feature_copy in zip(feature_map, feature_map_chroms):
+            feature_ids.append(str(feature_copy.getUniqueId()))
+            chromatograms.append(monoisotopic_chroms[feature.getUniqueId()].get_peaks())
+
         self.feature_map = feature_map_chroms
+        self.feature_chromatograms = (
+            FeatureChromatograms.FeatureChromatograms.from_arrays(
+                feature_ids, chromatograms
+            )
+        )
 
         return feature_map_chroms
 
-    def get_feature_traces(self, feature_map: oms.FeatureMap = None):
-        """Get a dictionary of dataframes containing the feature traces of each feature in the feature map, can only be used after the assign_chromatograms method has been called.
+    @profiled()
+    def get_feature_traces(
+        self, feature_map: oms.FeatureMap = None
+    ) -> FeatureChromatograms.FeatureChromatograms:
+        """Get the feature traces of each feature, can only be used after the assign_chromatograms method has been called.
 
         Args:
-            feature_map (oms.FeatureMap, optional): Feature map to get the traces from, if none use the instances feature map. Defaults to None.
+            feature_map (oms.FeatureMap, optional): Feature map with chromatograms as metavalues (see export_chromatograms) to get the traces from, if none use the traces of this instance. Defaults to None.
 
         Returns:
-            dict: dictionary of feature traces, key is the feature id and value is a dataframe.
+            FeatureChromatograms: mapping of feature ids to dataframes with the columns "rt" and "int".
         """
-        if feature_map is None:
-            feature_map = self.feature_map
+        if feature_map is not None:
+            return FeatureChromatograms.FeatureChromatograms.from_feature_map(
+                feature_map
+            )
 
         assert (
-            len(feature_map[0].getMetaValue("chrom_rts")) > 0
+            self.feature_chromatograms is not None
         ), "Please assign chromatograms to the featuremap first!"
-        feature_traces = {
-            str(f.getUniqueId()): pd.DataFrame(
-                {
-                    "rt": [float(rt) for rt in f.getMetaValue("chrom_rts").split(",")],
-                    "int": [
-                        float(intensity)
-                        for intensity in f.getMetaValue("chrom_intensities").split(",")
-                    ],
-                }
-            )
-            for f in feature_map
-        }
-        return feature_traces
+        return self.feature_chromatograms
+
+    def export_chromatograms(
+        self, feature_map: oms.FeatureMap = None
+    ) -> oms.FeatureMap:
+        """Copy of the feature map with the chromatogram of each feature as comma separated strings in the metavalues
+        "chrom_rts" and "chrom_intensities", e.g. to store it as .featureXML file.
+
+        Args:
+            feature_map (oms.FeatureMap, optional): Feature map to export, if none use the instances feature map. Defaults to None.
+
+        Returns:
+            oms.FeatureMap: feature map containing the chromatograms as meta values.
+        """
+        if feature_map is None:
+            feature_map = self.feature_map
+
+        return self.get_feature_traces().to_feature_map(feature_map)
 
-    def map_ms2_to_features(self):
+    @profiled()
+    def map_ms2_to_features(self, feature_map: oms.FeatureMap = None):
         """
         ## Description
         Implemented algorithm for mapping ms2 data to features from pyopenms https://pyopenms.readthedocs.io/en/latest/user_guide/untargeted_metabolomics_preprocessing.html
@@ -211,8 +482,10 @@ class FeatureFinder:
         |Parameter|Type|Description|
         |---|---|---|
         |exp|MSExperiment|pyOpenMS MSExperiment class with a loaded mzml file|
-        |fm|oms.FeatureMap|Featuremap instance from feature finding|
+        |feature_map|oms.FeatureMap|Featuremap instance from feature finding, if None the instances feature map is used|
         """
+        if feature_map is None:
+            feature_map = self.feature_map
 
         use_centroid_rt = False
         use_centroid_mz = True
@@ -221,14 +494,17 @@ class FeatureFinder:
         protein_ids = []
 
         mapper.annotate(
-            self.feature_map,
+            feature_map,
             peptide_ids,
             protein_ids,
             use_centroid_rt,
             use_centroid_mz,
-            self.exp,
+            self.get_experiment(),
         )
+        if feature_map is self.feature_map:
+            self.feature_map_version += 1
 
+    @profiled()
     def adduct_detection(
         self,
         feature_map: oms.MSExperiment = None,
@@ -266,8 +542,8 @@ class FeatureFinder:
         params.setValue("charge_min", 1, "Minimal possible charge")
         params.setValue("charge_max", 3, "Maximal possible charge")
         params.setValue("charge_span_max", 3)
-        params.setValue("retention_max_diff", 3.0)
-        params.setValue("retention_max_diff_local", 3.0)
+        params.setValue("retention_max_diff", self.adduct_retention_max_diff_s)
+        params.setValue("retention_max_diff_local", self.adduct_retention_max_diff_s)
         mfd.setParameters(params)
 
         feature_map_MFD = oms.FeatureMap()
@@ -279,24 +555,149 @@ class FeatureFinder:
         self.consensus_map = groups
         return feature_map_MFD, groups
 
+    @profiled()
+    def annotate_features(self, feature_ids: list[str]) -> pd.DataFrame:
+        """Maps MS2 spectra and detects adducts only for the given features, e.g. the features correlated to activity
+        peaks, if both steps were deferred during feature finding. Features within the maximum retention time
+        difference of adduct detection to any given feature are included, so that their adduct groups are complete.
+        The annotated features replace their unannotated versions in self.feature_map, the consensus map contains
+        their adduct groups.
+
+        Args:
+            feature_ids (list[str]): ids of the features to annotate
+
+        Returns:
+            pd.DataFrame: feature table of all features.
+        """
+        assert (
+            self.unannotated_feature_map is not None
+        ), "Run feature finding with deferred post processing first!"
+
+        source_map = self.unannotated_feature_map
+        feature_table = (
+            self.get_feature_table()
+            if source_map is self.feature_map
+            else source_map.get_df(export_peptide_identifications=False)
+        )
+        selected_rts = np.sort(
+            feature_table.loc[list(feature_ids), "RT"].to_numpy(dtype=float)
+        )
+        if len(selected_rts) == 0:
+            self.feature_map = source_map
+            self.consensus_map = oms.ConsensusMap()
+            return self.get_feature_table()
+
+        # Distance of each feature to the closest selected feature.
+        rts = feature_table["RT"].to_numpy(dtype=float)
+        positions = np.clip(np.searchsorted(selected_rts, rts), 1, len(selected_rts))
+        distances = np.minimum(
+            np.abs(rts - selected_rts[positions - 1]),
+            np.abs(rts - selected_rts[np.minimum(positions, len(selected_rts) - 1)]),
+        )
+        subset_ids = set(
+            feature_table.index[distances <= self.adduct_retention_max_diff_s]
+        )
+
+        subset_map = oms.FeatureMap(source_map)
+        subset_map.clear(False)
+        for feature in source_map:
+            if str(feature.getUniqueId()) in subset_ids:
+                subset_map.push_back(feature)
+        profiler.add_metadata(features=len(subset_ids))
+
+        self.map_ms2_to_features(subset_map)
+        # Targeted features have no charge, which adduct detection requires.
+        if len(self.settings["targeted_extraction"]["mz_list"]) > 0:
+            annotated_map, self.consensus_map = subset_map, oms.ConsensusMap()
+        else:
+            annotated_map, self.consensus_map = self.adduct_detection(
+                subset_map,
+                adduct_list=list(self.settings["adduct_detection"]["adduct_list"]),
+            )
+
+        annotated_features = {
+            feature.getUniqueId(): feature for feature in annotated_map
+        }
+        merged_map = oms.FeatureMap(source_map)
+        merged_map.clear(False)
+        for feature in source_map:
+            merged_map.push_back(annotated_features.get(feature.getUniqueId(), feature))
+        self.feature_map = merged_map
+
+        return self.get_feature_table()
+
+    @profiled()
     def get_feature_table(self):
-        """Get the feature table from the feature map saved in the instance of this class
+        """Get the feature table from the feature map saved in the instance of this class. The table is created once
+        per feature map and version, later calls return the same dataframe until self.feature_map is replaced (e.g. by
+        adduct detection) or changed in place. The table is shared, modify copies of it only.
 
         Returns:
             dataframe: feature table of the feature map
         """
         assert self.feature_map is not None, "Perform feature detection first!"
 
-        return self.feature_map.get_df(export_peptide_identifications=False)
+        if (
+            self._feature_table is None
+            or self._feature_table[0] is not self.feature_map
+            or self._feature_table[1] != self.feature_map_version
+        ):
+            self._feature_table = (
+                self.feature_map,
+                self.feature_map_version,
+                self.feature_map.get_df(export_peptide_identifications=False),
+            )
+        return self._feature_table[2]
 
-    def run(self):
-        """Performs the feature finding workflow of this class in its entirety using the settings defined in self.settings.
+    @staticmethod
+    def map_to_bytes(openms_map, file_class) -> bytes:
+        """Serializes a FeatureMap or ConsensusMap, which cannot be pickled, to the bytes of its xml file.
+
+        Args:
+            openms_map (oms.FeatureMap | oms.ConsensusMap): map to serialize
+            file_class (type): oms.FeatureXMLFile or oms.ConsensusXMLFile
 
         Returns:
-            dataframe: feature table of the .mzml file
+            bytes: content of the xml file.
         """
-        if not self.exp_loaded:
-            self.load_mzml()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, FeatureFinder.map_filenames[file_class])
+            file_class().store(path, openms_map)
+            with open(path, "rb") as file:
+                return file.read()
+
+    @staticmethod
+    def map_from_bytes(content: bytes, map_class, file_class):
+        """Restores a FeatureMap or ConsensusMap from the bytes of its xml file.
+
+        Args:
+            content (bytes): content of the xml file
+            map_class (type): oms.FeatureMap or oms.ConsensusMap
+            file_class (type): oms.FeatureXMLFile or oms.ConsensusXMLFile
+
+        Returns:
+            oms.FeatureMap | oms.ConsensusMap: restored map.
+        """
+        openms_map = map_class()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, FeatureFinder.map_filenames[file_class])
+            with open(path, "wb") as file:
+                file.write(content)
+            file_class().load(path, openms_map)
+        return openms_map
+
+    def detect_features(self) -> oms.FeatureMap:
+        """Performs mass trace detection, elution peak detection, feature finding and assigns the feature
+        chromatograms. If retention time windows are set, the peaks of all spectra outside of them are removed from the
+        experiment first.
+
+        Returns:
+            oms.FeatureMap: feature map, the feature chromatograms are stored in self.feature_chromatograms.
+        """
+        self.get_experiment()
+        windows = self.settings["retention_time_filter"]["windows_s"]
+        if len(windows) > 0:
+            self.filter_retention_times(windows)
 
         mass_traces = self.mass_trace_detection(
             self.settings["mass_trace_detection"]["mass_error_ppm"],
@@ -310,12 +711,361 @@ class FeatureFinder:
         )
 
         feature_map, feature_chromatograms = self.feature_finding(mass_traces_final)
-        self.assign_chromatograms(feature_map, feature_chromatograms)
+        return self.assign_chromatograms(feature_map, feature_chromatograms)
+
+    def get_retention_time_range(self) -> tuple[float, float]:
+        """Retention time range of the spectra of the MS levels to load. Unless the experiment is loaded already, it is
+        read from the spectrum metadata of the file, without loading the peaks.
+
+        Returns:
+            tuple[float, float]: retention times of the first and last spectrum.
+        """
+        if self.exp_loaded:
+            metadata = self.exp
+        else:
+            ms_levels = self.settings["mzml_loading"]["ms_levels"]
+            on_disk_exp = oms.OnDiscMSExperiment()
+            if on_disk_exp.openFile(self.filename, False):
+                retention_times = [
+                    spectrum.getRT()
+                    for spectrum in on_disk_exp.getMetaData().getSpectra()
+                    if spectrum.getMSLevel() in ms_levels
+                ]
+                return min(retention_times), max(retention_times)
+
+            # Files without an index are parsed without the peaks of the spectra.
+            mzml_file = self.get_mzml_file()
+            options = mzml_file.getOptions()
+            options.setFillData(False)
+            mzml_file.setOptions(options)
+            metadata = oms.MSExperiment()
+            mzml_file.load(self.filename, metadata)
+
+        metadata.updateRanges()
+        return metadata.getMinRT(), metadata.getMaxRT()
+
+    def get_partitions(self) -> list[tuple[tuple[float, float], tuple[float, float]]]:
+        """Splits the retention time range of the experiment into partitions of equal length.
+
+        Returns:
+            list[tuple[tuple[float, float], tuple[float, float]]]: retention time range of the spectra loaded for each
+            partition, including the overlap, and range of the retention times of the features kept from it.
+        """
+        partitions = self.settings["partitioning"]["partitions"]
+        overlap = self.settings["partitioning"]["overlap_s"]
+
+        edges = np.linspace(*self.get_retention_time_range(), partitions + 1)
+        # Features before the first and after the last edge belong to the first and last partition.
+        feature_edges = np.concatenate([[-np.inf], edges[1:-1], [np.inf]])
+
+        return [
+            (
+                (float(edges[i] - overlap), float(edges[i + 1] + overlap)),
+                (float(feature_edges[i]), float(feature_edges[i + 1])),
+            )
+            for i in range(partitions)
+        ]
+
+    @profiled()
+    def detect_features_partitioned(self) -> oms.FeatureMap:
+        """Detects features in all partitions of the retention time range concurrently on a pool of worker processes
+        (see detect_features_in_partition) and merges them. The file is only loaded by the workers, each loads the
+        spectra of its partition. Each feature is only kept by the partition containing its
+        retention time, features detected in the overlap of two partitions are therefore not duplicated.
+
+        Returns:
+            oms.FeatureMap: feature map, the feature chromatograms are stored in self.feature_chromatograms.
+        """
+        assert os.path.exists(
+            self.filename
+        ), "Partitioned feature finding reads the .mzML file in each worker, load it from a file."
+
+        partitions = self.get_partitions()
+        workers = min(
+            len(partitions), self.settings["partitioning"]["workers"], os.cpu_count()
+        )
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    detect_features_in_partition,
+                    self.filename,
+                    self.settings,
+                    load_range,
+                    feature_range,
+                )
+                for load_range, feature_range in partitions
+            ]
+            results = [future.result() for future in futures]
+
+        feature_map = oms.FeatureMap()
+        feature_ids, chromatograms = [], []
+        for feature_xml, partition_chromatograms in results:
+            for feature in self.map_from_bytes(
+                feature_xml, oms.FeatureMap, oms.FeatureXMLFile
+            ):
+                feature_map.push_back(feature)
+            feature_ids += list(partition_chromatograms)
+            chromatograms += [
+                partition_chromatograms.get_arrays(feature_id)
+                for feature_id in partition_chromatograms
+            ]
+        feature_map.setPrimaryMSRunPath([self.filename.encode()])
+        profiler.add_metadata(
+            partitions=len(partitions), workers=workers, features=feature_map.size()
+        )
+
+        self.feature_map = feature_map
+        self.feature_chromatograms = (
+            FeatureChromatograms.FeatureChromatograms.from_arrays(
+                feature_ids, chromatograms
+            )
+        )
+        return feature_map
+
+    @profiled()
+    def extract_ion_chromatograms(
+        self, mz_list: list[float], mass_error_ppm: float
+    ) -> tuple[np.array, np.array]:
+        """Extracts the ion chromatograms of all m/z values in a single pass over the MS1 spectra. The peaks within the
+        mass error of all m/z values are found by binary search in each sorted spectrum.
+
+        Args:
+            mz_list (list[float]): m/z values to extract
+            mass_error_ppm (float): mass error in ppm around each m/z value
+
+        Returns:
+            tuple[np.array, np.array]: retention times of the MS1 spectra and the summed intensities within the mass
+            error, with one row per m/z value and one column per spectrum.
+        """
+        targets = np.asarray(mz_list, dtype=np.float64)
+        lower = targets * (1 - mass_error_ppm * 1e-6)
+        upper = targets * (1 + mass_error_ppm * 1e-6)
+
+        retention_times, intensities = [], []
+        for spectrum in self.get_experiment():
+            if spectrum.getMSLevel() != 1:
+                continue
+            if not spectrum.isSorted():
+                spectrum.sortByPosition()
+            mz, intensity = spectrum.get_peaks()
+            # Sums of all peaks between the bounds as differences of the cumulative intensity.
+            cumulative = np.concatenate([[0.0], np.cumsum(intensity, dtype=np.float64)])
+            intensities.append(
+                cumulative[np.searchsorted(mz, upper, side="right")]
+                - cumulative[np.searchsorted(mz, lower, side="left")]
+            )
+            retention_times.append(spectrum.getRT())
+
+        assert len(retention_times) > 0, "The experiment does not contain MS1 spectra."
+
+        return (
+            np.array(retention_times),
+            np.array(intensities).reshape(len(retention_times), len(targets)).T,
+        )
+
+    @profiled()
+    def targeted_feature_finding(self) -> oms.FeatureMap:
+        """Creates a feature for each m/z value of the "targeted_extraction" settings from its ion chromatogram. A
+        feature spans the contiguous retention times around the apex with intensities above the boundary fraction of
+        the apex intensity, m/z values without signal in at least two spectra are skipped.
+
+        Returns:
+            oms.FeatureMap: feature map, the feature chromatograms are stored in self.feature_chromatograms.
+        """
+        settings = self.settings["targeted_extraction"]
+        retention_times, ion_chromatograms = self.extract_ion_chromatograms(
+            settings["mz_list"], settings["mass_error_ppm"]
+        )
+
+        feature_map = oms.FeatureMap()
+        chromatograms = []
+        for mz, intensities in zip(settings["mz_list"], ion_chromatograms):
+            apex = np.argmax(intensities)
+            if intensities[apex] <= 0:
+                continue
+
+            below = np.flatnonzero(
+                intensities < intensities[apex] * settings["boundary_fraction"]
+            )
+            before, after = below[below < apex], below[below > apex]
+            start = before[-1] + 1 if len(before) > 0 else 0
+            end = after[0] if len(after) > 0 else len(intensities)
+            if end - start < 2:
+                continue
+
+            tolerance = mz * settings["mass_error_ppm"] * 1e-6
+            hull = oms.ConvexHull2D()
+            hull.setHullPoints(
+                np.array(
+                    [
+                        [retention_times[start], mz - tolerance],
+                        [retention_times[end - 1], mz + tolerance],
+                    ],
+                    dtype=np.float32,
+                )
+            )
+
+            feature = oms.Feature()
+            feature.setMZ(mz)
+            feature.setRT(retention_times[apex])
+            feature.setIntensity(float(intensities[start:end].sum()))
+            feature.setConvexHulls([hull])
+            feature_map.push_back(feature)
+            chromatograms.append((retention_times[start:end], intensities[start:end]))
+
+        feature_map.setUniqueIds()
+        feature_map.setPrimaryMSRunPath([self.filename.encode()])
+        profiler.add_metadata(
+            targets=len(settings["mz_list"]), features=feature_map.size()
+        )
+
+        self.feature_map = feature_map
+        self.feature_chromatograms = (
+            FeatureChromatograms.FeatureChromatograms.from_arrays(
+                [str(feature.getUniqueId()) for feature in feature_map], chromatograms
+            )
+        )
+        return feature_map
+
+    def find_features(self):
+        """Performs mass trace detection, elution peak detection, feature finding, ms2 mapping and adduct detection
+        using the settings defined in self.settings. Deferred MS2 mapping and adduct detection are skipped, the
+        consensus map is then empty until annotate_features is called. If m/z values are given for targeted
+        extraction, their ion chromatograms replace mass trace detection, elution peak detection and feature finding
+        and adduct detection is skipped.
+
+        Returns:
+            tuple[oms.FeatureMap, oms.ConsensusMap]: feature map and the consensus map of adduct groups. The feature chromatograms are stored in self.feature_chromatograms.
+        """
+        if len(self.settings["targeted_extraction"]["mz_list"]) > 0:
+            self.targeted_feature_finding()
+        elif self.settings["partitioning"]["partitions"] > 1:
+            self.detect_features_partitioned()
+        else:
+            self.detect_features()
+
+        if self.settings["post_processing"]["deferred"]:
+            self.consensus_map = oms.ConsensusMap()
+            return self.feature_map, self.consensus_map
 
         self.map_ms2_to_features()
 
-        self.adduct_detection(
-            adduct_list=self.settings["adduct_detection"]["adduct_list"]
+        # Targeted features have no charge, which adduct detection requires.
+        if len(self.settings["targeted_extraction"]["mz_list"]) > 0:
+            self.consensus_map = oms.ConsensusMap()
+        else:
+            self.adduct_detection(
+                adduct_list=list(self.settings["adduct_detection"]["adduct_list"])
+            )
+
+        return self.feature_map, self.consensus_map
+
+    @profiled()
+    def load_cached_result(self, key: str) -> bool:
+        """Loads the feature map, consensus map and feature chromatograms of a previous run from the result cache. The
+        maps are copies, later changes (e.g. by annotate_features) do not alter the cached result.
+
+        Args:
+            key (str): hash of the .mzML file and the settings
+
+        Returns:
+            bool: True if the result was found.
+        """
+        with self._result_cache_lock:
+            result = self.result_cache.get(key)
+            if result is not None:
+                self.result_cache.move_to_end(key)
+        # Same key as the hits of the CheckpointStore, so that the hits of both caches are counted.
+        profiler.add_metadata(cache_hit=result is not None)
+        if result is None:
+            return False
+
+        feature_map, consensus_map, self.feature_chromatograms = result
+        self.feature_map = oms.FeatureMap(feature_map)
+        self.consensus_map = oms.ConsensusMap(consensus_map)
+        return True
+
+    def store_cached_result(self, key: str):
+        """Adds copies of the feature map and consensus map and the feature chromatograms to the result cache and drops
+        the least recently used results.
+
+        Args:
+            key (str): hash of the .mzML file and the settings
+        """
+        with self._result_cache_lock:
+            self.result_cache[key] = (
+                oms.FeatureMap(self.feature_map),
+                oms.ConsensusMap(self.consensus_map),
+                self.feature_chromatograms,
+            )
+            self.result_cache.move_to_end(key)
+            while len(self.result_cache) > self.settings["result_cache"]["size"]:
+                self.result_cache.popitem(last=False)
+
+    def get_result_settings(self) -> dict:
+        """Settings that change the results of feature finding, used in the keys of cached results.
+
+        Returns:
+            dict: all settings except the size of the result cache.
+        """
+        return {
+            group: settings
+            for group, settings in self.settings.items()
+            if group != "result_cache"
+        }
+
+    @profiled()
+    def run(self):
+        """Performs the feature finding workflow of this class in its entirety using the settings defined in self.settings.
+        Results of unchanged .mzML files and settings are loaded from the result cache of this process or from the
+        checkpoint store instead of being recomputed, the .mzML file is then not loaded (see get_experiment).
+
+        Returns:
+            dataframe: feature table of the .mzml file
+        """
+        cache_size = self.settings["result_cache"]["size"]
+        if self.mzml_hash is None and (
+            self.checkpoint_store is not None or cache_size > 0
+        ):
+            self.mzml_hash = CheckpointStore.hash_value(Path(self.filename))
+
+        key = CheckpointStore.hash_value(
+            ["feature_finding", self.mzml_hash, self.get_result_settings()]
         )
+        if not (cache_size > 0 and self.load_cached_result(key)):
+            if self.checkpoint_store is None:
+                self.find_features()
+            else:
+
+                def compute():
+                    feature_map, consensus_map = self.find_features()
+                    return (
+                        self.map_to_bytes(feature_map, oms.FeatureXMLFile),
+                        self.map_to_bytes(consensus_map, oms.ConsensusXMLFile),
+                        self.feature_chromatograms,
+                    )
 
+                store_key = self.checkpoint_store.make_key(
+                    "feature_finding",
+                    FeatureFinder,
+                    self.mzml_hash,
+                    self.get_result_settings(),
+                )
+                feature_xml, consensus_xml, self.feature_chromatograms = (
+                    self.checkpoint_store.cached(store_key, compute, "feature_finding")
+                )
+                self.feature_map = self.map_from_bytes(
+                    feature_xml, oms.FeatureMap, oms.FeatureXMLFile
+                )
+                self.consensus_map = self.map_from_bytes(
+                    consensus_xml, oms.ConsensusMap, oms.ConsensusXMLFile
+                )
+
+            if cache_size > 0:
+                self.store_cached_result(key)
+
+        # Feature map for annotate_features, MS2 mapping and adduct detection are performed on copies of its features.
+        self.unannotated_feature_map = (
+            self.feature_map if self.settings["post_processing"]["deferred"] else None
+        )
         return self.get_feature_table()
@@ -0,0 +1,246 @@
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+import pyopenms as oms
+from scipy import sparse
+
+import src.microspotreader.feature_annotation.Peak as Peak
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
+
+
+class MS1Correlator:
+    """Correlates the extracted ion chromatograms of all m/z values of the MS1 spectra with activity peaks, without
+    feature finding. The spectra are binned once into a sparse retention time x m/z intensity matrix, the traces of
+    all m/z bins are then correlated with all activity peaks at once by sparse matrix products. The result is a ranked
+    list of candidate m/z values for each activity peak, e.g. to screen a run before or instead of feature finding.
+    """
+
+    settings: Settings = Settings(
+        {
+            # Bins have a constant width relative to their m/z, peaks below the intensity threshold are ignored.
+            "binning": {"bin_width_ppm": 10.0, "intensity_threshold": 0.0},
+            # Only bins with signal in at least minimum_points spectra of the peak window are ranked.
+            "correlation": {
+                "bias_s": 0,
+                "minimum_points": 3,
+                "minimum_correlation": 0.8,
+                "candidates_per_peak": 20,
+            },
+        }
+    )
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    def __init__(
+        self,
+        exp: oms.MSExperiment,
+        peak_list: list[Peak.Peak],
+        activity_table: pd.DataFrame,
+    ) -> None:
+        """
+        Args:
+            exp (oms.MSExperiment): experiment with the loaded .mzML file.
+            peak_list (list[Peak.Peak]): activity peaks of the ActivityPeakDetector.
+            activity_table (pd.DataFrame): activity table with the columns "RT" and "spot_intensity".
+        """
+        self.exp = exp
+        self.peak_list = peak_list
+        self.activity_table = activity_table
+
+        self.retention_times: np.array = None
+        self.bin_mz: np.array = None
+        self.intensity_matrix: sparse.csc_matrix = None
+        self.correlation_table: pd.DataFrame = None
+
+    @profiled()
+    def build_matrix(self) -> sparse.csc_matrix:
+        """Bins the peaks of all MS1 spectra into a sparse matrix with one row per spectrum and one column per occupied
+        m/z bin. The m/z of each bin is the intensity weighted mean m/z of its peaks.
+
+        Returns:
+            sparse.csc_matrix: summed intensities of each spectrum and m/z bin.
+        """
+        bin_width = np.log1p(self.settings["binning"]["bin_width_ppm"] * 1e-6)
+        threshold = self.settings["binning"]["intensity_threshold"]
+
+        retention_times, rows, mzs, intensities = [], [], [], []
+        for spectrum in self.exp:
+            if spectrum.getMSLevel() != 1:
+                continue
+            mz, intensity = spectrum.get_peaks()
+            above = intensity > threshold
+            rows.append(np.full(above.sum(), len(retention_times)))
+            mzs.append(mz[above])
+            intensities.append(intensity[above])
+            retention_times.append(spectrum.getRT())
+
+        assert len(retention_times) > 0, "The experiment does not contain MS1 spectra."
+
+        rows = np.concatenate(rows)
+        mzs = np.concatenate(mzs)
+        intensities = np.concatenate(intensities).astype(np.float64)
+        # Only occupied bins become columns of the matrix.
+        bins, columns = np.unique(
+            np.floor(np.log(mzs) / bin_width).astype(np.int64), return_inverse=True
+        )
+
+        self.retention_times = np.array(retention_times, dtype=np.float64)
+        self.bin_mz = np.bincount(
+            columns, weights=intensities * mzs, minlength=len(bins)
+        ) / np.bincount(columns, weights=intensities, minlength=len(bins))
+        # Duplicate entries of the same spectrum and bin are summed.
+        self.intensity_matrix = sparse.csc_matrix(
+            (intensities, (rows, columns)), shape=(len(retention_times), len(bins))
+        )
+
+        profiler.add_metadata(
+            spectra=len(retention_times),
+            bins=len(bins),
+            nonzero=self.intensity_matrix.nnz,
+        )
+        return self.intensity_matrix
+
+    def get_window_matrices(self) -> tuple[sparse.csr_matrix, sparse.csr_matrix]:
+        """Window and activity chromatogram of each peak on the retention times of the MS1 spectra. The window of a
+        peak spans from its start to its end, shifted by the bias.
+
+        Returns:
+            tuple[sparse.csr_matrix, sparse.csr_matrix]: matrices with one row per peak and one column per spectrum,
+            containing ones for the spectra inside the window of the peak and the interpolated activity at these
+            spectra.
+        """
+        bias = self.settings["correlation"]["bias_s"]
+        activity_rt = self.activity_table.RT.to_numpy(dtype=np.float64)
+        activity = self.activity_table.spot_intensity.to_numpy(dtype=np.float64)
+
+        # The empty arrays keep the concatenation valid if there are no peaks.
+        rows, columns, values = (
+            [np.empty(0, dtype=np.int64)],
+            [np.empty(0, dtype=np.int64)],
+            [np.empty(0)],
+        )
+        for row, peak in enumerate(self.peak_list):
+            start, end = np.searchsorted(
+                self.retention_times,
+                [peak.start_RT + bias, peak.end_RT + bias],
+                side="left",
+            )
+            window = np.arange(start, end)
+            rows.append(np.full(len(window), row))
+            columns.append(window)
+            values.append(
+                np.interp(self.retention_times[window] - bias, activity_rt, activity)
+            )
+
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        shape = (len(self.peak_list), len(self.retention_times))
+        window_matrix = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)), shape=shape
+        )
+        activity_matrix = sparse.csr_matrix(
+            (np.concatenate(values), (rows, columns)), shape=shape
+        )
+        return window_matrix, activity_matrix
+
+    @profiled()
+    def correlate(self) -> pd.DataFrame:
+        """Pearson correlation of the trace of each m/z bin with the activity chromatogram in the window of each peak.
+        The sums of the correlation coefficients are computed for all peaks and bins at once by sparse matrix
+        products, only bins with signal inside a window are evaluated.
+
+        Returns:
+            pd.DataFrame: peak number, bin m/z, correlation and number of spectra with signal of each peak and bin, empty
+            if there are no peaks.
+        """
+        if len(self.peak_list) == 0:
+            self.correlation_table = pd.DataFrame(
+                {
+                    "peak": pd.Series(dtype=np.int64),
+                    "mz": pd.Series(dtype=np.float64),
+                    "correlation": pd.Series(dtype=np.float64),
+                    "points": pd.Series(dtype=np.int64),
+                }
+            )
+            return self.correlation_table
+
+        if self.intensity_matrix is None:
+            self.build_matrix()
+
+        window_matrix, activity_matrix = self.get_window_matrices()
+        traces = self.intensity_matrix
+
+        points = np.asarray(window_matrix.sum(axis=1)).ravel()
+        sum_activity = np.asarray(activity_matrix.sum(axis=1)).ravel()
+        sum_activity_squared = np.asarray(
+            activity_matrix.multiply(activity_matrix).sum(axis=1)
+        ).ravel()
+
+        # All sums share the sparsity pattern of the summed traces: bins with signal inside the window.
+        sum_traces = (window_matrix @ traces).tocoo()
+        peak_rows, bin_columns = sum_traces.row, sum_traces.col
+        sum_squared = np.asarray(
+            (window_matrix @ traces.multiply(traces))[peak_rows, bin_columns]
+        ).ravel()
+        sum_products = np.asarray(
+            (activity_matrix @ traces)[peak_rows, bin_columns]
+        ).ravel()
+        signal_points = np.asarray(
+            (window_matrix @ (traces > 0).astype(np.float64))[peak_rows, bin_columns]
+        ).ravel()
+
+        n = points[peak_rows]
+        covariance = n * sum_products - sum_activity[peak_rows] * sum_traces.data
+        variance_activity = (
+            n * sum_activity_squared[peak_rows] - sum_activity[peak_rows] ** 2
+        )
+        variance_traces = n * sum_squared - sum_traces.data**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = covariance / np.sqrt(variance_activity * variance_traces)
+
+        self.correlation_table = pd.DataFrame(
+            {
+                "peak": np.array([peak.number for peak in self.peak_list])[peak_rows],
+                "mz": self.bin_mz[bin_columns],
+                "correlation": correlation,
+                "points": signal_points.astype(np.int64),
+            }
+        )
+        profiler.add_metadata(pairs=len(self.correlation_table))
+        return self.correlation_table
+
+    def get_candidates(self) -> pd.DataFrame:
+        """Ranks the m/z bins of each peak by their correlation.
+
+        Returns:
+            pd.DataFrame: peak number, m/z, correlation and rank of the best correlated bins of each peak, with at least
+            the minimum correlation and signal in at least the minimum number of spectra.
+        """
+        assert self.correlation_table is not None, "Perform the correlation first!"
+
+        settings = self.settings["correlation"]
+        candidates = self.correlation_table.loc[
+            (self.correlation_table.points >= settings["minimum_points"])
+            & (self.correlation_table.correlation >= settings["minimum_correlation"])
+        ].sort_values(["peak", "correlation"], ascending=[True, False])
+        candidates = candidates.groupby("peak").head(settings["candidates_per_peak"])
+        candidates["rank"] = candidates.groupby("peak").cumcount() + 1
+        return candidates.reset_index(drop=True)
+
+    @profiled()
+    def run(self) -> pd.DataFrame:
+        """Correlates all m/z bins with all activity peaks. The intensity matrix is only built on the first run, later
+        runs, e.g. with another peak list or bias, reuse it.
+
+        Returns:
+            pd.DataFrame: ranked candidate m/z values of each peak, see get_candidates.
+        """
+        self.correlate()
+        return self.get_candidates()
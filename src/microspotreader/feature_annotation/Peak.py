@@ -1,8 +1,6 @@
 from dataclasses import dataclass, field
 
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
 
 
 @dataclass
@@ -34,6 +32,9 @@ class Peak:
         significance: float = 0.8,
     ):
 
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         feature_list = sorted(
             list(zip(self.correlated_feature_ids, self.correlation_coeff_features)),
             key=lambda x: x[1],
@@ -2,8 +2,6 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
-
 if TYPE_CHECKING:
     import src.microspotreader.grid_classes.GridLine as GridLine
     import src.microspotreader.grid_classes.GridPoint as GridPoint
@@ -21,6 +19,8 @@ class Grid:
         self.intersections = intersections
 
     def plot_image(self, image, ax=None):
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, ax = plt.subplots()
 
@@ -35,6 +35,8 @@ class Grid:
         ax.axis("off")
 
     def plot_lines(self, ax=None):
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, ax = plt.subplots()
 
@@ -45,6 +47,8 @@ class Grid:
             ax.axline((0, item.y_intersect), slope=item.slope, c="r")
 
     def plot_intersections(self, ax=None):
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, ax = plt.subplots()
 
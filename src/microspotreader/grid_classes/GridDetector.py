@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from typing import TYPE_CHECKING
 
 import numpy as np
@@ -7,37 +8,36 @@ from skimage.transform import hough_line, hough_line_peaks
 
 import src.microspotreader.grid_classes.Grid as Grid
 import src.microspotreader.grid_classes.GridLine as GridLine
+from src.microspotreader.Profiler import profiled
+from src.microspotreader.Settings import Settings
 
 if TYPE_CHECKING:
     import src.microspotreader.spot_classes.SpotList as SpotList
 
 
 class GridDetector:
-    settings = {
-        "line_detection": {
-            "maximum_tilt": 5,
-            "minimum_distance_px": 80,
-            "threshold": 0.2,
-        },
-        "spot_mask": {"spot_radius": 5},
-    }
+    settings: Settings = Settings(
+        {
+            "line_detection": {
+                "maximum_tilt": 5,
+                "minimum_distance_px": 80,
+                "threshold": 0.2,
+            },
+            "spot_mask": {"spot_radius": 5},
+        }
+    )
 
     def __init__(self, image: np.array, spot_list: SpotList.SpotList) -> None:
         self.spot_list = spot_list
         self.image = image
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
 
     def create_spot_mask(self, spot_radius: int = 5) -> np.array:
         """Creates a mask with the dimensions of the image in GridDetector that contains drawn disks of a specified radius at each spots position.
@@ -144,6 +144,7 @@ class GridDetector:
             intersections=intersections,
         )
 
+    @profiled()
     def detect_grid(self):
         """Runs through the entire grid detection workflow.
 
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+
+import numpy as np
+from scipy.spatial import cKDTree
+from skimage.draw import disk
+from skimage.registration import phase_cross_correlation
+from skimage.transform import SimilarityTransform, rescale
+
+import src.microspotreader.grid_classes.GridTemplate as GridTemplate
+import src.microspotreader.spot_classes.Spot as Spot
+import src.microspotreader.spot_classes.SpotDetector as SpotDetector
+import src.microspotreader.spot_classes.SpotList as SpotList
+from src.microspotreader.Profiler import profiled
+from src.microspotreader.Settings import Settings
+
+
+class GridRegistrator:
+    """Registers a GridTemplate to a new image of the same plate layout, using a quick spot detection on a downscaled
+    copy of the image."""
+
+    settings: Settings = Settings(
+        {
+            "coarse_detection": {"scale": 0.5},
+            "registration": {
+                "inlier_distance_px": 10,
+                "maximum_iterations": 30,
+                "minimum_confidence": 0.9,
+            },
+        }
+    )
+
+    def __init__(
+        self,
+        image: np.array,
+        template: GridTemplate.GridTemplate,
+        spot_detector_settings: Mapping = None,
+    ) -> None:
+        """
+        Args:
+            image (np.array): prepared image to register the template to.
+            template (GridTemplate): template of the plate layout.
+            spot_detector_settings (Mapping, optional): settings of the full resolution spot detection, they are scaled for the coarse detection. If None the default settings of the SpotDetector are used. Defaults to None.
+        """
+        self.image = image
+        self.template = template
+        self.spot_detector_settings = (
+            SpotDetector.SpotDetector.settings
+            if spot_detector_settings is None
+            else spot_detector_settings
+        )
+
+        self.spot_list = None
+        self.transform = None
+        self.confidence = 0.0
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    def coarse_detection(self, spot_nr: int) -> SpotList.SpotList:
+        """Detects spots in a downscaled copy of the image. Coordinates and radii of the returned spots are given in
+        the resolution of the original image.
+
+        Args:
+            spot_nr (int): Number of spots to be detected in the image.
+
+        Returns:
+            SpotList: List of coarsely detected spots.
+        """
+        scale = self.settings["coarse_detection"]["scale"]
+        edge_settings = self.spot_detector_settings["edge_detection"]
+        circle_settings = self.spot_detector_settings["circle_detection"]
+
+        def scaled(value):
+            return max(1, int(round(value * scale)))
+
+        spot_detector = SpotDetector.SpotDetector(
+            rescale(self.image, scale, anti_aliasing=True)
+        )
+        spot_detector.change_settings_dict(
+            {
+                "edge_detection": {
+                    "sigma": max(1.0, edge_settings["sigma"] * scale),
+                    "low_threshold": edge_settings["low_threshold"],
+                    "high_threshold": edge_settings["high_threshold"],
+                },
+                "circle_detection": {
+                    "min_distance_px_x": scaled(circle_settings["min_distance_px_x"]),
+                    "min_distance_px_y": scaled(circle_settings["min_distance_px_y"]),
+                    "smallest_radius_px": scaled(circle_settings["smallest_radius_px"]),
+                    "largest_radius_px": scaled(circle_settings["largest_radius_px"]),
+                    "detection_threshold": circle_settings["detection_threshold"],
+                },
+            }
+        )
+        coarse_spots = spot_detector.initial_detection(spot_nr)
+
+        self.spot_list = SpotList.SpotList(
+            *[
+                Spot.Spot(
+                    x=int(round(spot.x / scale)),
+                    y=int(round(spot.y / scale)),
+                    radius=int(round(spot.radius / scale)),
+                    note="Initial Detection",
+                )
+                for spot in coarse_spots
+            ]
+        )
+        return self.spot_list
+
+    def estimate_translation(self, points: np.array) -> np.array:
+        """Estimates the translation between the template and the detected points by phase correlation of masks
+        containing a disk for each point.
+
+        Args:
+            points (np.array): coordinates of the detected spots.
+
+        Returns:
+            np.array: translation in x and y.
+        """
+        scale = self.settings["coarse_detection"]["scale"]
+        # Masks are zero padded to twice the image size to prevent the circular cross correlation from wrapping around.
+        shape = 2 * np.ceil(np.array(self.image.shape[:2]) * scale).astype(int)
+        radius = max(1, self.template.spot_radius * scale)
+
+        def point_mask(coords):
+            mask = np.zeros(shape)
+            for x, y in coords * scale:
+                rr, cc = disk((y, x), radius, shape=shape)
+                mask[rr, cc] = 1
+            return mask
+
+        shift, _, _ = phase_cross_correlation(
+            point_mask(points), point_mask(self.template.points), normalization=None
+        )
+        return shift[::-1] / scale
+
+    def estimate_similarity(self, points: np.array, translation: np.array):
+        """Refines the initial translation to a similarity transform by iteratively matching detected points to the
+        closest template points.
+
+        Args:
+            points (np.array): coordinates of the detected spots.
+            translation (np.array): initial translation in x and y.
+
+        Returns:
+            tuple[SimilarityTransform, float]: estimated transform and the fraction of matched points.
+        """
+        inlier_distance = self.settings["registration"]["inlier_distance_px"]
+        template_points = self.template.points
+
+        # Points are matched to their closest template point if it is closer than half the grid pitch, matches are
+        # therefore unambiguous even if the initial translation is off by a few pixels.
+        template_distances, _ = cKDTree(template_points).query(template_points, k=2)
+        matching_distance = max(
+            inlier_distance, np.median(template_distances[:, 1]) / 2
+        )
+
+        transform = SimilarityTransform(translation=translation)
+        matched = np.zeros(len(points), dtype=bool)
+        for _ in range(self.settings["registration"]["maximum_iterations"]):
+            distances, indices = cKDTree(transform(template_points)).query(points)
+            new_matched = distances <= matching_distance
+
+            if new_matched.sum() < 3:
+                break
+
+            transform.estimate(
+                template_points[indices[new_matched]], points[new_matched]
+            )
+
+            if np.array_equal(new_matched, matched):
+                break
+            matched = new_matched
+
+        distances, _ = cKDTree(transform(template_points)).query(points)
+        confidence = np.sum(distances <= inlier_distance) / min(
+            len(points), len(template_points)
+        )
+        return transform, confidence
+
+    @profiled()
+    def register(self, spot_nr: int):
+        """Performs the entire registration workflow.
+
+        Args:
+            spot_nr (int): Number of Spots to be detected in the image
+
+        Returns:
+            tuple[Grid, float]: template grid registered to the image and the confidence of the registration between 0 and 1.
+        """
+        self.coarse_detection(spot_nr)
+        points = np.array([(spot.x, spot.y) for spot in self.spot_list], dtype=float)
+
+        if len(points) < 3:
+            self.confidence = 0.0
+            return None, self.confidence
+
+        translation = self.estimate_translation(points)
+        self.transform, self.confidence = self.estimate_similarity(points, translation)
+
+        grid = self.template.transform_grid(
+            scale=self.transform.scale,
+            rotation=self.transform.rotation,
+            translation=self.transform.translation,
+        )
+        return grid, self.confidence
+
+    @property
+    def is_confident(self) -> bool:
+        """True if the confidence of the last registration reached the minimum confidence in self.settings."""
+        return self.confidence >= self.settings["registration"]["minimum_confidence"]
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+
+import src.microspotreader.grid_classes.Grid as Grid
+import src.microspotreader.grid_classes.GridLine as GridLine
+import src.microspotreader.grid_classes.GridPoint as GridPoint
+
+
+class GridTemplate:
+    """Layout template of a detected grid, used to skip full spot- and grid-detection for repeated plate layouts."""
+
+    def __init__(self, grid: Grid.Grid, spot_radius: float, image_shape: tuple) -> None:
+        """
+        Args:
+            grid (Grid): Grid detected in the reference image.
+            spot_radius (float): median spot radius in the reference image in pixels.
+            image_shape (tuple): shape of the reference image.
+        """
+        self.grid = grid
+        self.spot_radius = spot_radius
+        self.image_shape = tuple(image_shape)
+
+    @property
+    def points(self) -> np.array:
+        """Coordinates of all grid intersections as an array of shape (n, 2) with columns x and y."""
+        return np.array([(point.x, point.y) for point in self.grid.intersections])
+
+    def transform_grid(self, scale: float, rotation: float, translation: np.array):
+        """Applies a similarity transform to the template grid.
+
+        Args:
+            scale (float): scaling factor
+            rotation (float): rotation in radians
+            translation (np.array): translation in x and y
+
+        Returns:
+            Grid: transformed grid.
+        """
+
+        def transform_line(line: GridLine.GridLine):
+            # A line in normal form keeps its shape under a similarity transform: the normal vector is rotated and the
+            # distance to the origin is scaled and shifted by the translation along the new normal.
+            angle = line.angle + rotation
+            normal = np.array((np.cos(angle), np.sin(angle)))
+            return GridLine.GridLine(
+                distance=scale * line.distance + normal @ translation, angle=angle
+            )
+
+        rotation_matrix = np.array(
+            [
+                [np.cos(rotation), -np.sin(rotation)],
+                [np.sin(rotation), np.cos(rotation)],
+            ]
+        )
+        points = scale * self.points @ rotation_matrix.T + translation
+
+        return Grid.Grid(
+            horizontal_lines=[transform_line(l) for l in self.grid.horizontal_lines],
+            vertical_lines=[transform_line(l) for l in self.grid.vertical_lines],
+            intersections=[GridPoint.GridPoint(x, y) for x, y in points],
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "horizontal_lines": [
+                [line.distance, line.angle] for line in self.grid.horizontal_lines
+            ],
+            "vertical_lines": [
+                [line.distance, line.angle] for line in self.grid.vertical_lines
+            ],
+            "intersections": self.points.tolist(),
+            "spot_radius": self.spot_radius,
+            "image_shape": list(self.image_shape),
+        }
+
+    @classmethod
+    def from_dict(cls, template: dict) -> GridTemplate:
+        grid = Grid.Grid(
+            horizontal_lines=[
+                GridLine.GridLine(d, a) for d, a in template["horizontal_lines"]
+            ],
+            vertical_lines=[
+                GridLine.GridLine(d, a) for d, a in template["vertical_lines"]
+            ],
+            intersections=[
+                GridPoint.GridPoint(x, y) for x, y in template["intersections"]
+            ],
+        )
+        return cls(grid, template["spot_radius"], template["image_shape"])
+
+    def save(self, filepath: str):
+        """Saves the template as a .json file.
+
+        Args:
+            filepath (str): path of the file to save the template to.
+        """
+        with open(filepath, "w") as file:
+            json.dump(self.to_dict(), file, default=float)
+
+    @classmethod
+    def load(cls, filepath: str) -> GridTemplate:
+        """Loads a template from a .json file created by the save method.
+
+        Args:
+            filepath (str): path of the template file.
+
+        Returns:
+            GridTemplate: loaded template
+        """
+        with open(filepath, "r") as file:
+            return cls.from_dict(json.load(file))
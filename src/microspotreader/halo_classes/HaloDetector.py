@@ -1,8 +1,8 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
 import numpy as np
 from skimage.filters import threshold_otsu
 from skimage.morphology import (
@@ -16,44 +16,43 @@ from skimage.morphology import (
 from skimage.transform import hough_circle, hough_circle_peaks
 
 import src.microspotreader.halo_classes.Halo as Halo
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
 
 if TYPE_CHECKING:
     import src.microspotreader.spot_classes.SpotList as SpotList
 
 
 class HaloDetector:
-    settings: dict = {
-        "preprocessing": {
-            "disk_radius_opening": 5,
-            "minimum_object_size_px": 800,
-            "disk_radius_dilation": 10,
-        },
-        "circle_detection": {
-            "min_distance_px_x": 70,
-            "min_distance_px_y": 70,
-            "smallest_radius_px": 40,
-            "largest_radius_px": 100,
-            "detection_threshold": 0.2,
-        },
-        "halo_assignment": {"distance_threshold_px": 15},
-    }
+    settings: Settings = Settings(
+        {
+            "preprocessing": {
+                "disk_radius_opening": 5,
+                "minimum_object_size_px": 800,
+                "disk_radius_dilation": 10,
+            },
+            "circle_detection": {
+                "min_distance_px_x": 70,
+                "min_distance_px_y": 70,
+                "smallest_radius_px": 40,
+                "largest_radius_px": 100,
+                "detection_threshold": 0.2,
+            },
+            "halo_assignment": {"distance_threshold_px": 15},
+        }
+    )
 
     def __init__(self, image: np.array) -> None:
         self.image = image
         self.halo_list = None
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
 
     def filter_regional_maxima(self):
         """Creates an image with removed background via morphological reconstruction. As desribed @: https://scikit-image.org/docs/stable/auto_examples/color_exposure/plot_regional_maxima.html#sphx-glr-auto-examples-color-exposure-plot-regional-maxima-py
@@ -120,6 +119,7 @@ class HaloDetector:
 
         return [Halo.Halo(x, y, rad) for x, y, rad in zip(cx, cy, radii)]
 
+    @profiled()
     def perform_halo_detection(self):
         """Performs the entire halo detection pipeline using the settings in self.settinfs
 
@@ -135,6 +135,7 @@ class HaloDetector:
         )
 
         self.halo_list = self.detect_halos(skeletonized_image=skeletonized_img)
+        profiler.add_metadata(halos=len(self.halo_list))
         return self.halo_list
 
     def assign_halos_to_spots(self, spot_list: SpotList.SpotList):
@@ -152,6 +153,8 @@ class HaloDetector:
                     spot.halo_radius = halo.radius
 
     def plot_halo_locations(self, ax=None):
+        import matplotlib.pyplot as plt
+
         if ax is None:
             fig, ax = plt.subplots()
 
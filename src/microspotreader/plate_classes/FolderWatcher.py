@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import src.microspotreader.grid_classes.GridTemplate as GridTemplate
+import src.microspotreader.plate_classes.PlatePart as PlatePart
+import src.microspotreader.plate_classes.PlateResultStore as PlateResultStore
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.ImageAnalyzer import ImageAnalyzer
+from src.microspotreader.plate_classes.PlateAnalyzer import analyze_part
+from src.microspotreader.Settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class FolderWatcher:
+    """Watches a folder for new images, analyzes them on a bounded pool of workers and adds the results to a persistent
+    per-plate result store.
+
+    The plate and spot indices of an image are read from its filename, e.g. "plate7_part2_a12-l22.tif" belongs to the
+    plate "plate7" and contains the spots A12 to L22. If the filename does not contain a plate name, the name of the
+    subfolder the image is in is used.
+    """
+
+    settings: Settings = Settings(
+        {
+            "watching": {
+                "poll_interval_s": 5.0,
+                "settle_time_s": 10.0,
+                "file_extensions": [".tif", ".tiff", ".png", ".jpg"],
+                "filename_pattern": r"(?:(?P<plate>.+?)_)??(?:part\d+_)?(?P<first_spot>[a-z]\d+)-(?P<last_spot>[a-z]\d+)",
+            },
+            "processing": {
+                "max_workers": 2,
+                "max_queued_images": 8,
+                "invert_image": False,
+            },
+            "image_analyzer": ImageAnalyzer.settings,
+        }
+    )
+
+    def __init__(
+        self,
+        input_folder: str,
+        output_folder: str,
+        grid_template: GridTemplate.GridTemplate = None,
+        checkpoint_store: CheckpointStore = None,
+    ) -> None:
+        """
+        Args:
+            input_folder (str): folder the scanner writes images to.
+            output_folder (str): folder of the persistent result store.
+            grid_template (GridTemplate, optional): template of the plate layout, registered to each image to skip full spot- and grid-detection. Defaults to None.
+            checkpoint_store (CheckpointStore, optional): store for intermediate results, so that images interrupted by a crash or restart resume from their last finished stage. Defaults to None.
+        """
+        self.input_folder = Path(input_folder)
+        self.result_store = PlateResultStore.PlateResultStore(output_folder)
+        self.grid_template = grid_template
+        self.checkpoint_store = checkpoint_store
+
+        # Size and modification time of files that are not yet ready for processing and the time of their last change.
+        self._pending: dict[Path, tuple[tuple, float]] = {}
+        self._in_progress: set[Path] = set()
+        self._lock = threading.Lock()
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    def image_key(self, path: Path) -> str:
+        return path.relative_to(self.input_folder).as_posix()
+
+    @staticmethod
+    def signature(path: Path) -> tuple:
+        stat = path.stat()
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def parse_filename(self, path: Path) -> tuple[str, PlatePart.PlatePart]:
+        """Creates a PlatePart from the filename of an image.
+
+        Args:
+            path (Path): path to the image
+
+        Returns:
+            tuple[str, PlatePart]: name of the plate and the part of the plate, (None, None) if the filename does not match the pattern.
+        """
+        match = re.fullmatch(
+            self.settings["watching"]["filename_pattern"], path.stem, re.IGNORECASE
+        )
+        if match is None:
+            return None, None
+
+        plate = match.group("plate")
+        if plate is None:
+            relative_folder = path.parent.relative_to(self.input_folder)
+            plate = relative_folder.name if relative_folder.parts else "plate"
+
+        part = PlatePart.PlatePart(
+            image_path=str(path),
+            first_spot=match.group("first_spot").upper(),
+            last_spot=match.group("last_spot").upper(),
+            invert_image=self.settings["processing"]["invert_image"],
+        )
+        return plate, part
+
+    def find_ready_images(self, now: float = None) -> list[Path]:
+        """Scans the input folder and returns all new images whose size and modification time did not change for the
+        settle time, partially written files are therefore not processed.
+
+        Args:
+            now (float, optional): current time as returned by time.monotonic. Defaults to None.
+
+        Returns:
+            list[Path]: images ready for processing.
+        """
+        now = time.monotonic() if now is None else now
+        extensions = [
+            ext.lower() for ext in self.settings["watching"]["file_extensions"]
+        ]
+
+        ready = []
+        for path in sorted(self.input_folder.rglob("*")):
+            if path.suffix.lower() not in extensions or not path.is_file():
+                continue
+
+            with self._lock:
+                if path in self._in_progress:
+                    continue
+
+            try:
+                signature = self.signature(path)
+            except FileNotFoundError:
+                continue
+
+            if self.result_store.is_processed(self.image_key(path), signature):
+                self._pending.pop(path, None)
+                continue
+
+            previous = self._pending.get(path)
+            if previous is None or previous[0] != signature:
+                self._pending[path] = (signature, now)
+            elif now - previous[1] >= self.settings["watching"]["settle_time_s"]:
+                ready.append(path)
+
+        # Forget files that were deleted before they were processed.
+        for path in [path for path in self._pending if not path.exists()]:
+            del self._pending[path]
+
+        return ready
+
+    def process_image(self, path: Path, signature: tuple):
+        """Analyzes a single image and adds the result to the result store.
+
+        Args:
+            path (Path): path to the image
+            signature (tuple): size and modification time of the image when it was found to be ready.
+        """
+        image_key = self.image_key(path)
+
+        try:
+            plate, part = self.parse_filename(path)
+            if part is None:
+                raise ValueError(
+                    "Filename does not match the pattern, cannot determine spot indices."
+                )
+
+            spot_list = analyze_part(
+                part,
+                self.settings["image_analyzer"],
+                self.grid_template,
+                self.checkpoint_store,
+            )
+            self.result_store.add_result(image_key, signature, plate, spot_list)
+            logger.info(f"Processed {image_key} (plate {plate}).")
+
+        except Exception as error:
+            self.result_store.add_error(image_key, signature, repr(error))
+            logger.error(f"Could not process {image_key}: {error!r}")
+
+        finally:
+            with self._lock:
+                self._in_progress.discard(path)
+
+    def run(self, stop_event: threading.Event = None, max_cycles: int = None):
+        """Watches the input folder until the stop event is set or the maximum number of polling cycles is reached.
+
+        Args:
+            stop_event (threading.Event, optional): event to stop watching. Defaults to None.
+            max_cycles (int, optional): maximum number of polling cycles, if None watch indefinitely. Defaults to None.
+        """
+        stop_event = threading.Event() if stop_event is None else stop_event
+        queue_slots = threading.BoundedSemaphore(
+            self.settings["processing"]["max_queued_images"]
+        )
+
+        def process(path: Path, signature: tuple):
+            try:
+                self.process_image(path, signature)
+            finally:
+                queue_slots.release()
+
+        cycle = 0
+        with ThreadPoolExecutor(
+            max_workers=self.settings["processing"]["max_workers"]
+        ) as executor:
+            while not stop_event.is_set():
+                for path in self.find_ready_images():
+                    # Images that do not fit into the queue are picked up again in the next cycle.
+                    if not queue_slots.acquire(blocking=False):
+                        break
+
+                    with self._lock:
+                        self._in_progress.add(path)
+                    executor.submit(process, path, self._pending.pop(path)[0])
+
+                cycle += 1
+                if max_cycles is not None and cycle >= max_cycles:
+                    break
+
+                stop_event.wait(self.settings["watching"]["poll_interval_s"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch a folder for new images and analyze them as they arrive."
+    )
+    parser.add_argument("input_folder", help="Folder the scanner writes images to.")
+    parser.add_argument("output_folder", help="Folder to store the results in.")
+    parser.add_argument(
+        "--settings", help=".json file with settings of the FolderWatcher."
+    )
+    parser.add_argument("--template", help=".json file of a grid template.")
+    parser.add_argument(
+        "--checkpoint-dir",
+        help="Folder to store intermediate results in, allows resuming after a crash.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    grid_template = None
+    if args.template is not None:
+        grid_template = GridTemplate.GridTemplate.load(args.template)
+
+    checkpoint_store = None
+    if args.checkpoint_dir is not None:
+        checkpoint_store = CheckpointStore(args.checkpoint_dir)
+
+    watcher = FolderWatcher(
+        args.input_folder, args.output_folder, grid_template, checkpoint_store
+    )
+    if args.settings is not None:
+        with open(args.settings, "r") as file:
+            watcher.change_settings_dict(json.load(file))
+
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
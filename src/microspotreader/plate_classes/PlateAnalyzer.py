@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import src.microspotreader.grid_classes.GridTemplate as GridTemplate
+import src.microspotreader.plate_classes.PlatePart as PlatePart
+import src.microspotreader.spot_classes.SpotList as SpotList
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.ImageAnalyzer import ImageAnalyzer
+from src.microspotreader.ImageLoader import ImageLoader
+from src.microspotreader.Settings import Settings
+
+
+def analyze_part(
+    part: PlatePart.PlatePart,
+    settings: Settings,
+    grid_template: GridTemplate.GridTemplate = None,
+    checkpoint_store: CheckpointStore = None,
+) -> SpotList.SpotList:
+    """Loads and analyzes a single image of a plate. Defined on module level so it can be sent to worker processes.
+
+    Args:
+        part (PlatePart): image of the plate to analyze
+        settings (Settings): settings of the ImageAnalyzer, the settings of the part are applied on top of them.
+        grid_template (GridTemplate, optional): template of the plate layout to register to the image. Defaults to None.
+        checkpoint_store (CheckpointStore, optional): store for intermediate results, stages with unchanged inputs are skipped. Defaults to None.
+
+    Returns:
+        SpotList: corrected and indexed list of spots of the image.
+    """
+    img_loader = ImageLoader()
+    img_loader.set(invert_image=part.invert_image)
+    image = img_loader.prepare_image(part.image_path, checkpoint_store)
+
+    analyzer = ImageAnalyzer(image, grid_template, checkpoint_store)
+    analyzer.change_settings_dict(settings)
+    analyzer.change_settings_dict(part.settings)
+
+    return analyzer.run(
+        spot_nr=part.spot_nr,
+        row_idx_start=part.first_row_index,
+        col_idx_start=part.first_column_index,
+    )
+
+
+class PlateAnalyzer:
+    """Analyzes all images of a plate that spans multiple images concurrently and merges the results."""
+
+    settings: Settings = ImageAnalyzer.settings
+
+    def __init__(
+        self,
+        parts: list[PlatePart.PlatePart],
+        max_workers: int = None,
+        use_processes: bool = False,
+        grid_template: GridTemplate.GridTemplate = None,
+        checkpoint_store: CheckpointStore = None,
+    ) -> None:
+        """
+        Args:
+            parts (list[PlatePart]): all images of the plate with the indices of their first and last spot.
+            max_workers (int, optional): maximum number of images analyzed at the same time, if None one worker per image is used. Defaults to None.
+            use_processes (bool, optional): use a pool of worker processes instead of threads. Defaults to False.
+            grid_template (GridTemplate, optional): template of the plate layout, registered to each image to skip full spot- and grid-detection. Defaults to None.
+            checkpoint_store (CheckpointStore, optional): store for intermediate results, stages with unchanged inputs are skipped. Defaults to None.
+        """
+        self.parts = parts
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.grid_template = grid_template
+        self.checkpoint_store = checkpoint_store
+
+        self.part_results: list[SpotList.SpotList] = None
+        self.spot_list: SpotList.SpotList = None
+
+    def get_settings(self):
+        return self.settings.to_dict()
+
+    def change_settings_dict(self, settings: dict):
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
+
+        self.settings = self.settings.updated(settings)
+
+    def analyze_parts(self) -> list[SpotList.SpotList]:
+        """Analyzes all parts of the plate on a pool of workers.
+
+        Returns:
+            list[SpotList]: list of spotlists in the same order as the parts.
+        """
+        assert len(self.parts) > 0, "No parts of the plate were given."
+
+        executor_class = (
+            ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        )
+        max_workers = self.max_workers or len(self.parts)
+
+        with executor_class(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    analyze_part,
+                    part,
+                    self.settings,
+                    self.grid_template,
+                    self.checkpoint_store,
+                )
+                for part in self.parts
+            ]
+            self.part_results = [future.result() for future in futures]
+
+        return self.part_results
+
+    def run(self, serpentine: bool = False) -> SpotList.SpotList:
+        """Analyzes all parts of the plate concurrently and merges them into a single sorted spotlist.
+
+        Args:
+            serpentine (bool, optional): sort the merged list in a serpentine manner. Defaults to False.
+
+        Returns:
+            SpotList: merged and sorted spotlist of the entire plate.
+        """
+        self.analyze_parts()
+
+        self.spot_list = SpotList.SpotList().from_list(self.part_results)
+        self.spot_list.sort(serpentine=serpentine)
+
+        return self.spot_list
@@ -0,0 +1,32 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PlatePart:
+    """Class to represent one image of a plate that spans multiple images.
+
+    The indices of the first and last spot are given in the format used by the app, e.g. "A1" and "L11".
+    """
+
+    image_path: str
+    first_spot: str
+    last_spot: str
+    invert_image: bool = False
+    settings: dict = field(default_factory=lambda: dict())
+
+    @property
+    def first_row_index(self):
+        """Numerical row index of the first spot in the image."""
+        return ord(self.first_spot[0].lower()) - ord("a") + 1
+
+    @property
+    def first_column_index(self):
+        """Numerical column index of the first spot in the image."""
+        return int(self.first_spot[1:])
+
+    @property
+    def spot_nr(self):
+        """Number of spots expected in the image."""
+        row_nr = ord(self.last_spot[0].lower()) - ord(self.first_spot[0].lower()) + 1
+        column_nr = int(self.last_spot[1:]) - int(self.first_spot[1:]) + 1
+        return row_nr * column_nr
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import src.microspotreader.spot_classes.SpotList as SpotList
+
+
+class PlateResultStore:
+    """Persistent store for the results of incrementally processed plates.
+
+    Each plate gets its own folder containing one spotlist per analyzed image and a merged spotlist of all images of
+    the plate, which is updated every time a new image is added. A manifest keeps track of all processed images, so
+    that processing can be resumed after a restart.
+    """
+
+    manifest_name = "processed_images.json"
+
+    def __init__(self, output_folder: str) -> None:
+        self.output_folder = Path(output_folder)
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.manifest: dict = self.load_manifest()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.output_folder / self.manifest_name
+
+    @staticmethod
+    def write_atomic(path: Path, write_function):
+        """Writes a file by writing to a temporary file first and replacing the target, so that readers never see a
+        partially written file."""
+        temp_path = path.with_name(path.name + ".tmp")
+        write_function(temp_path)
+        os.replace(temp_path, path)
+
+    def load_manifest(self) -> dict:
+        if not self.manifest_path.exists():
+            return {}
+
+        with open(self.manifest_path, "r") as file:
+            return json.load(file)
+
+    def save_manifest(self):
+        def write(path):
+            with open(path, "w") as file:
+                json.dump(self.manifest, file, indent=2)
+
+        self.write_atomic(self.manifest_path, write)
+
+    def is_processed(self, image_key: str, signature: list) -> bool:
+        """Checks if an image was already processed in its current state.
+
+        Args:
+            image_key (str): identifier of the image, usually its path relative to the watched folder.
+            signature (list): size and modification time of the image.
+
+        Returns:
+            bool: True if the image was processed before and has not changed since.
+        """
+        with self._lock:
+            entry = self.manifest.get(image_key)
+        return entry is not None and entry["signature"] == list(signature)
+
+    def plate_folder(self, plate: str) -> Path:
+        folder = self.output_folder / plate
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder
+
+    def merged_path(self, plate: str) -> Path:
+        return self.plate_folder(plate) / f"{plate}_spotlist.csv"
+
+    def part_path(self, plate: str, image_key: str) -> Path:
+        """Path of the spotlist of an image. Images with the same name in different subfolders are distinguished by a
+        hash of their key."""
+        key_hash = hashlib.sha256(image_key.encode()).hexdigest()[:12]
+        return (
+            self.plate_folder(plate) / f"{Path(image_key).stem}_{key_hash}_spotlist.csv"
+        )
+
+    def add_result(
+        self,
+        image_key: str,
+        signature: list,
+        plate: str,
+        spot_list: SpotList.SpotList,
+    ):
+        """Saves the spotlist of an image and updates the merged spotlist of its plate.
+
+        Args:
+            image_key (str): identifier of the image, usually its path relative to the watched folder.
+            signature (list): size and modification time of the image.
+            plate (str): name of the plate the image belongs to.
+            spot_list (SpotList): result of the image analysis.
+        """
+        part_path = self.part_path(plate, image_key)
+        self.write_atomic(part_path, lambda path: spot_list.to_df().to_csv(path))
+
+        with self._lock:
+            self.manifest[image_key] = {
+                "signature": list(signature),
+                "plate": plate,
+                "result": str(part_path.relative_to(self.output_folder)),
+            }
+            self.update_merged_result(plate)
+            self.save_manifest()
+
+    def add_error(self, image_key: str, signature: list, error: str):
+        """Records an image that could not be processed, it is only processed again if the file changes."""
+        with self._lock:
+            self.manifest[image_key] = {
+                "signature": list(signature),
+                "plate": None,
+                "error": error,
+            }
+            self.save_manifest()
+
+    def update_merged_result(self, plate: str) -> SpotList.SpotList:
+        """Merges the spotlists of all processed images of a plate and saves the result.
+
+        Args:
+            plate (str): name of the plate
+
+        Returns:
+            SpotList: merged spotlist sorted by index.
+        """
+        datasets = [
+            SpotList.SpotList().from_df(
+                pd.read_csv(self.output_folder / entry["result"], index_col=0)
+            )
+            for entry in self.manifest.values()
+            if entry.get("plate") == plate and "result" in entry
+        ]
+        spot_list = SpotList.SpotList().from_list(datasets)
+        spot_list.sort(serpentine=False)
+
+        self.write_atomic(
+            self.merged_path(plate), lambda path: spot_list.to_df().to_csv(path)
+        )
+        return spot_list
+
+    def get_plate_result(self, plate: str) -> pd.DataFrame:
+        """Returns the merged spotlist of a plate as a DataFrame."""
+        return pd.read_csv(self.merged_path(plate), index_col=0)
@@ -1,35 +1,35 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from typing import TYPE_CHECKING
 
 import src.microspotreader.spot_classes.Spot as Spot
 import src.microspotreader.spot_classes.SpotList as SpotList
+from src.microspotreader.Profiler import profiled
+from src.microspotreader.Settings import Settings
 
 if TYPE_CHECKING:
     import src.microspotreader.grid_classes.Grid as Grid
 
 
 class SpotCorrector:
-    settings = {
-        "general": {"spot_radius_backfill": 0},
-        "from_grid": {"distance_threshold_px": 10},
-    }
+    settings: Settings = Settings(
+        {
+            "general": {"spot_radius_backfill": 0},
+            "from_grid": {"distance_threshold_px": 10},
+        }
+    )
 
     def __init__(self, spot_list: SpotList.SpotList) -> None:
         self.spot_list = spot_list
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
 
     def remove_false_positives_from_grid(
         self, grid: Grid.Grid, distance_threshold_px: float
@@ -87,6 +87,7 @@ class SpotCorrector:
                 )
         return spot_list
 
+    @profiled()
     def gridbased_spotcorrection(self, grid: Grid.Grid):
         """Performs the whole spot-correction workflow based on a detected Grid in place.
 
@@ -1,3 +1,5 @@
+from collections.abc import Mapping
+
 import numpy as np
 from skimage.feature import canny
 from skimage.filters.rank import equalize
@@ -7,23 +9,27 @@ from skimage.util import img_as_ubyte
 
 import src.microspotreader.spot_classes.Spot as Spot
 import src.microspotreader.spot_classes.SpotList as SpotList
+from src.microspotreader.Profiler import profiled, profiler
+from src.microspotreader.Settings import Settings
 
 
 class SpotDetector:
-    settings: dict = {
-        "edge_detection": {
-            "sigma": 10,
-            "low_threshold": 0.001,
-            "high_threshold": 0.001,
-        },
-        "circle_detection": {
-            "min_distance_px_x": 70,
-            "min_distance_px_y": 70,
-            "smallest_radius_px": 20,
-            "largest_radius_px": 30,
-            "detection_threshold": 0.3,
-        },
-    }
+    settings: Settings = Settings(
+        {
+            "edge_detection": {
+                "sigma": 10,
+                "low_threshold": 0.001,
+                "high_threshold": 0.001,
+            },
+            "circle_detection": {
+                "min_distance_px_x": 70,
+                "min_distance_px_y": 70,
+                "smallest_radius_px": 20,
+                "largest_radius_px": 30,
+                "detection_threshold": 0.3,
+            },
+        }
+    )
 
     edge_img = None
     tested_radii = None
@@ -34,24 +40,21 @@ class SpotDetector:
         self.image: np.array = image
 
     def get_settings(self):
-        return self.settings.copy()
+        return self.settings.to_dict()
 
     def change_settings_dict(self, settings: dict):
-        assert type(settings) is dict, "Use a dictionary to change settings."
+        assert isinstance(settings, Mapping), "Use a dictionary to change settings."
 
-        for key, value in settings.items():
-            if type(value) is dict:
-                for k, v in value.items():
-                    self.settings[key][k] = v
-            else:
-                self.settings[key] = value
+        self.settings = self.settings.updated(settings)
 
+    @profiled()
     def get_image_edges(self):
         """Perform canny edge detection using the values from 'edge_detection' in self.settings.
 
         Returns:
             array: Boolean image with True for pixels containing an edge and False for pixels not containing an edge.
         """
+        profiler.add_metadata(image_shape=self.image.shape)
         histeq_img = equalize(img_as_ubyte(self.image), disk(50))
         self.edge_img = canny(
             image=histeq_img,
@@ -62,6 +65,7 @@ class SpotDetector:
 
         return self.edge_img
 
+    @profiled()
     def get_hough_transform(self):
         """Perform a circle hough transform on result from canny edge detection using the radii from 'circle_detection' in self.settings.
 
@@ -81,9 +85,15 @@ class SpotDetector:
         self.hough_transform = hough_circle(
             image=self.edge_img, radius=self.tested_radii
         )
+        profiler.add_metadata(
+            tested_radii=len(self.tested_radii),
+            accumulator_shape=self.hough_transform.shape,
+            accumulator_bytes=self.hough_transform.nbytes,
+        )
 
         return self.hough_transform
 
+    @profiled()
     def detect_spots(self, spot_nr: int):
         """Performs initial spot detection after hough transform.
 
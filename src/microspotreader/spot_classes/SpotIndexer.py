@@ -5,6 +5,7 @@ from typing import TYPE_CHECKING
 import numpy as np
 
 import src.microspotreader.spot_classes.SpotList as SpotList
+from src.microspotreader.Profiler import profiled
 
 if TYPE_CHECKING:
     import src.microspotreader.spot_classes.Spot as Spot
@@ -45,6 +46,7 @@ class SpotIndexer:
             )
         )
 
+    @profiled()
     def assign_indexes(
         self,
         row_idx_start: int = 1,
@@ -1,14 +1,11 @@
 from collections.abc import MutableSequence
 from copy import copy, deepcopy
 
-import matplotlib.patheffects as pe
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from matplotlib.patches import Patch
 
 import src.microspotreader.spot_classes.Spot as Spot
+from src.microspotreader.Profiler import profiled
 
 
 class SpotList(MutableSequence):
@@ -153,6 +150,7 @@ class SpotList(MutableSequence):
         else:
             self._list.sort(reverse=reverse, key=lambda x: x.row * 1000 + x.col)
 
+    @profiled()
     def get_spot_intensities(self, image: np.array, radius: int = 0):
         """Extracts intensity values for each spot in the list using the specified radius.
 
@@ -250,6 +248,10 @@ class SpotList(MutableSequence):
         return self
 
     def plot_image(self, image: np.array, ax=None):
+        import matplotlib.patheffects as pe
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Patch
+
         if ax is None:
             fig, ax = plt.subplots()
 
@@ -317,6 +319,9 @@ class SpotList(MutableSequence):
         )
 
     def plot_heatmap(self, ax=None):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         if ax is None:
             fig, ax = plt.subplots()
 
@@ -336,6 +341,9 @@ class SpotList(MutableSequence):
         ax.tick_params(axis="y", labelrotation=0)
 
     def plot_scatter(self, ax=None):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         if ax is None:
             fig, ax = plt.subplots()
 
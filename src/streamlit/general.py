@@ -1,7 +1,28 @@
+import json
+from contextlib import contextmanager
+
+import pandas as pd
+
 import streamlit as st
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.Profiler import Profiler, profiler
 from src.streamlit.DataStorage import DataStorage
 
 
+@st.cache_resource
+def get_checkpoint_store():
+    # One checkpoint store shared by all sessions, unchanged stages are loaded instead of recomputed.
+    return CheckpointStore()
+
+
+@st.cache_resource
+def warm_up_annotation():
+    # Loads the compiled annotation kernels once per server process, instead of on the first annotation of a session.
+    from src.microspotreader import ActivityAnnotator
+
+    ActivityAnnotator.warm_up()
+
+
 def initialize_session_states():
     session_states = {
         "sidebar": {"data_storage": DataStorage()},
@@ -60,6 +81,11 @@ def initialize_session_states():
             "disable_start": True,
         },
         "data_preparation": {"df": None},
+        "performance": {
+            "image_analysis": None,
+            "data_preparation": None,
+            "feature_finding": None,
+        },
         "feature_finding": {
             "settings": {
                 "feature_finder": {
@@ -81,6 +107,20 @@ def initialize_session_states():
                             b"H-2O-1:0:0.2",
                         ]
                     },
+                    "retention_time_filter": {"windows_s": []},
+                    "post_processing": {"deferred": False},
+                    "mzml_loading": {"ms_levels": [1, 2], "on_disk": False},
+                    "partitioning": {
+                        "partitions": 1,
+                        "overlap_s": 60.0,
+                        "workers": 4,
+                    },
+                    "targeted_extraction": {
+                        "mz_list": [],
+                        "mass_error_ppm": 10.0,
+                        "boundary_fraction": 0.05,
+                    },
+                    "result_cache": {"size": 4},
                 },
                 "activity_detector": {
                     "peak_detection": {
@@ -90,7 +130,10 @@ def initialize_session_states():
                         "minimum_SNR": 3,
                     }
                 },
-                "activity_annotator": {"rt_correlation": {"window_s": 2, "bias_s": 0}},
+                "activity_annotator": {
+                    "rt_correlation": {"window_s": 2, "bias_s": 0},
+                    "shape_correlation": {"mode": "pairwise", "grid_step_s": 0.0},
+                },
             },
             "results": None,
         },
@@ -120,3 +163,77 @@ def page_setup():
     )
     # Initializes all required session states
     initialize_session_states()
+
+
+@contextmanager
+def profile_run(page: str):
+    # Records duration and memory of all stages run in the enclosed code for the performance panel of the page.
+    with profiler.record() as spans, profiler.span(page):
+        yield
+    st.session_state["performance"][page] = spans
+
+
+def performance_panel(page: str):
+    # Displays the stage durations, memory, cache hits and data sizes of the last run on the page.
+    spans = st.session_state["performance"][page]
+
+    with st.expander("⏱️ Performance of the last run", expanded=False):
+        if not spans:
+            st.caption("No run was recorded yet.")
+            return
+
+        top_level = [span for span in spans if span["depth"] == 0]
+        peaks = [
+            span["peak_alloc_bytes"]
+            for span in top_level
+            if span["peak_alloc_bytes"] is not None
+        ]
+        cache_hits = [
+            span["metadata"]["cache_hit"]
+            for span in spans
+            if "cache_hit" in span["metadata"]
+        ]
+
+        c1, c2, c3 = st.columns(3)
+        c1.metric(
+            "Total Duration", f"{sum(span['wall_time_s'] for span in top_level):.2f} s"
+        )
+        # Peaks of stages overlapping with stages of other threads, e.g. other sessions, are not measured.
+        c2.metric(
+            "Peak Memory", f"{max(peaks) / 1e6:.1f} MB" if peaks else "not measured"
+        )
+        c3.metric(
+            "Cache Hits / Misses", f"{sum(cache_hits)} / {cache_hits.count(False)}"
+        )
+
+        summary = Profiler.summarize(spans)
+        summary["peak_alloc_MB"] = summary.pop("peak_alloc_bytes") / 1e6
+        st.caption("Stages:")
+        st.dataframe(summary, use_container_width=True)
+
+        sizes = pd.DataFrame(
+            [
+                {"Stage": span["name"], "Property": key, "Value": str(value)}
+                for span in spans
+                for key, value in span["metadata"].items()
+                if key != "cache_hit"
+            ],
+            columns=["Stage", "Property", "Value"],
+        )
+        if len(sizes) > 0:
+            st.caption("Data Sizes:")
+            st.dataframe(sizes, use_container_width=True, hide_index=True)
+
+        c1, c2 = st.columns(2)
+        c1.download_button(
+            "Download Spans (.json)",
+            profiler.to_json(spans=spans),
+            file_name=f"{page}_spans.json",
+            use_container_width=True,
+        )
+        c2.download_button(
+            "Download Chrome Trace (.json)",
+            json.dumps(profiler.to_chrome_trace(spans=spans), default=str),
+            file_name=f"{page}_trace.json",
+            use_container_width=True,
+        )
@@ -1,13 +1,19 @@
+from __future__ import annotations
+
 import io
 import os
 import tempfile
 import zipfile
+from typing import TYPE_CHECKING
 
 import matplotlib.pyplot as plt
-import pyopenms as oms
 
 import streamlit as st
-from src.microspotreader import *
+from src.microspotreader import ImageLoader, SpotList
+from src.streamlit.general import get_checkpoint_store
+
+if TYPE_CHECKING:
+    import pyopenms as oms
 
 
 def set_analysis_false():
@@ -26,7 +32,9 @@ def display_loaded_image():
 def load_image(path, invert):
     img_loader = ImageLoader()
     img_loader.set(invert_image=invert)
-    st.session_state["image_analysis"]["image"] = img_loader.prepare_image(path)
+    st.session_state["image_analysis"]["image"] = img_loader.prepare_image(
+        path, get_checkpoint_store()
+    )
     st.toast("Image prepared Successfully!")
 
 
@@ -115,6 +123,8 @@ def update_spotlist(df_new):
 def download_gnpsmgf(
     consensus_map: oms.ConsensusMap, mzmlfilename: str, exp: oms.MSExperiment
 ):
+    import pyopenms as oms
+
     filtered_map = oms.ConsensusMap(consensus_map)
     filtered_map.clear(False)
     for feature in consensus_map:
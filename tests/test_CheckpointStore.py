@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+from src.microspotreader.CheckpointStore import CheckpointStore
+from src.microspotreader.Settings import Settings
+
+
+def test_make_key_is_stable(tmp_path):
+    store = CheckpointStore(tmp_path / "a")
+    other_store = CheckpointStore(tmp_path / "b")
+    settings = Settings({"threshold": 0.5, "sizes": [1, 2]})
+    image = np.arange(12, dtype=np.float64).reshape(3, 4)
+
+    key = store.make_key("stage", CheckpointStore, image, settings)
+    assert key == store.make_key("stage", CheckpointStore, image.copy(), settings)
+    assert key == other_store.make_key(
+        "stage", CheckpointStore, image, {"sizes": [1, 2], "threshold": 0.5}
+    )
+    assert key != store.make_key("other_stage", CheckpointStore, image, settings)
+    assert key != store.make_key(
+        "stage", CheckpointStore, image, settings.updated({"threshold": 0.6})
+    )
+    assert key != store.make_key(
+        "stage", CheckpointStore, image.astype(np.float32), settings
+    )
+
+
+def test_cached_counts_hits_and_misses(tmp_path):
+    store = CheckpointStore(tmp_path)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"value": 42}
+
+    key = store.make_key("stage", CheckpointStore, 1)
+    assert store.cached(key, compute) == {"value": 42}
+    assert store.cached(key, compute) == {"value": 42}
+    assert store.load(store.make_key("stage", CheckpointStore, 2)) == (False, None)
+
+    assert len(calls) == 1
+    assert store.get_statistics() == {"hits": 1, "misses": 2}
+
+
+def test_evict_deletes_least_recently_used_results(tmp_path):
+    store = CheckpointStore(tmp_path)
+    value = b"x" * 10_000
+    for index, key in enumerate(["aa", "bb", "cc"]):
+        store.save(key, value)
+        os.utime(store.path(key), (1000 * (index + 1), 1000 * (index + 1)))
+
+    # Loading a result marks it as recently used.
+    assert store.load("aa") == (True, value)
+
+    store.max_size_bytes = 3.5 * store.path("aa").stat().st_size
+    store.save("dd", value)
+
+    assert not store.path("bb").exists()
+    assert all(store.path(key).exists() for key in ["aa", "cc", "dd"])
+
+
+def test_load_tolerates_concurrent_eviction(tmp_path, monkeypatch):
+    store = CheckpointStore(tmp_path)
+    store.save("aa", [1, 2, 3])
+
+    # Another process evicts the result after it was read.
+    def utime(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", utime)
+    assert store.load("aa") == (True, [1, 2, 3])
@@ -0,0 +1,78 @@
+import threading
+
+from src.microspotreader.Profiler import Profiler
+
+
+def test_overlapping_recordings_in_threads():
+    profiler = Profiler()
+    a_recording = threading.Event()
+    b_recording = threading.Event()
+    a_finished = threading.Event()
+    results = {}
+
+    def record_a():
+        # The recording of thread a enables the profiler and ends first.
+        with profiler.record(trace_memory=False) as spans:
+            a_recording.set()
+            with profiler.span("A1"):
+                pass
+            b_recording.wait()
+        results["a"] = [span["name"] for span in spans]
+        a_finished.set()
+
+    def record_b():
+        a_recording.wait()
+        with profiler.record(trace_memory=False) as spans:
+            with profiler.span("B1"):
+                pass
+            b_recording.set()
+            a_finished.wait()
+            with profiler.span("B2"):
+                pass
+        results["b"] = [span["name"] for span in spans]
+
+    threads = [threading.Thread(target=record_a), threading.Thread(target=record_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": ["A1"], "b": ["B1", "B2"]}
+    assert not profiler.enabled
+
+
+def test_spans_overlapping_with_other_threads_have_no_peak_allocation():
+    profiler = Profiler()
+    profiler.enable(trace_memory=True)
+    a_started = threading.Event()
+    b_finished = threading.Event()
+
+    def span_a():
+        with profiler.span("A"):
+            a_started.set()
+            b_finished.wait()
+
+    def span_b():
+        a_started.wait()
+        with profiler.span("B"):
+            allocation = bytearray(10**6)
+            del allocation
+        b_finished.set()
+
+    threads = [threading.Thread(target=span_a), threading.Thread(target=span_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with profiler.span("C"):
+        allocation = bytearray(10**6)
+        del allocation
+    profiler.disable()
+
+    spans = {span["name"]: span for span in profiler.get_spans()}
+    for name in ["A", "B"]:
+        assert spans[name]["peak_alloc_bytes"] is None
+        assert spans[name]["metadata"]["concurrent_threads"]
+    assert spans["C"]["peak_alloc_bytes"] >= 10**6
+    assert "concurrent_threads" not in spans["C"]["metadata"]